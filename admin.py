@@ -1,6 +1,8 @@
 # -*- coding: UTF-8 -*-
+from django.conf import settings
 from django.contrib import admin
 from models import *
+from forms import XfnForm
 
 class geoAdmin(admin.ModelAdmin):
     """ Django admin class for geo microformat """
@@ -49,10 +51,25 @@ class hEntryAdmin(admin.ModelAdmin):
     """ Django admin class for hEntry microformat """
     list_display = ('entry_title', 'author', 'updated', 'entry_summary')
     list_display_links = ('entry_title',)
-    list_filter = ('author', 'updated')
+    # The canonical authors are listed from their own (small) table rather
+    # than by finding the distinct authors of every entry
+    list_filter = ('canonical_author', 'updated')
     save_on_top = True
     search_fields = ('entry_title', 'entry_content', 'entry_summary', 'author')
 
+if getattr(settings, 'ENTRY_ARCHIVE_DATE_HIERARCHY', False):
+    # Drill down by date with the years and months read from the archive
+    # counts (see archives.py)
+    hEntryAdmin.date_hierarchy = 'updated'
+    hEntryAdmin.change_list_template =\
+            'admin/microformats/hentry/archive_change_list.html'
+
+class entryAuthorAdmin(admin.ModelAdmin):
+    """ The canonical hEntry authors """
+    list_display = ('name', 'entry_count', 'hcard')
+    raw_id_fields = ('hcard',)
+    search_fields = ('name',)
+
 class hNewsAdmin(admin.ModelAdmin):
     """ Django admin class for hEntry microformat """
     list_display = ('entry_title', 'source_org', 'updated', 'dateline', 'entry_summary')
@@ -61,6 +78,11 @@ class hNewsAdmin(admin.ModelAdmin):
     save_on_top = True
     search_fields = ('entry_title', 'entry_content', 'entry_summary', 'author', 'source_org')
 
+class xfnAdmin(admin.ModelAdmin):
+    """ Django admin class for XFN links """
+    # Links the rel="me" identities once the relationships are saved
+    form = XfnForm
+
 admin.site.register(geo, geoAdmin)
 admin.site.register(hCard, hCardAdmin)
 admin.site.register(hCalendar, hCalendarAdmin)
@@ -68,6 +90,7 @@ admin.site.register(hListing, hListingAdmin)
 admin.site.register(hReview, hReviewAdmin)
 admin.site.register(hEntry, hEntryAdmin)
 admin.site.register(hNews, hNewsAdmin)
+admin.site.register(entry_author, entryAuthorAdmin)
 admin.site.register(adr_type)
 admin.site.register(adr)
 admin.site.register(tel_type)
@@ -84,5 +107,5 @@ admin.site.register(note)
 admin.site.register(key)
 admin.site.register(mailer)
 admin.site.register(xfn_values)
-admin.site.register(xfn)
+admin.site.register(xfn, xfnAdmin)
 admin.site.register(hFeed)
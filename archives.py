@@ -0,0 +1,163 @@
+# -*- coding: UTF-8 -*-
+"""
+Keeps the number of entries per (feed, year, month) of hEntry.updated in the
+entry_archive table so archive lists ("March 2009 (42)") and the admin date
+drill-down don't have to GROUP BY over every entry.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from microformats.models import hFeed, hEntry, hNews, entry_archive
+from microformats.utils import chunked_queryset, CHUNK_SIZE
+
+# hNews is saved with signals of its own (but deleting one deletes its hEntry
+# too, sending hEntry's post_delete)
+ENTRY_MODELS = (hEntry, hNews)
+
+def _month(hfeed_id, updated):
+    # The (feed, year, month) an entry is counted under
+    if updated is None:
+        return None
+    return (hfeed_id, updated.year, updated.month)
+
+def _rows(month):
+    hfeed_id, year, month = month
+    rows = entry_archive.objects.filter(year=year, month=month)
+    if hfeed_id is None:
+        return rows.filter(hfeed__isnull=True)
+    return rows.filter(hfeed=hfeed_id)
+
+def add_entry(month, delta=1):
+    """
+    Adds delta (which may be negative) to the count of the (feed, year,
+    month). Months nothing is counted under any more are removed.
+    """
+    rows = _rows(month)
+    if delta < 0:
+        rows.update(count=F('count') + delta)
+        rows.filter(count__lte=0).delete()
+    elif not rows.update(count=F('count') + delta):
+        sid = transaction.savepoint()
+        try:
+            entry_archive.objects.create(hfeed_id=month[0], year=month[1],
+                    month=month[2], count=delta)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            # Somebody else created the row in the meantime
+            transaction.savepoint_rollback(sid)
+            rows.update(count=F('count') + delta)
+
+def remember_old_month(sender, instance, **kwargs):
+    """
+    pre_save signal handler: makes a note of the month the entry used to be
+    counted under.
+    """
+    instance._old_month = None
+    if instance.pk:
+        old = hEntry.objects.filter(pk=instance.pk).values_list('hfeed',
+                'updated')
+        if old:
+            instance._old_month = _month(*old[0])
+
+def update_archive(sender, instance, created=False, **kwargs):
+    """
+    post_save signal handler.
+    """
+    old = not created and getattr(instance, '_old_month', None) or None
+    new = _month(instance.hfeed_id, instance.updated)
+    if old != new:
+        if old:
+            add_entry(old, -1)
+        if new:
+            add_entry(new, 1)
+
+def remove_from_archive(sender, instance, **kwargs):
+    """
+    post_delete signal handler.
+    """
+    month = _month(instance.hfeed_id, instance.updated)
+    if month:
+        add_entry(month, -1)
+
+for model in ENTRY_MODELS:
+    pre_save.connect(remember_old_month, sender=model)
+    post_save.connect(update_archive, sender=model)
+post_delete.connect(remove_from_archive, sender=hEntry)
+
+def rebuild_archives(chunk_size=CHUNK_SIZE):
+    """
+    Recomputes every archive count from the entries, reading them in chunks.
+    Returns the number of (feed, year, month) rows.
+    """
+    counts = {}
+    for chunk in chunked_queryset(hEntry.objects.only('hfeed', 'updated'),
+            chunk_size):
+        for entry in chunk:
+            month = _month(entry.hfeed_id, entry.updated)
+            if month:
+                counts[month] = counts.get(month, 0) + 1
+    entry_archive.objects.all().delete()
+    for (hfeed_id, year, month), count in counts.iteritems():
+        entry_archive.objects.create(hfeed_id=hfeed_id, year=year,
+                month=month, count=count)
+    return len(counts)
+rebuild_archives = transaction.commit_on_success(rebuild_archives)
+
+def archive_months(feeds=None, year=None):
+    """
+    Returns a list of (year, month, count) tuples, newest first, for the
+    entries of the feeds (hFeed instances or pks - a single one will do) or
+    of every entry. Optionally only for the referenced year.
+    """
+    rows = entry_archive.objects.all()
+    if feeds is not None:
+        if isinstance(feeds, (hFeed, int, long)):
+            feeds = [feeds]
+        rows = rows.filter(hfeed__in=[getattr(f, 'pk', f) for f in feeds])
+    if year:
+        rows = rows.filter(year=year)
+    rows = rows.values('year', 'month').annotate(total=Sum('count')).order_by(
+            '-year', '-month')
+    return [(row['year'], row['month'], row['total']) for row in rows if
+            row['total']]
+
+def archive_years(feeds=None):
+    """
+    Returns a sorted list of the years with entries.
+    """
+    return sorted(set([year for year, month, count in
+        archive_months(feeds)]))
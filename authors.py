@@ -0,0 +1,182 @@
+# -*- coding: UTF-8 -*-
+"""
+Normalises the free text hEntry author into the entry_author table: every
+entry points at its canonical author and each author keeps a count of their
+entries, so author pages and the admin's author filter never have to scan
+the entries.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Count
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from microformats.models import hEntry, hNews, entry_author
+from microformats.utils import chunked_queryset, CHUNK_SIZE
+
+# hNews is saved with signals of its own (but deleting one deletes its hEntry
+# too, sending hEntry's post_delete)
+ENTRY_MODELS = (hEntry, hNews)
+
+# The number of values in a single IN clause (kept under SQLite's limit on
+# the number of parameters in a query)
+BATCH_SIZE = 500
+
+NOT_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+def normalise_author(name):
+    """
+    Returns the key authors are matched on: the name in lower case with
+    punctuation removed and the spacing collapsed
+    """
+    return u' '.join(NOT_WORD.sub(u' ', name or u'').lower().split())
+
+def author_for(name):
+    """
+    Returns the entry_author for the name (adding it if needed) or None if
+    the name is empty.
+    """
+    key = normalise_author(name)
+    if not key:
+        return None
+    try:
+        return entry_author.objects.get(key=key)
+    except entry_author.DoesNotExist:
+        sid = transaction.savepoint()
+        try:
+            author = entry_author.objects.create(key=key,
+                    name=u' '.join(name.split()))
+            transaction.savepoint_commit(sid)
+            return author
+        except IntegrityError:
+            # Somebody else added it in the meantime
+            transaction.savepoint_rollback(sid)
+            return entry_author.objects.get(key=key)
+
+def _count(pk, delta):
+    if pk:
+        entry_author.objects.filter(pk=pk).update(
+                entry_count=F('entry_count') + delta)
+
+def set_canonical_author(sender, instance, **kwargs):
+    """
+    pre_save signal handler: points the entry at its canonical author,
+    remembering the one it had when it was read.
+    """
+    old = instance.canonical_author_id
+    author = author_for(instance.author)
+    instance.canonical_author = author
+    instance._author_change = (old, author and author.pk)
+
+def update_author_counts(sender, instance, created=False, **kwargs):
+    """
+    post_save signal handler.
+    """
+    old, new = getattr(instance, '_author_change', (None, None))
+    if created:
+        old = None
+    if old != new:
+        _count(old, -1)
+        _count(new, 1)
+
+def remove_from_author_counts(sender, instance, **kwargs):
+    """
+    post_delete signal handler.
+    """
+    _count(instance.canonical_author_id, -1)
+
+for model in ENTRY_MODELS:
+    pre_save.connect(set_canonical_author, sender=model)
+    post_save.connect(update_author_counts, sender=model)
+post_delete.connect(remove_from_author_counts, sender=hEntry)
+
+def recount_authors():
+    """
+    Recomputes the entry counts of every author from the entries.
+    """
+    counts = {}
+    for row in hEntry.objects.filter(canonical_author__isnull=False).values(
+            'canonical_author').annotate(count=Count('id')):
+        counts.setdefault(row['count'], []).append(row['canonical_author'])
+    entry_author.objects.update(entry_count=0)
+    # One update per distinct count rather than one per author
+    for count, pks in counts.iteritems():
+        for i in xrange(0, len(pks), BATCH_SIZE):
+            entry_author.objects.filter(pk__in=pks[i:i + BATCH_SIZE]).update(
+                    entry_count=count)
+
+def backfill_authors(chunk_size=CHUNK_SIZE):
+    """
+    Points every entry at its canonical author (reading the entries in
+    chunks) then recounts the authors. Returns the number of entries.
+    """
+    authors = {}
+    count = 0
+    queryset = hEntry.objects.only('author', 'canonical_author')
+    for chunk in chunked_queryset(queryset, chunk_size):
+        changed = {}
+        for entry in chunk:
+            key = normalise_author(entry.author)
+            if key not in authors:
+                author = author_for(entry.author)
+                authors[key] = author and author.pk
+            if entry.canonical_author_id != authors[key]:
+                changed.setdefault(authors[key], []).append(entry.pk)
+        for pk, pks in changed.iteritems():
+            hEntry.objects.filter(pk__in=pks).update(canonical_author=pk)
+        count += len(chunk)
+    recount_authors()
+    return count
+backfill_authors = transaction.commit_on_success(backfill_authors)
+
+def entries_by(author):
+    """
+    Returns the entries of an author (an entry_author or a name), newest
+    first. Answered by the (canonical_author_id, updated) index.
+    """
+    if not isinstance(author, entry_author):
+        try:
+            author = entry_author.objects.get(key=normalise_author(author))
+        except entry_author.DoesNotExist:
+            return hEntry.objects.none()
+    return hEntry.objects.filter(canonical_author=author).order_by('-updated')
+
+def top_authors(count=10):
+    """
+    Returns the count authors with the most entries.
+    """
+    return entry_author.objects.filter(entry_count__gt=0).order_by(
+            '-entry_count', 'name')[:count]
@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of LocationAwareMicroformat.adr() with the precomputed country name
+index versus Django's get_country_name_display().
+
+Run from within a project that has the microformats application installed:
+
+    DJANGO_SETTINGS_MODULE=mysite.settings python -m microformats.benchmarks.bench_adr [rows]
+
+The instances are built in memory (as if they'd just been fetched from the
+database) so no database is needed.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+import time
+
+from django.utils import translation
+
+from microformats.models import hCard, COUNTRY_LIST
+
+ROWS = 100000
+
+def legacy_adr(instance):
+    """
+    adr() as it was before the country name index was added.
+    """
+    result = u', '.join((x for x in (
+        instance.street_address,
+        instance.extended_address,
+        instance.locality,
+        instance.region,
+        instance.country_name and instance.get_country_name_display() or\
+                instance.country_name,
+        instance.postal_code,
+        instance.post_office_box,
+        ) if x and x.strip()))
+    return result or None
+
+def make_rows(count):
+    codes = [c for c, name in COUNTRY_LIST if c]
+    return [hCard(street_address=u'%d High Street' % i, locality=u'Townsville',
+        region=u'Countyshire', postal_code=u'CS23 6YT',
+        country_name=codes[i % len(codes)]) for i in xrange(count)]
+
+def timed(label, func, rows):
+    start = time.time()
+    for row in rows:
+        func(row)
+    elapsed = time.time() - start
+    print '%-32s %8.3fs %10.2fus/row' % (label, elapsed,
+            elapsed * 1000000 / len(rows))
+    return elapsed
+
+def main(count=ROWS):
+    translation.activate('en')
+    rows = make_rows(count)
+    print 'adr() over %d rows' % count
+    before = timed('get_country_name_display()', legacy_adr, rows)
+    after = timed('country name index', hCard.adr, rows)
+    print 'Speed up: %.1fx' % (before / after)
+
+if __name__ == '__main__':
+    main(len(sys.argv) > 1 and int(sys.argv[1]) or ROWS)
@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of the sweep-line free/busy engine versus comparing every pair of
+a person's events.
+
+Run from within a project that has the microformats application installed:
+
+    DJANGO_SETTINGS_MODULE=mysite.settings python -m microformats.benchmarks.bench_freebusy [events] [people]
+
+The rows the database would return (ordered by person and start time) are
+generated in memory so no database is needed.
+
+Author: Nicholas H.Tollervey
+
+"""
+import datetime
+import random
+import sys
+import time
+
+from microformats.freebusy import sweep, event_interval, merge_intervals
+
+EVENTS = 100000
+PEOPLE = 50000
+# How many people are linked to each event
+ATTENDEES = 4
+
+START = datetime.datetime(2009, 1, 1)
+END = START + datetime.timedelta(days=365)
+
+def make_rows(events, people):
+    random.seed(events + people)
+    rows = []
+    for event_pk in xrange(events):
+        dtstart = START + datetime.timedelta(minutes=15 * random.randint(0,
+            365 * 24 * 4 - 1))
+        dtend = dtstart + datetime.timedelta(minutes=30 * random.randint(1, 8))
+        for hcard_pk in random.sample(xrange(people), ATTENDEES):
+            rows.append((hcard_pk, event_pk, dtstart, dtend, False, ''))
+    rows.sort(key=lambda row: (row[0], row[2]))
+    return rows
+
+def pairwise(rows, start, end):
+    """
+    Free/busy the obvious way: group the events by person then check every
+    pair of them for an overlap.
+    """
+    people = {}
+    for hcard_pk, event_pk, dtstart, dtend, all_day, tz in rows:
+        people.setdefault(hcard_pk, []).append((event_pk,) +
+                event_interval(dtstart, dtend, all_day, tz))
+    for hcard_pk, events in people.iteritems():
+        conflicts = []
+        for i, (pk, s, e) in enumerate(events):
+            for other_pk, other_s, other_e in events[i + 1:]:
+                if s < other_e and other_s < e:
+                    conflicts.append((pk, other_pk, max(s, other_s),
+                        min(e, other_e)))
+        merge_intervals([(s, e) for pk, s, e in events])
+
+def timed(label, func, rows):
+    start = time.time()
+    func(rows)
+    elapsed = time.time() - start
+    print '%-32s %8.3fs' % (label, elapsed)
+    return elapsed
+
+def main(events=EVENTS, people=PEOPLE):
+    rows = make_rows(events, people)
+    print 'free/busy for %d people over %d events (%d links)' % (people,
+            events, len(rows))
+    before = timed('pairwise', lambda rows: pairwise(rows, START, END), rows)
+    after = timed('sweep-line', lambda rows: list(sweep(rows, START, END)),
+            rows)
+    print 'Speed up: %.1fx' % (before / after)
+
+if __name__ == '__main__':
+    main(len(sys.argv) > 1 and int(sys.argv[1]) or EVENTS,
+            len(sys.argv) > 2 and int(sys.argv[2]) or PEOPLE)
@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of a "listings between £100 and £500, cheapest first" search done
+by parsing the free text price of every row versus a range scan of the parsed
+(indexed) price.
+
+Run from within a project that has the microformats application installed:
+
+    DJANGO_SETTINGS_MODULE=mysite.settings python -m microformats.benchmarks.bench_prices [rows]
+
+The prices are generated in memory and the index is simulated with a sorted
+list and bisect so no database is needed.
+
+Author: Nicholas H.Tollervey
+
+"""
+import random
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+
+from microformats.prices import parse_price
+
+ROWS = 1000000
+
+FORMATS = (u'£%d', u'£%d ono', u'%d GBP', u'€%d.50', u'$%d', u'£%d,000',
+        u'Offers over £%d')
+
+LOW = Decimal('100')
+HIGH = Decimal('500')
+
+def make_rows(count):
+    random.seed(count)
+    return [random.choice(FORMATS) % random.randint(1, 999) for i in
+            xrange(count)]
+
+def parse_every_row(rows):
+    """
+    What the search had to do before the price was parsed on save
+    """
+    result = []
+    for pk, text in enumerate(rows):
+        amount, currency = parse_price(text)
+        if currency == 'GBP' and amount is not None and LOW <= amount <= HIGH:
+            result.append((amount, pk))
+    result.sort()
+    return result
+
+def build_index(rows):
+    return sorted((currency, amount, pk) for pk, (amount, currency) in
+            enumerate([parse_price(text) for text in rows])
+            if amount is not None)
+
+def range_scan(index):
+    """
+    What the database does with the (price_currency, price_amount) index
+    """
+    start = bisect_left(index, ('GBP', LOW, -1))
+    end = bisect_right(index, ('GBP', HIGH, len(index)))
+    return [(amount, pk) for currency, amount, pk in index[start:end]]
+
+def main(count=ROWS):
+    rows = make_rows(count)
+    print 'price search over %d listings' % count
+    start = time.time()
+    before = parse_every_row(rows)
+    parse_time = time.time() - start
+    print '%-32s %8.3fs' % ('parse every row', parse_time)
+    start = time.time()
+    index = build_index(rows)
+    print '%-32s %8.3fs (once, on save / backfill)' % ('parse and index',
+            time.time() - start)
+    start = time.time()
+    after = range_scan(index)
+    scan_time = time.time() - start
+    print '%-32s %8.3fs' % ('index range scan', scan_time)
+    assert before == after
+    print 'Speed up per search: %.1fx' % (parse_time / max(scan_time, 1e-6))
+
+if __name__ == '__main__':
+    main(len(sys.argv) > 1 and int(sys.argv[1]) or ROWS)
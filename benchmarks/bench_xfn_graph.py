@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of friends-of-friends queries done with nested loops over the XFN
+rows versus the compressed sparse row snapshot of the graph.
+
+Run from within a project that has the microformats application installed:
+
+    DJANGO_SETTINGS_MODULE=mysite.settings python -m microformats.benchmarks.bench_xfn_graph [edges] [users]
+
+The (source, url, is me) rows the database would return are generated in
+memory so no database is needed.
+
+Author: Nicholas H.Tollervey
+
+"""
+import random
+import sys
+import time
+
+from microformats.graph import GraphSnapshot
+
+EDGES = 1000000
+USERS = 50000
+# The fraction of the linked to URLs that belong to somebody in the system
+OWNED = 0.5
+# How many users the nested loops are timed for (they're slow)
+NAIVE_QUERIES = 3
+SNAPSHOT_QUERIES = 1000
+
+def url(i):
+    return u'http://example.com/people/%d' % i
+
+def make_rows(edges, users):
+    random.seed(edges + users)
+    rows = [(pk, url(pk), 1) for pk in xrange(users)]
+    pool = int(users / OWNED)
+    while len(rows) < edges:
+        rows.append((random.randrange(users), url(random.randrange(pool)), 0))
+    return rows
+
+def nested_loops(rows, user):
+    """
+    Friends of friends the obvious way: for each of the user's links look
+    for its owners, then for each owner look for their links.
+    """
+    reached = {}
+    for source, key, me in rows:
+        if source != user or me:
+            continue
+        for owner, owned, owner_me in rows:
+            if not owner_me or owned != key or owner == user:
+                continue
+            for other, found, other_me in rows:
+                if other == owner and not other_me:
+                    reached.setdefault(found, set()).add(key)
+    return reached
+
+def main(edges=EDGES, users=USERS):
+    rows = make_rows(edges, users)
+    print 'friends of friends over %d users (%d edges)' % (users, len(rows))
+    start = time.time()
+    snapshot = GraphSnapshot(rows)
+    print '%-32s %8.3fs (once, then every REFRESH_INTERVAL)' % (
+            'build snapshot', time.time() - start)
+    sample = random.sample(xrange(users), SNAPSHOT_QUERIES)
+    start = time.time()
+    for user in sample[:NAIVE_QUERIES]:
+        nested_loops(rows, user)
+    before = (time.time() - start) / NAIVE_QUERIES
+    print '%-32s %8.3fs per query' % ('nested loops', before)
+    start = time.time()
+    for user in sample:
+        snapshot.friends_of_friends(user)
+    after = (time.time() - start) / SNAPSHOT_QUERIES
+    print '%-32s %8.3fs per query' % ('CSR snapshot', after)
+    start = time.time()
+    for user in sample:
+        snapshot.bfs(user, 3)
+    print '%-32s %8.3fs per query' % ('CSR snapshot, 3 hops',
+            (time.time() - start) / SNAPSHOT_QUERIES)
+    print 'Speed up: %.1fx' % (before / max(after, 1e-6))
+
+if __name__ == '__main__':
+    main(len(sys.argv) > 1 and int(sys.argv[1]) or EDGES,
+            len(sys.argv) > 2 and int(sys.argv[2]) or USERS)
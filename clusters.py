@@ -0,0 +1,374 @@
+# -*- coding: UTF-8 -*-
+"""
+Server-side marker clustering for the geo-tagged microformats.
+
+For every zoom level the world is divided into a Web Mercator grid (each map
+tile is split into CELLS_PER_TILE x CELLS_PER_TILE cells) and the geo_cluster
+table holds the count and the sums of the coordinates of the rows of each
+model in each cell. The aggregates are adjusted incrementally as rows are
+saved and deleted, so a map view only ever reads the handful of cells inside
+its bounding box.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import datetime
+import math
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q, Max
+from django.db.models.signals import post_init, pre_save, post_save,\
+        post_delete
+
+from microformats.models import geo_cluster, geo_cluster_zoom
+from microformats.spatial import LOCATED_MODELS
+from microformats.utils import chunked_queryset, model_name, CHUNK_SIZE
+
+# Clusters are maintained for zoom levels 0 to MAX_ZOOM
+MAX_ZOOM = 16
+CELLS_PER_TILE = 4
+# Web Mercator can't represent the poles
+MAX_LATITUDE = 85.05112878
+
+MODELS = dict((model_name(m), m) for m in LOCATED_MODELS)
+
+def grid_size(zoom):
+    """
+    The number of cells along each side of the grid at a zoom level.
+    """
+    return (2 ** zoom) * CELLS_PER_TILE
+
+def cell_for(lat, lng, zoom):
+    """
+    Returns the (x, y) of the cell holding the point at the zoom level.
+    """
+    n = grid_size(zoom)
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    x = int((lng + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) /
+        math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def cell_bounds(x, y, zoom):
+    """
+    Returns the (south, west, north, east) of a cell.
+    """
+    n = float(grid_size(zoom))
+    def lat(y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 -\
+            180.0
+
+###########################
+# Incremental maintenance
+###########################
+
+# The columns written when new cells are inserted
+INSERT_FIELDS = ('zoom', 'cell_x', 'cell_y', 'model', 'count', 'latitude_sum',
+        'longitude_sum', 'representative', 'updated')
+
+def _cells(lat, lng):
+    """
+    Returns the (zoom, x, y) of the cells holding the point at every zoom
+    level.
+    """
+    return [(zoom,) + cell_for(lat, lng, zoom) for zoom in
+            xrange(MAX_ZOOM + 1)]
+
+def _matching(name, cells):
+    """
+    Returns a queryset of the referenced cells of a model (a single
+    statement whatever the number of cells).
+    """
+    match = Q(zoom=cells[0][0], cell_x=cells[0][1], cell_y=cells[0][2])
+    for zoom, x, y in cells[1:]:
+        match |= Q(zoom=zoom, cell_x=x, cell_y=y)
+    return geo_cluster.objects.filter(match, model=name)
+
+def _adjust(cells, sign, lat, lng):
+    return cells.update(count=F('count') + sign,
+            latitude_sum=F('latitude_sum') + sign * lat,
+            longitude_sum=F('longitude_sum') + sign * lng,
+            updated=datetime.datetime.now())
+
+def _insert(name, pk, lat, lng, cells):
+    """
+    Creates cells holding just the point with one INSERT ... SELECT ...
+    UNION ALL statement (Django has no multi-row insert).
+    """
+    qn = connection.ops.quote_name
+    opts = geo_cluster._meta
+    now = connection.ops.value_to_db_datetime(datetime.datetime.now())
+    row = 'SELECT %s' % ', '.join(['%s'] * len(INSERT_FIELDS))
+    params = []
+    for zoom, x, y in cells:
+        params.extend([zoom, x, y, name, 1, lat, lng, pk, now])
+    connection.cursor().execute('INSERT INTO %s (%s) %s' % (
+        qn(opts.db_table), ', '.join([qn(opts.get_field(f).column) for f in
+            INSERT_FIELDS]), ' UNION ALL '.join([row] * len(cells))), params)
+    transaction.commit_unless_managed()
+
+def add_point(model, pk, lat, lng):
+    """
+    Adds a point to the clusters of every zoom level: one UPDATE for the
+    cells that already exist and, if some don't, a SELECT to find out which
+    and one INSERT for them.
+    """
+    name = model_name(model)
+    cells = _cells(lat, lng)
+    if _adjust(_matching(name, cells), 1, lat, lng) == len(cells):
+        return
+    existing = set(_matching(name, cells).values_list('zoom', flat=True))
+    missing = [cell for cell in cells if cell[0] not in existing]
+    sid = transaction.savepoint()
+    try:
+        _insert(name, pk, lat, lng, missing)
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # Somebody else created some of the cells in the meantime
+        transaction.savepoint_rollback(sid)
+        existing = set(_matching(name, missing).values_list('zoom',
+            flat=True))
+        _adjust(_matching(name, [cell for cell in missing if cell[0] in
+            existing]), 1, lat, lng)
+        missing = [cell for cell in missing if cell[0] not in existing]
+        if missing:
+            _insert(name, pk, lat, lng, missing)
+
+def _touch(zooms):
+    """
+    Records that the clusters of the zoom levels have changed in a way the
+    updated column can't show (cells were deleted).
+    """
+    now = datetime.datetime.now()
+    zooms = sorted(set(zooms))
+    if geo_cluster_zoom.objects.filter(zoom__in=zooms).update(
+            changed=now) == len(zooms):
+        return
+    existing = set(geo_cluster_zoom.objects.filter(zoom__in=zooms
+        ).values_list('zoom', flat=True))
+    for zoom in zooms:
+        if zoom in existing:
+            continue
+        sid = transaction.savepoint()
+        try:
+            geo_cluster_zoom.objects.create(zoom=zoom, changed=now)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            # Somebody else created it in the meantime
+            transaction.savepoint_rollback(sid)
+            geo_cluster_zoom.objects.filter(zoom=zoom).update(changed=now)
+
+def remove_point(model, pk, lat, lng):
+    """
+    Removes a point from the clusters of every zoom level: one UPDATE, the
+    deletion of emptied cells (noted in geo_cluster_zoom) and a look for
+    cells it represented (only those need any more work).
+    """
+    name = model_name(model)
+    cells = _matching(name, _cells(lat, lng))
+    _adjust(cells, -1, lat, lng)
+    emptied = cells.filter(count__lte=0)
+    zooms = list(emptied.values_list('zoom', flat=True))
+    if zooms:
+        emptied.delete()
+        _touch(zooms)
+    # Find a new representative if we've just removed the old one
+    for cell in cells.filter(representative=pk):
+        south, west, north, east = cell_bounds(cell.cell_x, cell.cell_y,
+                cell.zoom)
+        others = MODELS[name].objects.filter(latitude__gte=south,
+                latitude__lt=north, longitude__gte=west,
+                longitude__lt=east).exclude(pk=pk).values_list('pk',
+                        flat=True)[:1]
+        if others:
+            cell.representative = others[0]
+            cell.save()
+
+def _located(lat, lng):
+    return lat is not None and lng is not None
+
+def _position(instance):
+    if _located(instance.latitude, instance.longitude):
+        return (instance.latitude, instance.longitude)
+    return None
+
+def remember_loaded_position(sender, instance, **kwargs):
+    """
+    post_init signal handler: makes a note of where a row read from the
+    database is, so saving it doesn't have to ask. (Instances built by hand
+    with the pk of an existing row are taken to be where they say they are.)
+    """
+    if instance.pk is not None:
+        instance._cluster_position = _position(instance)
+
+def remember_old_position(sender, instance, **kwargs):
+    """
+    pre_save signal handler: finds out where the row used to be if we don't
+    already know (e.g. for instances loaded with only()).
+    """
+    if not instance.pk:
+        instance._cluster_position = None
+    elif not hasattr(instance, '_cluster_position'):
+        instance._cluster_position = None
+        old = sender.objects.filter(pk=instance.pk).values_list('latitude',
+                'longitude')
+        if old and _located(*old[0]):
+            instance._cluster_position = old[0]
+
+def update_clusters(sender, instance, **kwargs):
+    """
+    post_save signal handler: moves the row between clusters if needed.
+    """
+    old = getattr(instance, '_cluster_position', None)
+    new = _position(instance)
+    instance._cluster_position = new
+    if old == new:
+        return
+    if old:
+        remove_point(sender, instance.pk, old[0], old[1])
+    if new:
+        add_point(sender, instance.pk, new[0], new[1])
+
+def remove_from_clusters(sender, instance, **kwargs):
+    """
+    post_delete signal handler.
+    """
+    if _located(instance.latitude, instance.longitude):
+        remove_point(sender, instance.pk, instance.latitude,
+                instance.longitude)
+
+for model in LOCATED_MODELS:
+    post_init.connect(remember_loaded_position, sender=model)
+    pre_save.connect(remember_old_position, sender=model)
+    post_save.connect(update_clusters, sender=model)
+    post_delete.connect(remove_from_clusters, sender=model)
+
+##########
+# Queries
+##########
+
+def clusters(south, west, north, east, zoom, models=None):
+    """
+    Returns a list of the clusters inside the bounding box at the zoom level.
+    Each cluster is a dict with the keys: count, latitude, longitude (the
+    centroid), model and pk (of the representative row). If models (a list
+    of model classes or names) is given only those models are included.
+
+    Clusters of different models in the same cell are combined; model is
+    then the name of the model with the most rows in the cell.
+    """
+    zoom = max(0, min(int(zoom), MAX_ZOOM))
+    x1, y1 = cell_for(north, west, zoom)
+    x2, y2 = cell_for(south, east, zoom)
+    cells = geo_cluster.objects.filter(zoom=zoom, cell_y__gte=y1,
+            cell_y__lte=y2)
+    if x1 <= x2:
+        cells = cells.filter(cell_x__gte=x1, cell_x__lte=x2)
+    else:
+        # The box crosses the 180th meridian
+        cells = cells.exclude(cell_x__gt=x2, cell_x__lt=x1)
+    if models:
+        cells = cells.filter(model__in=[isinstance(m, basestring) and
+            m.lower() or model_name(m) for m in models])
+    combined = {}
+    for cell in cells.order_by('-count', 'model'):
+        key = (cell.cell_x, cell.cell_y)
+        total = combined.get(key)
+        if total is None:
+            combined[key] = [cell.count, cell.latitude_sum,
+                    cell.longitude_sum, cell.model, cell.representative]
+        else:
+            total[0] += cell.count
+            total[1] += cell.latitude_sum
+            total[2] += cell.longitude_sum
+    result = []
+    for key in sorted(combined):
+        count, lat_sum, lng_sum, name, pk = combined[key]
+        if count > 0:
+            result.append({'count': count, 'latitude': lat_sum / count,
+                'longitude': lng_sum / count, 'model': name, 'pk': pk})
+    return result
+
+def last_modified(zoom):
+    """
+    Returns when the clusters of a zoom level last changed (or None): the
+    latest of the updated times of its cells and of the last time one was
+    deleted.
+    """
+    times = [geo_cluster.objects.filter(zoom=zoom).aggregate(
+            Max('updated'))['updated__max']]
+    times.extend(geo_cluster_zoom.objects.filter(zoom=zoom).values_list(
+        'changed', flat=True))
+    times = [value for value in times if value is not None]
+    return times and max(times) or None
+
+def rebuild_clusters(models=LOCATED_MODELS, chunk_size=CHUNK_SIZE):
+    """
+    Throws away and recomputes the clusters for the referenced models (e.g.
+    after coordinates have been filled in with update()). Returns the number
+    of rows processed.
+    """
+    count = 0
+    for model in models:
+        name = model_name(model)
+        aggregates = [{} for zoom in xrange(MAX_ZOOM + 1)]
+        queryset = model.objects.filter(latitude__isnull=False,
+                longitude__isnull=False).only('latitude', 'longitude')
+        for chunk in chunked_queryset(queryset, chunk_size):
+            for instance in chunk:
+                lat, lng = instance.latitude, instance.longitude
+                for zoom in xrange(MAX_ZOOM + 1):
+                    key = cell_for(lat, lng, zoom)
+                    total = aggregates[zoom].get(key)
+                    if total is None:
+                        aggregates[zoom][key] = [1, lat, lng, instance.pk]
+                    else:
+                        total[0] += 1
+                        total[1] += lat
+                        total[2] += lng
+            count += len(chunk)
+        _write_clusters(name, aggregates)
+    return count
+
+def _write_clusters(name, aggregates):
+    geo_cluster.objects.filter(model=name).delete()
+    # Cells that aren't written again have gone
+    _touch(xrange(MAX_ZOOM + 1))
+    for zoom, cells in enumerate(aggregates):
+        for (x, y), (total, lat_sum, lng_sum, pk) in cells.iteritems():
+            geo_cluster.objects.create(zoom=zoom, cell_x=x, cell_y=y,
+                    model=name, count=total, latitude_sum=lat_sum,
+                    longitude_sum=lng_sum, representative=pk)
+_write_clusters = transaction.commit_on_success(_write_clusters)
@@ -0,0 +1,409 @@
+# -*- coding: UTF-8 -*-
+"""
+Duplicate contact detection for the hCard and hCardComplete models.
+
+Comparing every contact with every other contact is out of the question for
+large address books so we use "blocking": each contact is given a handful of
+cheap blocking keys (normalised email addresses, telephone digits and a
+phonetic version of the name combined with the locality) and contacts are only
+ever compared with other contacts that share at least one key. Pairs that score
+above a threshold on a weighted similarity measure are then joined into
+clusters of candidate duplicates.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import re
+from difflib import SequenceMatcher
+
+from django.db import connection, transaction
+
+from microformats.models import hCard, hCardComplete, hCalendar,\
+        participant, email, tel, adr
+from microformats.utils import chunked_pks, normalise_email, CHUNK_SIZE
+
+# Pairs scoring at least this much are considered to be duplicates
+DEFAULT_THRESHOLD = 0.6
+
+# Blocks bigger than this (e.g. everyone called "Smith" in "London") are
+# skipped - they'd cost a lot to compare and carry little information
+DEFAULT_MAX_BLOCK_SIZE = 500
+
+# How much each piece of evidence contributes to the similarity score
+WEIGHTS = {
+        'email': 0.4,
+        'tel': 0.3,
+        'name': 0.2,
+        'locality': 0.1,
+        }
+
+# Only the last few digits of a telephone number are used for matching so
+# "+44(0)1234 567876" and "01234 567876" end up in the same block
+PHONE_DIGITS = 9
+
+# The hCalendar relationships that point at an hCard
+HCARD_RELATIONS = ('attendees', 'contacts', 'organizers')
+
+MODELS = {
+        'hcard': hCard,
+        'hcardcomplete': hCardComplete,
+        }
+
+NON_DIGIT = re.compile(r'\D')
+
+#############################
+# Normalisation and blocking
+#############################
+
+def phone_digits(value):
+    """
+    Returns the trailing PHONE_DIGITS digits of a telephone number (ignoring
+    the "(0)" trunk prefix used in UK style international numbers).
+    """
+    if not value:
+        return u''
+    digits = NON_DIGIT.sub(u'', value.replace(u'(0)', u''))
+    return digits[-PHONE_DIGITS:]
+
+SOUNDEX_CODES = {}
+for letters, code in (('BFPV', '1'), ('CGJKQSXZ', '2'), ('DT', '3'),
+        ('L', '4'), ('MN', '5'), ('R', '6')):
+    for letter in letters:
+        SOUNDEX_CODES[letter] = code
+
+def soundex(name):
+    """
+    Returns the American Soundex code for the name (e.g. "Robert" -> "R163").
+    Returns an empty string if the name contains no letters.
+    """
+    letters = [c for c in name.upper() if 'A' <= c <= 'Z']
+    if not letters:
+        return u''
+    result = [letters[0]]
+    last = SOUNDEX_CODES.get(letters[0], '')
+    for c in letters[1:]:
+        code = SOUNDEX_CODES.get(c, '')
+        if code and code != last:
+            result.append(code)
+        if c not in 'HW':
+            last = code
+    return (u''.join(result) + u'000')[:4]
+
+class ContactRecord(object):
+    """
+    The bits of a contact needed for blocking and comparison. These are
+    deliberately light-weight (and picklable) so large numbers of them can be
+    held in memory and passed between processes.
+    """
+    __slots__ = ('pk', 'name', 'family_name', 'given_name', 'emails', 'tels',
+            'locality')
+
+    def __init__(self, pk, given_name, family_name, emails, tels, locality):
+        self.pk = pk
+        self.given_name = (given_name or u'').strip().lower()
+        self.family_name = (family_name or u'').strip().lower()
+        self.name = u' '.join(x for x in (self.given_name, self.family_name)
+                if x)
+        self.emails = frozenset(e for e in (normalise_email(x) for x in emails)
+                if e)
+        self.tels = frozenset(t for t in (phone_digits(x) for x in tels) if t)
+        self.locality = (locality or u'').strip().lower()
+
+    def __getstate__(self):
+        return tuple(getattr(self, x) for x in self.__slots__)
+
+    def __setstate__(self, state):
+        for attr, value in zip(self.__slots__, state):
+            setattr(self, attr, value)
+
+    def blocking_keys(self):
+        """
+        Returns the set of blocking keys for this contact.
+        """
+        keys = set(u'e:' + x for x in self.emails)
+        keys.update(u'p:' + x for x in self.tels)
+        if self.family_name and self.locality:
+            keys.add(u'n:%s%s:%s' % (soundex(self.family_name),
+                soundex(self.given_name), self.locality))
+        return keys
+
+def contact_records(model, pks):
+    """
+    Returns ContactRecords for the instances of model (either hCard or
+    hCardComplete) with the referenced primary keys.
+
+    For hCardComplete the related emails, telephone numbers and addresses are
+    fetched with one query each for the whole batch rather than one per
+    contact.
+    """
+    if model is hCard:
+        rows = hCard.objects.filter(pk__in=pks).values_list('pk',
+                'given_name', 'family_name', 'email_work', 'email_home',
+                'tel_work', 'tel_home', 'tel_fax', 'locality')
+        return [ContactRecord(r[0], r[1], r[2], r[3:5], r[5:8], r[8])
+                for r in rows]
+    emails = {}
+    for hcard_id, value in email.objects.filter(hcard__in=pks).values_list(
+            'hcard', 'value'):
+        emails.setdefault(hcard_id, []).append(value)
+    tels = {}
+    for hcard_id, value in tel.objects.filter(hcard__in=pks).values_list(
+            'hcard', 'value'):
+        tels.setdefault(hcard_id, []).append(value)
+    localities = {}
+    for hcard_id, value in adr.objects.filter(hcard__in=pks).exclude(
+            locality='').order_by('pk').values_list('hcard', 'locality'):
+        localities.setdefault(hcard_id, value)
+    rows = hCardComplete.objects.filter(pk__in=pks).values_list('pk',
+            'given_name', 'family_name')
+    return [ContactRecord(pk, given, family, emails.get(pk, ()),
+        tels.get(pk, ()), localities.get(pk, u''))
+        for pk, given, family in rows]
+
+##############
+# Comparison
+##############
+
+def similarity(a, b):
+    """
+    Returns a weighted similarity score between 0.0 and 1.0 for two
+    ContactRecords.
+    """
+    score = 0.0
+    if a.emails and a.emails & b.emails:
+        score += WEIGHTS['email']
+    if a.tels and a.tels & b.tels:
+        score += WEIGHTS['tel']
+    if a.name and b.name:
+        score += WEIGHTS['name'] * SequenceMatcher(None, a.name,
+                b.name).ratio()
+    if a.locality and a.locality == b.locality:
+        score += WEIGHTS['locality']
+    return score
+
+def compare_block(records, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares every pair of records in a block and returns a list of the
+    (pk, pk) pairs that reach the threshold.
+    """
+    pairs = []
+    for i, a in enumerate(records):
+        for b in records[i + 1:]:
+            if similarity(a, b) >= threshold:
+                pairs.append((a.pk, b.pk))
+    return pairs
+
+class UnionFind(object):
+    """
+    A minimal disjoint-set forest (with path halving) used to turn matching
+    pairs into clusters.
+    """
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Always keep the lowest pk as the root so results are stable
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+    def groups(self):
+        result = {}
+        for x in self.parent:
+            result.setdefault(self.find(x), []).append(x)
+        return result.values()
+
+##################
+# Driving the lot
+##################
+
+def _records_for_chunk(args):
+    """
+    Worker: returns the ContactRecords for a chunk of primary keys.
+    """
+    model_name, pks = args
+    return contact_records(MODELS[model_name], pks)
+
+def _compare_blocks(args):
+    """
+    Worker: compares a batch of blocks and returns the matching pairs.
+    """
+    blocks, threshold = args
+    pairs = []
+    for block in blocks:
+        pairs.extend(compare_block(block, threshold))
+    return pairs
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def find_duplicates(queryset, threshold=DEFAULT_THRESHOLD,
+        chunk_size=CHUNK_SIZE, processes=1,
+        max_block_size=DEFAULT_MAX_BLOCK_SIZE):
+    """
+    Returns a list of clusters of candidate duplicates found in the queryset
+    (which must be of hCard or hCardComplete instances). Each cluster is a
+    sorted list of primary keys with at least two members.
+
+    Rows are read in chunks of chunk_size. If processes is greater than one
+    both the record building and the comparison stages are spread over a
+    multiprocessing pool of that size.
+    """
+    model_name = queryset.model._meta.object_name.lower()
+    if model_name not in MODELS:
+        raise ValueError('Can only find duplicates of hCard or hCardComplete')
+    pool = None
+    if processes > 1:
+        import multiprocessing
+        # Each child must open its own database connection
+        connection.close()
+        pool = multiprocessing.Pool(processes)
+    try:
+        jobs = ((model_name, pks) for pks in chunked_pks(queryset, chunk_size))
+        if pool:
+            chunks = pool.imap_unordered(_records_for_chunk, jobs)
+        else:
+            chunks = (_records_for_chunk(job) for job in jobs)
+        blocks = {}
+        for records in chunks:
+            for record in records:
+                for key in record.blocking_keys():
+                    blocks.setdefault(key, []).append(record)
+        candidates = [b for b in blocks.itervalues()
+                if 1 < len(b) <= max_block_size]
+        del blocks
+        jobs = ((batch, threshold) for batch in _batches(candidates, 100))
+        if pool:
+            results = pool.imap_unordered(_compare_blocks, jobs)
+        else:
+            results = (_compare_blocks(job) for job in jobs)
+        clusters = UnionFind()
+        for pairs in results:
+            for a, b in pairs:
+                clusters.union(a, b)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return sorted(sorted(group) for group in clusters.groups()
+            if len(group) > 1)
+
+###########
+# Merging
+###########
+
+def merge_hcards(target, duplicates, delete=True):
+    """
+    Merges the duplicates (a list of hCard instances) into target.
+
+    Every hCalendar attendee, contact and organizer link to one of the
+    duplicates is re-pointed at target with a handful of bulk statements (links
+    that would result in target appearing twice in the same role on the same
+    event are dropped). Blank fields on target are filled in from the
+    duplicates and, unless delete is False, the duplicates are then deleted.
+    """
+    dupe_ids = [d.pk for d in duplicates if d.pk != target.pk]
+    if not dupe_ids:
+        return target
+    qn = connection.ops.quote_name
+    placeholders = u', '.join([u'%s'] * len(dupe_ids))
+    cursor = connection.cursor()
+    for name in HCARD_RELATIONS:
+        field = hCalendar._meta.get_field(name)
+        table = qn(field.m2m_db_table())
+        event_col = qn(field.m2m_column_name())
+        hcard_col = qn(field.m2m_reverse_name())
+        cursor.execute(u'SELECT %s FROM %s WHERE %s = %%s' % (event_col,
+            table, hcard_col), [target.pk])
+        existing = set(row[0] for row in cursor.fetchall())
+        cursor.execute(u'SELECT DISTINCT %s FROM %s WHERE %s IN (%s)' % (
+            event_col, table, hcard_col, placeholders), dupe_ids)
+        events = [row[0] for row in cursor.fetchall()
+                if row[0] not in existing]
+        cursor.execute(u'DELETE FROM %s WHERE %s IN (%s)' % (table, hcard_col,
+            placeholders), dupe_ids)
+        if events:
+            cursor.executemany(u'INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+                table, event_col, hcard_col),
+                [(event_id, target.pk) for event_id in events])
+    transaction.set_dirty()
+    # ...and the same for the copy of those links in the participant table
+    existing = set(participant.objects.filter(hcard=target).values_list(
+        'event', 'role'))
+    move = []
+    drop = []
+    for pk, event_id, role in participant.objects.filter(
+            hcard__in=dupe_ids).values_list('pk', 'event', 'role'):
+        if (event_id, role) in existing:
+            drop.append(pk)
+        else:
+            existing.add((event_id, role))
+            move.append(pk)
+    if drop:
+        participant.objects.filter(pk__in=drop).delete()
+    if move:
+        participant.objects.filter(pk__in=move).update(hcard=target)
+    changed = False
+    for field in target._meta.fields:
+        if field.primary_key or field.name == 'rev':
+            continue
+        if getattr(target, field.attname) in (None, u''):
+            for duplicate in duplicates:
+                value = getattr(duplicate, field.attname)
+                if value not in (None, u''):
+                    setattr(target, field.attname, value)
+                    changed = True
+                    break
+    if changed:
+        target.save()
+    if delete:
+        hCard.objects.filter(pk__in=dupe_ids).delete()
+    return target
+merge_hcards = transaction.commit_on_success(merge_hcards)
@@ -0,0 +1,154 @@
+# -*- coding: UTF-8 -*-
+"""
+A case-insensitive index of the email addresses stored by the microformat
+models.
+
+Email addresses live in hCard (email_work / email_home), email (for
+hCardComplete) and hListing (lister_email). Each one is lower cased and stored
+in the indexed email_address table whenever an instance is saved so
+lookup_emails() can find the owners of thousands of addresses in a few
+queries.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+from django.db.models.signals import post_save, post_delete
+
+from microformats.models import hCard, hCardComplete, email, hListing,\
+        email_address
+from microformats.utils import chunked_queryset, model_name,\
+        normalise_email, index_fields, CHUNK_SIZE
+
+# The models (and their fields) holding email addresses
+EMAIL_FIELDS = {
+        hCard: ('email_work', 'email_home'),
+        email: ('value',),
+        hListing: ('lister_email',),
+        }
+
+# The number of addresses looked up in a single query (kept under SQLite's
+# limit on the number of parameters in a query)
+LOOKUP_BATCH_SIZE = 500
+
+MODELS = dict((model_name(m), m) for m in EMAIL_FIELDS)
+
+def index_emails(instance, model=None):
+    """
+    Indexes the lower cased addresses of the instance in email_address. Pass
+    the model class if the instance was loaded with only() or defer().
+    """
+    model = model or instance.__class__
+    index_fields(email_address, 'address', instance, model,
+            EMAIL_FIELDS[model], normalise_email)
+
+def update_email_index(sender, instance, **kwargs):
+    """
+    post_save signal handler.
+    """
+    index_emails(instance)
+
+def remove_from_email_index(sender, instance, **kwargs):
+    """
+    post_delete signal handler.
+    """
+    email_address.objects.filter(model=model_name(sender),
+            object_id=instance.pk).delete()
+
+for model in EMAIL_FIELDS:
+    post_save.connect(update_email_index, sender=model)
+    post_delete.connect(remove_from_email_index, sender=model)
+
+def lookup_emails(addresses):
+    """
+    Returns a dict mapping each (lower cased) address in addresses to a list
+    of the instances that own it: hCard, hCardComplete (via its email rows)
+    or hListing. Addresses with no owner are left out.
+
+    Addresses are resolved LOOKUP_BATCH_SIZE at a time against the index and
+    the owners are then fetched with one query per model, so the number of
+    queries doesn't depend on the number of matches.
+    """
+    wanted = sorted(set(a for a in (normalise_email(x) for x in addresses)
+        if a))
+    rows = []
+    for i in xrange(0, len(wanted), LOOKUP_BATCH_SIZE):
+        rows.extend(email_address.objects.filter(
+            address__in=wanted[i:i + LOOKUP_BATCH_SIZE]).values_list(
+                'address', 'model', 'object_id'))
+    ids = {}
+    for address, name, object_id in rows:
+        ids.setdefault(name, set()).add(object_id)
+    # email rows belong to an hCardComplete
+    hcards = {}
+    email_ids = list(ids.pop('email', ()))
+    for i in xrange(0, len(email_ids), LOOKUP_BATCH_SIZE):
+        hcards.update(email.objects.filter(
+            pk__in=email_ids[i:i + LOOKUP_BATCH_SIZE]).values_list('pk',
+                'hcard'))
+    owners = {}
+    for name, pks in ids.iteritems():
+        owners[name] = MODELS[name].objects.in_bulk(list(pks))
+    owners['hcardcomplete'] = hCardComplete.objects.in_bulk(
+            list(set(hcards.values())))
+    result = {}
+    for address, name, object_id in sorted(rows):
+        if name == 'email':
+            name, object_id = 'hcardcomplete', hcards.get(object_id)
+        owner = owners[name].get(object_id)
+        if owner is not None:
+            found = result.setdefault(address, [])
+            if owner not in found:
+                found.append(owner)
+    return result
+
+def lookup_email(address):
+    """
+    Returns a list of the instances that own a single address.
+    """
+    return lookup_emails([address]).get(normalise_email(address), [])
+
+def rebuild_email_index(models=None, chunk_size=CHUNK_SIZE):
+    """
+    Throws away and rebuilds the index for the referenced models (all of
+    them by default), reading the rows in chunks. Returns the number of
+    instances processed.
+    """
+    count = 0
+    for model in models or EMAIL_FIELDS.keys():
+        email_address.objects.filter(model=model_name(model)).delete()
+        fields = EMAIL_FIELDS[model]
+        for chunk in chunked_queryset(model.objects.only(*fields), chunk_size):
+            for instance in chunk:
+                index_emails(instance, model)
+            count += len(chunk)
+    return count
@@ -41,9 +41,12 @@ from django.forms.util import ErrorList
 from django.utils.translation import ugettext as _
 
 # Microformats
-from microformats.models import geo, hCard, adr, adr_type, org, email,\
-        email_type, tel, tel_type, hCalendar, hReview, hListing, hFeed,\
-        hEntry, hNews
+from microformats.models import geo, hCard, adr, org, email, tel,\
+        hCalendar, hReview, hListing, hFeed, hEntry, hNews, xfn
+from microformats.identities import relationships_saved
+from microformats.utils import parse_datetime
+from microformats.vocabulary import adr_types, email_types, tel_types,\
+        VocabularyMultipleChoiceField
 
 class GeoForm(forms.ModelForm):
     """
@@ -171,6 +174,33 @@ class hCalForm(LocationAwareForm):
 
     http://microformats.org/code/hcalendar/creator
     """
+    def clean_exdates(self):
+        """
+        Comma separated dates or date/times
+        """
+        value = self.cleaned_data.get('exdates', u'')
+        for exdate in value.split(','):
+            if exdate.strip():
+                try:
+                    parse_datetime(exdate.strip())
+                except ValueError:
+                    raise forms.ValidationError(_(u'%s is not a date'\
+                            u' (YYYY-MM-DD) or date/time'\
+                            u' (YYYY-MM-DDTHH:MM:SS)') % exdate.strip())
+        return value
+
+    def clean_rrule_interval(self):
+        """
+        At least 1 (the default)
+        """
+        value = self.cleaned_data.get('rrule_interval')
+        if value is None:
+            return 1
+        if value < 1:
+            raise forms.ValidationError(_(u'The event must repeat at least'\
+                    u' every 1 day, week or month'))
+        return value
+
     class Meta:
         model = hCalendar
         exclude = [
@@ -232,10 +262,14 @@ class AdrForm(forms.ModelForm):
     """
     def __init__(self, *args, **kwargs): 
         super(AdrForm, self).__init__(*args, **kwargs) 
-        self.fields['types'].widget = forms.CheckboxSelectMultiple()
-        self.fields['types'].label = _('Address Type')
-        self.fields['types'].help_text = _('Please select as many that apply')
-        self.fields['types'].queryset = adr_type.objects.all()
+        # The types are served from memory (see vocabulary.py) so rendering
+        # the form doesn't query the database
+        self.fields['types'] = VocabularyMultipleChoiceField(adr_types,
+                required=self.fields['types'].required,
+                initial=self.fields['types'].initial,
+                widget=forms.CheckboxSelectMultiple(),
+                label=_('Address Type'),
+                help_text=_('Please select as many that apply'))
 
     class Meta:
         model = adr
@@ -267,10 +301,14 @@ class EmailForm(forms.ModelForm):
     """
     def __init__(self, *args, **kwargs): 
         super(EmailForm, self).__init__(*args, **kwargs) 
-        self.fields['types'].widget = forms.CheckboxSelectMultiple()
-        self.fields['types'].label = _('Email Type')
-        self.fields['types'].help_text = _('Please select as many that apply')
-        self.fields['types'].queryset = email_type.objects.all()
+        # The types are served from memory (see vocabulary.py) so rendering
+        # the form doesn't query the database
+        self.fields['types'] = VocabularyMultipleChoiceField(email_types,
+                required=self.fields['types'].required,
+                initial=self.fields['types'].initial,
+                widget=forms.CheckboxSelectMultiple(),
+                label=_('Email Type'),
+                help_text=_('Please select as many that apply'))
 
     class Meta:
         model = email 
@@ -288,11 +326,37 @@ class TelForm(forms.ModelForm):
     """
     def __init__(self, *args, **kwargs): 
         super(TelForm, self).__init__(*args, **kwargs) 
-        self.fields['types'].widget = forms.CheckboxSelectMultiple()
-        self.fields['types'].label = _('Telephone Type')
-        self.fields['types'].help_text = _('Please select as many that apply')
-        self.fields['types'].queryset = tel_type.objects.all()
+        # The types are served from memory (see vocabulary.py) so rendering
+        # the form doesn't query the database
+        self.fields['types'] = VocabularyMultipleChoiceField(tel_types,
+                required=self.fields['types'].required,
+                initial=self.fields['types'].initial,
+                widget=forms.CheckboxSelectMultiple(),
+                label=_('Telephone Type'),
+                help_text=_('Please select as many that apply'))
 
     class Meta:
         model = tel 
         exclude = ['hcard']
+
+class XfnForm(forms.ModelForm):
+    """
+    A ModelForm for XFN links that brings the rel="me" identities up to date
+    once the relationships have been saved (see identities.py). Used by the
+    admin.
+    """
+    def save(self, commit=True):
+        instance = super(XfnForm, self).save(commit)
+        if commit:
+            relationships_saved(instance)
+        else:
+            # The caller (e.g. the admin) saves the relationships later
+            save_m2m = self.save_m2m
+            def save_relationships():
+                save_m2m()
+                relationships_saved(instance)
+            self.save_m2m = save_relationships
+        return instance
+
+    class Meta:
+        model = xfn
@@ -0,0 +1,290 @@
+# -*- coding: UTF-8 -*-
+"""
+Free/busy and conflict detection for the people (hCards) linked to events.
+
+The participant rows (attendees, contacts and organizers) joined to the
+event occurrences (see recurrence.py) overlapping a window are read with a
+single query per batch of people, ordered by person and start time, so each
+person's busy time can be worked out with a sweep-line pass over their
+events: overlapping events are merged into busy periods and any event that
+starts before an earlier one has finished is a double booking. Nothing but
+the current person's events is held in memory.
+
+Only the occurrences already materialised are read (reads never write), so
+recurring events are seen up to the occurrence horizon (see recurrence.py)
+and the period a caller may ask about is capped at MAX_FREEBUSY_PERIOD.
+
+Event times are normalised to UTC using the event's tz offset (events
+without one are taken to already be in UTC).
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import datetime
+import heapq
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.util import typecast_timestamp
+
+from microformats.ical import ical_datetime, vcalendar
+from microformats.models import hCard, hCalendar, participant, occurrence,\
+        PARTICIPANT_ROLES
+from microformats.utils import tz_offset
+
+# The parts people play in events that make them busy
+ROLES = [role for role, name in PARTICIPANT_ROLES]
+
+# How long an event without a dtend lasts (over-ridden in settings.py with
+# FREEBUSY_DEFAULT_DURATION). All day events without a dtend last a day.
+FREEBUSY_DEFAULT_DURATION = datetime.timedelta(hours=1)
+
+# The longest period the hcard_freebusy view answers for (over-ridden in
+# settings.py with MAX_FREEBUSY_PERIOD)
+MAX_FREEBUSY_PERIOD = datetime.timedelta(days=366)
+
+# The largest tz offset is +/-14 hours so the database is asked for a
+# slightly wider window than the one we want and the results clipped
+TZ_SLACK = datetime.timedelta(days=1)
+
+# How many people are asked about in one query
+BATCH_SIZE = 500
+
+# How many rows are fetched from the cursor at a time
+FETCH_SIZE = 1000
+
+def _default_duration():
+    return getattr(settings, 'FREEBUSY_DEFAULT_DURATION', False) and\
+            settings.FREEBUSY_DEFAULT_DURATION or FREEBUSY_DEFAULT_DURATION
+
+def max_period():
+    """
+    Returns the longest period a free/busy request may cover.
+    """
+    return getattr(settings, 'MAX_FREEBUSY_PERIOD', False) and\
+            settings.MAX_FREEBUSY_PERIOD or MAX_FREEBUSY_PERIOD
+
+def _datetime(value):
+    # Some backends hand raw SQL results back as strings
+    if isinstance(value, basestring):
+        return typecast_timestamp(value)
+    return value
+
+def event_interval(dtstart, dtend, all_day_event, tz, default_duration=None):
+    """
+    Returns the (start, end) of an event in UTC
+    """
+    if all_day_event:
+        dtstart = datetime.datetime(dtstart.year, dtstart.month, dtstart.day)
+        dtend = dtend or dtstart + datetime.timedelta(days=1)
+    elif not dtend:
+        dtend = dtstart + (default_duration or _default_duration())
+    offset = tz_offset(tz)
+    return dtstart - offset, dtend - offset
+
+def merge_intervals(intervals):
+    """
+    Merges overlapping (or touching) (start, end) intervals. The result is
+    sorted and no two intervals in it overlap.
+    """
+    result = []
+    for start, end in sorted(intervals):
+        if result and start <= result[-1][1]:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+def find_conflicts(events):
+    """
+    Given (start, end, event_pk) tuples returns a list of (event_pk,
+    other_event_pk, overlap_start, overlap_end) for every pair of events that
+    overlap.
+
+    The events are swept in start order while a heap holds those that are
+    still running, so the cost is O(n log n) plus the number of conflicts.
+    """
+    conflicts = []
+    running = []
+    for start, end, pk in sorted(events):
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for other_end, other_pk in running:
+            conflicts.append((other_pk, pk, start, min(end, other_end)))
+        heapq.heappush(running, (end, pk))
+    return conflicts
+
+def free_intervals(busy, start, end):
+    """
+    Returns the gaps between the (merged) busy intervals inside the window
+    """
+    result = []
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_start > cursor:
+            result.append((cursor, min(busy_start, end)))
+        cursor = max(cursor, busy_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        result.append((cursor, end))
+    return result
+
+def _pk(value):
+    return isinstance(value, hCard) and value.pk or value
+
+def _sql(role_count, hcard_count):
+    qn = connection.ops.quote_name
+    sql = u'SELECT p.%s, o.%s, o.%s, o.%s, e.%s, e.%s FROM %s p INNER JOIN %s'\
+            u' o ON o.%s = p.%s INNER JOIN %s e ON e.%s = p.%s WHERE p.%s IN'\
+            u' (%s) AND o.%s < %%s AND (o.%s > %%s OR (o.%s IS NULL AND'\
+            u' o.%s >= %%s))' % (qn('hcard_id'), qn('event_id'), qn('start'),
+                    qn('end'), qn('all_day_event'), qn('tz'),
+                    qn(participant._meta.db_table),
+                    qn(occurrence._meta.db_table), qn('event_id'),
+                    qn('event_id'), qn(hCalendar._meta.db_table), qn('id'),
+                    qn('event_id'), qn('role'),
+                    u', '.join([u'%s'] * role_count), qn('start'), qn('end'),
+                    qn('end'), qn('start'))
+    if hcard_count:
+        sql += u' AND p.%s IN (%s)' % (qn('hcard_id'),
+                u', '.join([u'%s'] * hcard_count))
+    return sql + u' ORDER BY p.%s, o.%s' % (qn('hcard_id'), qn('start'))
+
+def _rows(start, end, hcards=None, roles=ROLES):
+    """
+    Yields (hcard_pk, event_pk, start, end, all_day_event, tz) for the
+    occurrences of the events linked to the hcards (or to anyone if hcards is
+    None) that might overlap the window, ordered by hcard_pk and start.
+    """
+    query_start = start - TZ_SLACK
+    query_end = end + TZ_SLACK
+    # Occurrences without an end can't have started much before the window
+    earliest = query_start - max(_default_duration(),
+            datetime.timedelta(days=1))
+    if hcards is None:
+        batches = [[]]
+    else:
+        pks = sorted(set([_pk(h) for h in hcards]))
+        batches = [pks[i:i + BATCH_SIZE] for i in xrange(0, len(pks),
+            BATCH_SIZE)]
+    cursor = connection.cursor()
+    for batch in batches:
+        cursor.execute(_sql(len(roles), len(batch)), list(roles) + [
+            query_end, query_start, earliest] + batch)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+def sweep(rows, start, end, default_duration=None):
+    """
+    Takes rows as produced by _rows (grouped by hcard_pk) and yields
+    (hcard_pk, busy, conflicts) for each person with at least one event in
+    the window. busy is the list of merged (start, end) busy intervals
+    clipped to the window, conflicts as returned by find_conflicts.
+    """
+    default_duration = default_duration or _default_duration()
+    for hcard_pk, group in groupby(rows, lambda row: row[0]):
+        events = {}
+        for ignore, event_pk, dtstart, dtend, all_day, tz in group:
+            event_start, event_end = event_interval(_datetime(dtstart),
+                    _datetime(dtend), all_day, tz, default_duration)
+            event_start = max(event_start, start)
+            event_end = min(event_end, end)
+            if event_start < event_end:
+                # The same occurrence may be reached through several roles
+                events[(event_pk, event_start)] = (event_start, event_end,
+                        event_pk)
+        if events:
+            events = events.values()
+            yield hcard_pk, merge_intervals([e[:2] for e in events]),\
+                    find_conflicts(events)
+
+def busy_periods(hcards, start, end, roles=ROLES):
+    """
+    Returns a dict mapping the pk of each of the hcards (instances or pks) to
+    the list of (start, end) UTC intervals during which they're at an event.
+    People with nothing on are mapped to an empty list.
+    """
+    result = dict((_pk(h), []) for h in hcards)
+    for hcard_pk, busy, ignore in sweep(_rows(start, end, hcards, roles),
+            start, end):
+        result[hcard_pk] = busy
+    return result
+
+def free_periods(hcards, start, end, roles=ROLES):
+    """
+    As busy_periods but returns the free intervals inside the window
+    """
+    return dict((pk, free_intervals(busy, start, end)) for pk, busy in
+            busy_periods(hcards, start, end, roles).iteritems())
+
+def double_booked(start, end, hcards=None, roles=ROLES):
+    """
+    Returns a dict mapping the pk of every person (or only those in hcards)
+    who is at two or more overlapping events during the window to the list
+    of conflicts (event_pk, other_event_pk, overlap_start, overlap_end).
+    """
+    result = {}
+    for hcard_pk, ignore, conflicts in sweep(_rows(start, end, hcards,
+            roles), start, end):
+        if conflicts:
+            result[hcard_pk] = conflicts
+    return result
+
+def freebusy_ical(hcard, start, end, busy=None):
+    """
+    Returns an iCalendar (RFC2445) VFREEBUSY object describing when hcard is
+    busy during the window. busy can be passed in if it has already been
+    worked out (e.g. by busy_periods).
+    """
+    if busy is None:
+        busy = busy_periods([hcard], start, end)[_pk(hcard)]
+    lines = [
+            u'BEGIN:VFREEBUSY',
+            u'UID:freebusy-%s-%s@microformats' % (_pk(hcard),
+                ical_datetime(start)),
+            u'DTSTAMP:%s' % ical_datetime(datetime.datetime.utcnow()),
+            u'DTSTART:%s' % ical_datetime(start),
+            u'DTEND:%s' % ical_datetime(end),
+            ]
+    if busy:
+        lines.append(u'FREEBUSY;FBTYPE=BUSY:%s' % u','.join([u'%s/%s' % (
+            ical_datetime(s), ical_datetime(e)) for s, e in busy]))
+    lines.append(u'END:VFREEBUSY')
+    return vcalendar([lines])
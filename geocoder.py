@@ -0,0 +1,260 @@
+# -*- coding: UTF-8 -*-
+"""
+An offline geocoder that fills in missing latitude / longitude values from the
+adr fields of LocationAwareMicroformat instances.
+
+A gazetteer in the GeoNames postal code TSV format (see
+http://download.geonames.org/export/zip/) is compiled into a compact binary
+index of fixed width records sorted by key. The index is memory-mapped and
+searched with a binary search so start-up is instant and the operating system
+shares the pages between processes. Two kinds of key are stored:
+
+    (country, postal code) - e.g. GB / CS236YT
+    (country, locality)    - e.g. GB / townsville (the centroid of all the
+                             postal codes in that locality)
+
+No network access is needed.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import codecs
+import mmap
+import os
+import re
+import struct
+import unicodedata
+
+from django.db import transaction
+
+from microformats import clusters, spatial
+from microformats.models import hCard, hCalendar, hListing, hReview, hNews
+from microformats.utils import chunked_queryset, CHUNK_SIZE
+
+# The models that can be geocoded
+GEOCODED_MODELS = (hCard, hCalendar, hListing, hReview, hNews)
+
+MAGIC = 'MFGZ1\0\0\0'
+HEADER = struct.Struct('<8sI')
+# A key (UTF-8, padded with NULs) followed by latitude and longitude
+KEY_SIZE = 56
+RECORD = struct.Struct('<%dsdd' % KEY_SIZE)
+
+# Columns in the GeoNames postal code dump
+COUNTRY_COLUMN = 0
+POSTAL_CODE_COLUMN = 1
+PLACE_NAME_COLUMN = 2
+LATITUDE_COLUMN = 9
+LONGITUDE_COLUMN = 10
+
+NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]', re.UNICODE)
+WHITESPACE = re.compile(r'\s+', re.UNICODE)
+
+class GazetteerError(Exception):
+    """
+    Raised when a gazetteer index can't be read.
+    """
+    pass
+
+def normalise_postal_code(value):
+    """
+    "cs23 6yt" -> "CS236YT"
+    """
+    return NON_ALPHANUMERIC.sub(u'', (value or u'').upper())
+
+def normalise_locality(value):
+    """
+    Lower cases, strips accents and collapses the whitespace of a place name:
+    u" Saint  Étienne" -> u"saint etienne"
+    """
+    value = unicodedata.normalize('NFKD', unicode(value or u''))
+    value = u''.join(c for c in value if not unicodedata.combining(c))
+    return WHITESPACE.sub(u' ', value.strip().lower())
+
+def postal_key(country, postal_code):
+    postal_code = normalise_postal_code(postal_code)
+    if country and postal_code:
+        return (u'P|%s|%s' % (country.upper(), postal_code)).encode('utf-8')
+    return None
+
+def locality_key(country, locality):
+    locality = normalise_locality(locality)
+    if country and locality:
+        return (u'L|%s|%s' % (country.upper(), locality)).encode('utf-8')
+    return None
+
+def build_index(gazetteer_path, index_path):
+    """
+    Compiles a GeoNames style TSV gazetteer into a binary index file. Keys
+    that appear more than once get the mean of their coordinates. Returns the
+    number of keys written.
+    """
+    sums = {}
+    infile = codecs.open(gazetteer_path, 'r', 'utf-8')
+    try:
+        for line in infile:
+            row = line.rstrip(u'\r\n').split(u'\t')
+            try:
+                lat = float(row[LATITUDE_COLUMN])
+                lng = float(row[LONGITUDE_COLUMN])
+            except (IndexError, ValueError):
+                continue
+            country = row[COUNTRY_COLUMN]
+            for key in (postal_key(country, row[POSTAL_CODE_COLUMN]),
+                    locality_key(country, row[PLACE_NAME_COLUMN])):
+                if key and len(key) <= KEY_SIZE:
+                    total = sums.get(key)
+                    if total:
+                        total[0] += lat
+                        total[1] += lng
+                        total[2] += 1
+                    else:
+                        sums[key] = [lat, lng, 1]
+    finally:
+        infile.close()
+    keys = sorted(sums)
+    tmp_path = index_path + '.tmp'
+    outfile = open(tmp_path, 'wb')
+    try:
+        outfile.write(HEADER.pack(MAGIC, len(keys)))
+        for key in keys:
+            lat, lng, count = sums[key]
+            outfile.write(RECORD.pack(key, lat / count, lng / count))
+    finally:
+        outfile.close()
+    # Swap the new index in atomically so readers never see half a file
+    os.rename(tmp_path, index_path)
+    return len(keys)
+
+class Gazetteer(object):
+    """
+    A read-only, memory-mapped gazetteer index (as written by build_index).
+    """
+    def __init__(self, index_path):
+        self.file = open(index_path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            self.file.close()
+            raise GazetteerError('Unable to map %s' % index_path)
+        magic, self.count = HEADER.unpack(self.map[:HEADER.size])
+        if magic != MAGIC or len(self.map) !=\
+                HEADER.size + self.count * RECORD.size:
+            self.close()
+            raise GazetteerError('%s is not a gazetteer index' % index_path)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def _key_at(self, i):
+        start = HEADER.size + i * RECORD.size
+        return self.map[start:start + KEY_SIZE].rstrip('\0')
+
+    def get(self, key):
+        """
+        Returns the (latitude, longitude) tuple for a key or None.
+        """
+        if not key:
+            return None
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count and self._key_at(low) == key:
+            start = HEADER.size + low * RECORD.size
+            return RECORD.unpack(self.map[start:start + RECORD.size])[1:]
+        return None
+
+    def lookup(self, country, postal_code=None, locality=None):
+        """
+        Returns the (latitude, longitude) for an address: the postal code is
+        tried first as it is the more precise of the two.
+        """
+        return self.get(postal_key(country, postal_code)) or\
+                self.get(locality_key(country, locality))
+
+    def geocode(self, instance):
+        """
+        Returns the (latitude, longitude) for a LocationAwareMicroformat
+        instance (or None).
+        """
+        return self.lookup(instance.country_name, instance.postal_code,
+                instance.locality)
+
+def _geocode_chunk(model, gazetteer, chunk):
+    """
+    Fills in the coordinates for a chunk of rows. Updates are done with
+    update() so the rows' save() methods and signals aren't triggered: the
+    coordinate index and the clusters are told about the new positions
+    directly instead.
+    """
+    found = 0
+    for instance in chunk:
+        coordinates = gazetteer.geocode(instance)
+        if coordinates:
+            lat, lng = coordinates
+            model.objects.filter(pk=instance.pk).update(latitude=lat,
+                    longitude=lng)
+            instance.latitude, instance.longitude = lat, lng
+            spatial.update_coordinate_index(model, instance)
+            clusters.add_point(model, instance.pk, lat, lng)
+            found += 1
+    return found
+_geocode_chunk = transaction.commit_on_success(_geocode_chunk)
+
+def fill_missing_coordinates(gazetteer, models=GEOCODED_MODELS,
+        chunk_size=CHUNK_SIZE):
+    """
+    Fills in the latitude and longitude of every row (in the referenced
+    models) that has an address but no coordinates, chunk_size rows at a
+    time. Each chunk is committed in its own transaction. Returns a dict
+    mapping the model names to the number of rows updated.
+    """
+    result = {}
+    for model in models:
+        queryset = model.objects.filter(latitude__isnull=True).exclude(
+                country_name=None).exclude(country_name=u'').only(
+                        'country_name', 'postal_code', 'locality')
+        found = 0
+        for chunk in chunked_queryset(queryset, chunk_size):
+            found += _geocode_chunk(model, gazetteer, chunk)
+        result[model._meta.object_name] = found
+    return result
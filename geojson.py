@@ -0,0 +1,143 @@
+# -*- coding: UTF-8 -*-
+"""
+Streaming GeoJSON export of the geo-tagged microformats.
+
+Rows are read in chunks (so memory use doesn't grow with the size of the
+tables) and the FeatureCollection is written out a feature at a time. An
+optional bounding box and list of models are applied in the SQL rather than
+in Python.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import simplejson
+
+from microformats.models import hCard, hCalendar, hListing, hReview, hNews,\
+        geo
+from microformats.utils import chunked_queryset, model_name, CHUNK_SIZE
+
+# The adr fields needed to render adr()
+ADR_FIELDS = ('street_address', 'extended_address', 'locality', 'region',
+        'country_name', 'postal_code', 'post_office_box')
+
+# The exported models and the key fields included in each feature's
+# properties
+EXPORT_FIELDS = (
+        (hCard, ('given_name', 'family_name', 'org', 'title', 'url')),
+        (hCalendar, ('summary', 'location', 'dtstart', 'dtend', 'url')),
+        (hListing, ('listing_action', 'item_fn', 'lister_fn', 'price',
+            'dtlisted', 'item_url')),
+        (hReview, ('fn', 'type', 'rating', 'reviewer', 'dtreviewed', 'url')),
+        (hNews, ('entry_title', 'source_org', 'updated', 'bookmark')),
+        (geo, ('latitude_description', 'longitude_description')),
+        )
+
+MODELS = dict((model_name(m), m) for m, fields in EXPORT_FIELDS)
+
+def located(model, bbox=None):
+    """
+    Returns a queryset of the rows of model with coordinates, limited to the
+    bounding box (a (south, west, north, east) tuple) if one is given.
+    """
+    queryset = model.objects.filter(latitude__isnull=False,
+            longitude__isnull=False)
+    if bbox:
+        south, west, north, east = bbox
+        queryset = queryset.filter(latitude__gte=south, latitude__lte=north)
+        if west <= east:
+            queryset = queryset.filter(longitude__gte=west,
+                    longitude__lte=east)
+        else:
+            # The box crosses the 180th meridian
+            queryset = queryset.exclude(longitude__gt=east,
+                    longitude__lt=west)
+    return queryset
+
+def features(models=None, bbox=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields a GeoJSON Feature (as a dict) for every located row of the
+    referenced models (all of them by default). Only the columns needed for
+    the properties are read from the database.
+    """
+    for model, fields in EXPORT_FIELDS:
+        if models and model not in models:
+            continue
+        name = model_name(model)
+        has_adr = hasattr(model, 'adr')
+        columns = ('latitude', 'longitude') + fields
+        if has_adr:
+            columns += ADR_FIELDS
+        queryset = located(model, bbox).only(*columns)
+        for chunk in chunked_queryset(queryset, chunk_size):
+            for instance in chunk:
+                properties = {'type': name, 'pk': instance.pk}
+                for field in fields:
+                    properties[field] = getattr(instance, field)
+                if has_adr:
+                    properties['adr'] = instance.adr()
+                yield {
+                    'type': 'Feature',
+                    'id': '%s.%s' % (name, instance.pk),
+                    'geometry': {
+                        'type': 'Point',
+                        'coordinates': [instance.longitude, instance.latitude],
+                        },
+                    'properties': properties,
+                    }
+
+def feature_collection(features):
+    """
+    Yields the pieces of a GeoJSON FeatureCollection holding the referenced
+    features, one feature per piece.
+    """
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ''
+    for feature in features:
+        yield separator + simplejson.dumps(feature, cls=DjangoJSONEncoder)
+        separator = ',\n'
+    yield '\n]}\n'
+
+def export(outfile, models=None, bbox=None, chunk_size=CHUNK_SIZE):
+    """
+    Writes a FeatureCollection of the located rows to a file-like object.
+    Returns the number of features written.
+    """
+    count = [0]
+    def counted():
+        for feature in features(models, bbox, chunk_size):
+            count[0] += 1
+            yield feature
+    for piece in feature_collection(counted()):
+        outfile.write(piece)
+    return count[0]
@@ -0,0 +1,484 @@
+# -*- coding: UTF-8 -*-
+"""
+The XFN social graph: an adjacency index (xfn_edge) keyed by normalised URL
+and source user, set based SQL queries over it and an in-memory compressed
+sparse row (CSR) snapshot answering the same questions without the database.
+
+Users are joined up through their rel="me" links: a user who links to a URL
+with rel="me" owns it, so the friends of a friend are the URLs linked to by
+the owners of the URLs a user links to.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import threading
+import time
+import urlparse
+from array import array
+
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+
+from microformats.models import xfn, xfn_values, xfn_edge
+from microformats.utils import chunked_queryset, CHUNK_SIZE
+
+# How far bfs walks by default (2 = friends of friends)
+MAX_DEPTH = 2
+# The number of users or URLs in a single IN clause (kept under SQLite's
+# limit on the number of parameters in a query)
+BATCH_SIZE = 500
+# Rows read from the cursor at a time when loading a snapshot
+FETCH_SIZE = 10000
+# How often (in seconds) the snapshot is re-read from the database
+REFRESH_INTERVAL = 300
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+def normalise_url(url):
+    """
+    Returns the key used for a URL in the graph: the scheme and host lower
+    cased without the default port, the fragment or a trailing slash, e.g.
+    "HTTP://Example.com:80/jeff/#me" becomes "http://example.com/jeff".
+    """
+    url = (url or u'').strip()
+    if not url:
+        return u''
+    if '://' not in url:
+        url = u'http://' + url
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+    scheme = scheme.lower()
+    netloc = netloc.lower()
+    port = DEFAULT_PORTS.get(scheme)
+    if port and netloc.endswith(':' + port):
+        netloc = netloc[:-len(port) - 1]
+    return urlparse.urlunsplit((scheme, netloc, path.rstrip('/'), query, ''))
+
+def _pk(user):
+    return getattr(user, 'pk', user)
+
+#################
+# The edge index
+#################
+
+def index_xfn(instance, created=False):
+    """
+    Brings the xfn_edge row for the instance up to date.
+    """
+    key = normalise_url(instance.url)
+    rows = xfn_edge.objects.filter(link=instance.pk)
+    if not key:
+        rows.delete()
+    elif created or not rows.update(source=instance.source_id, url_key=key):
+        xfn_edge.objects.create(link=instance, source_id=instance.source_id,
+                url_key=key)
+
+def update_xfn_graph(sender, instance, created=False, **kwargs):
+    """
+    post_save signal handler. (The edge goes when the xfn is deleted as it
+    has a foreign key to it.)
+    """
+    index_xfn(instance, created)
+
+post_save.connect(update_xfn_graph, sender=xfn)
+
+def rebuild_xfn_graph(chunk_size=CHUNK_SIZE):
+    """
+    Throws away and rebuilds the edge index, reading the xfn rows in chunks.
+    Returns the number of rows processed.
+    """
+    xfn_edge.objects.all().delete()
+    count = 0
+    for chunk in chunked_queryset(xfn.objects.only('source', 'url'),
+            chunk_size):
+        for link in chunk:
+            index_xfn(link, True)
+        count += len(chunk)
+    return count
+rebuild_xfn_graph = transaction.commit_on_success(rebuild_xfn_graph)
+
+##############
+# SQL queries
+##############
+
+# The ids of the links marked rel="me". The relationships are a many to many
+# field (saved after the link itself) so they're joined in at query time
+# rather than copied into the index.
+ME_SQL = u"SELECT r.%(rel_xfn)s FROM %(rel)s r INNER JOIN %(values)s v ON"\
+        u" v.%(id)s = r.%(rel_value)s WHERE v.%(value)s = 'me'"
+
+LINKS_SQL = u'SELECT DISTINCT e.%(source_id)s, e.%(url_key)s FROM %(edge)s e'\
+        u' WHERE e.%(source_id)s IN (%(in)s) AND e.%(link_id)s %(not)s IN'\
+        u' (%(me)s)'
+
+OWNERS_SQL = u'SELECT DISTINCT e.%(url_key)s, e.%(source_id)s FROM %(edge)s'\
+        u' e WHERE e.%(url_key)s IN (%(in)s) AND e.%(link_id)s IN (%(me)s)'
+
+IN_DEGREE_SQL = u'SELECT COUNT(DISTINCT e.%(source_id)s) FROM %(edge)s e'\
+        u' INNER JOIN %(edge)s m ON m.%(url_key)s = e.%(url_key)s WHERE'\
+        u' m.%(source_id)s = %%s AND m.%(link_id)s IN (%(me)s) AND'\
+        u' e.%(link_id)s NOT IN (%(me)s) AND e.%(source_id)s <> %%s'
+
+MUTUAL_SQL = u'SELECT DISTINCT a.%(url_key)s FROM %(edge)s a INNER JOIN'\
+        u' %(edge)s b ON b.%(url_key)s = a.%(url_key)s WHERE a.%(source_id)s'\
+        u' = %%s AND b.%(source_id)s = %%s AND a.%(link_id)s NOT IN (%(me)s)'\
+        u' AND b.%(link_id)s NOT IN (%(me)s)'
+
+# Two hops in one go: my links (e), the owners of the URLs (m) and their
+# links (f), counting how many of my links lead to each URL
+FOF_SQL = u'SELECT f.%(url_key)s, COUNT(DISTINCT e.%(url_key)s) FROM'\
+        u' %(edge)s e INNER JOIN %(edge)s m ON m.%(url_key)s = e.%(url_key)s'\
+        u' INNER JOIN %(edge)s f ON f.%(source_id)s = m.%(source_id)s WHERE'\
+        u' e.%(source_id)s = %%s AND e.%(link_id)s NOT IN (%(me)s) AND'\
+        u' m.%(link_id)s IN (%(me)s) AND m.%(source_id)s <> %%s AND'\
+        u' f.%(link_id)s NOT IN (%(me)s) GROUP BY f.%(url_key)s'
+
+SNAPSHOT_SQL = u'SELECT e.%(source_id)s, e.%(url_key)s, CASE WHEN'\
+        u' e.%(link_id)s IN (%(me)s) THEN 1 ELSE 0 END FROM %(edge)s e'
+
+def _sql(sql, in_count=0, me=True, **extra):
+    """
+    Fills in the (quoted) table and column names of the sql. Other tables
+    (models) and columns (strings) can be referred to by passing them as
+    keyword arguments.
+    """
+    qn = connection.ops.quote_name
+    relationships = xfn._meta.get_field('relationships')
+    names = {
+            'edge': qn(xfn_edge._meta.db_table),
+            'link_id': qn('link_id'),
+            'source_id': qn('source_id'),
+            'url_key': qn('url_key'),
+            'rel': qn(relationships.m2m_db_table()),
+            'rel_xfn': qn(relationships.m2m_column_name()),
+            'rel_value': qn(relationships.m2m_reverse_name()),
+            'values': qn(xfn_values._meta.db_table),
+            'id': qn('id'),
+            'value': qn('value'),
+            'in': u', '.join([u'%s'] * in_count),
+            'not': not me and u'NOT' or u'',
+            }
+    for name, value in extra.iteritems():
+        if not isinstance(value, basestring):
+            value = value._meta.db_table
+        names[name] = qn(value)
+    names['me'] = ME_SQL % names
+    return sql % names
+
+def _query(sql, params=(), in_count=0, me=True, **extra):
+    cursor = connection.cursor()
+    cursor.execute(_sql(sql, in_count, me, **extra), list(params))
+    return cursor.fetchall()
+
+def _batched(sql, values, me=True):
+    """
+    Runs the sql for BATCH_SIZE of the values at a time and returns a dict
+    mapping the first column to a set of the second.
+    """
+    values = sorted(set(values))
+    result = {}
+    for i in xrange(0, len(values), BATCH_SIZE):
+        batch = values[i:i + BATCH_SIZE]
+        for key, value in _query(sql, batch, len(batch), me):
+            result.setdefault(key, set()).add(value)
+    return result
+
+def _links(users, me=False):
+    # user pk -> URLs linked to (or claimed with rel="me" if me is True)
+    return _batched(LINKS_SQL, users, me)
+
+def _owners(keys):
+    # URL -> user pks claiming it with rel="me"
+    return _batched(OWNERS_SQL, keys)
+
+def _union(sets):
+    result = set()
+    for value in sets:
+        result.update(value)
+    return result
+
+def contacts(user):
+    """
+    Returns a sorted list of the (normalised) URLs the user links to.
+    """
+    return sorted(_links([_pk(user)]).get(_pk(user), ()))
+
+def owners(url):
+    """
+    Returns a sorted list of the pks of the users claiming the URL with
+    rel="me".
+    """
+    key = normalise_url(url)
+    return sorted(_owners([key]).get(key, ()))
+
+def degree(user):
+    """
+    Returns an (out, in) tuple: the number of URLs the user links to and the
+    number of other users linking to one of the user's own (rel="me") URLs.
+    """
+    pk = _pk(user)
+    return (len(contacts(pk)), _query(IN_DEGREE_SQL, [pk, pk])[0][0])
+
+def mutual_contacts(user, other):
+    """
+    Returns a sorted list of the URLs both users link to.
+    """
+    return sorted([row[0] for row in _query(MUTUAL_SQL, [_pk(user),
+        _pk(other)])])
+
+def friends_of_friends(user, limit=None):
+    """
+    Returns a list of (URL, count) tuples for the URLs linked to by the owners
+    of the URLs the user links to - "people you may know" - where count is
+    the number of the user's contacts leading to it. The user's own contacts
+    and URLs are left out. Ordered by count (highest first) then URL.
+    """
+    pk = _pk(user)
+    known = set(contacts(pk)) | _links([pk], True).get(pk, set())
+    found = [(-count, key) for key, count in _query(FOF_SQL, [pk, pk]) if
+            key not in known]
+    found.sort()
+    return [(key, -count) for count, key in found[:limit]]
+
+def bfs(user, max_depth=MAX_DEPTH, max_nodes=None):
+    """
+    Walks the graph breadth first from the user and returns a dict mapping
+    each URL reached to its distance (1 for the user's contacts, 2 for their
+    contacts and so on). Stops after max_depth hops or once max_nodes URLs
+    have been found. The user's own URLs are left out.
+
+    Every hop is two set based queries (per BATCH_SIZE of the frontier) no
+    matter how many people are in it.
+    """
+    pk = _pk(user)
+    seen_users = set([pk])
+    frontier = [pk]
+    result = {}
+    seen = _links([pk], True).get(pk, set())
+    for depth in xrange(1, max_depth + 1):
+        found = sorted(_union(_links(frontier).values()) - seen)
+        if max_nodes is not None:
+            found = found[:max_nodes - len(result)]
+        for key in found:
+            result[key] = depth
+        seen.update(found)
+        if not found or len(result) == max_nodes or depth == max_depth:
+            break
+        frontier = _union(_owners(found).values()) - seen_users
+        seen_users.update(frontier)
+    return result
+
+##################
+# In-memory graph
+##################
+
+def _csr(codes, size, width):
+    """
+    Turns a sorted list of unique row * width + column codes into the offsets
+    and columns arrays of a compressed sparse row matrix with size rows.
+    """
+    offsets = array('l', [0]) * (size + 1)
+    columns = array('l')
+    for code in codes:
+        row, column = divmod(code, width)
+        offsets[row + 1] += 1
+        columns.append(column)
+    for i in xrange(size):
+        offsets[i + 1] += offsets[i]
+    return offsets, columns
+
+def _transpose(codes, size, width):
+    # The codes of the transposed matrix (sorted)
+    return sorted([(code % width) * size + code // width for code in codes])
+
+class GraphSnapshot(object):
+    """
+    An immutable in-memory copy of the XFN graph. Users and URLs are numbered
+    and the four directions of the graph (links, linked by, claims and
+    claimed by) are held as compressed sparse row arrays so walking it is
+    a matter of slicing arrays of integers.
+
+    Answers the same questions (with the same results) as the module level
+    SQL functions, but only as fresh as the last load().
+    """
+    def __init__(self, rows=()):
+        links, claims = set(), set()
+        for source, key, me in rows:
+            if me:
+                claims.add((source, key))
+            else:
+                links.add((source, key))
+        self.users = sorted(set([u for u, k in links]).union(
+            [u for u, k in claims]))
+        self.keys = sorted(set([k for u, k in links]).union(
+            [k for u, k in claims]))
+        self.user_index = dict((pk, i) for i, pk in enumerate(self.users))
+        self.key_index = dict((key, i) for i, key in enumerate(self.keys))
+        users, keys = len(self.users), len(self.keys)
+        # Each (user, URL) pair is encoded as a single integer as they sort
+        # a lot faster than tuples
+        links = sorted([self.user_index[u] * keys + self.key_index[k] for
+            u, k in links])
+        claims = sorted([self.user_index[u] * keys + self.key_index[k] for
+            u, k in claims])
+        self.links = _csr(links, users, keys)
+        self.linked_by = _csr(_transpose(links, users, keys), keys, users)
+        self.claims = _csr(claims, users, keys)
+        self.claimed_by = _csr(_transpose(claims, users, keys), keys, users)
+        self.edge_count = len(links) + len(claims)
+        self.loaded_at = time.time()
+
+    def load(cls):
+        """
+        Returns a snapshot of the graph as it is in the database.
+        """
+        cursor = connection.cursor()
+        cursor.execute(_sql(SNAPSHOT_SQL))
+        def rows():
+            while True:
+                chunk = cursor.fetchmany(FETCH_SIZE)
+                if not chunk:
+                    break
+                for row in chunk:
+                    yield row
+        return cls(rows())
+    load = classmethod(load)
+
+    def __len__(self):
+        return self.edge_count
+
+    def _row(self, matrix, i):
+        offsets, columns = matrix
+        return columns[offsets[i]:offsets[i + 1]]
+
+    def _user(self, user):
+        return self.user_index.get(_pk(user))
+
+    def contacts(self, user):
+        i = self._user(user)
+        if i is None:
+            return []
+        return [self.keys[k] for k in self._row(self.links, i)]
+
+    def owners(self, url):
+        k = self.key_index.get(normalise_url(url))
+        if k is None:
+            return []
+        return [self.users[u] for u in self._row(self.claimed_by, k)]
+
+    def degree(self, user):
+        i = self._user(user)
+        if i is None:
+            return (0, 0)
+        linkers = set()
+        for k in self._row(self.claims, i):
+            linkers.update(self._row(self.linked_by, k))
+        linkers.discard(i)
+        return (len(self._row(self.links, i)), len(linkers))
+
+    def mutual_contacts(self, user, other):
+        i, j = self._user(user), self._user(other)
+        if i is None or j is None:
+            return []
+        common = set(self._row(self.links, i)) & set(self._row(self.links,
+            j))
+        return sorted([self.keys[k] for k in common])
+
+    def friends_of_friends(self, user, limit=None):
+        i = self._user(user)
+        if i is None:
+            return []
+        mine = self._row(self.links, i)
+        known = set(mine)
+        known.update(self._row(self.claims, i))
+        reached = {}
+        for k in mine:
+            for owner in self._row(self.claimed_by, k):
+                if owner == i:
+                    continue
+                for f in self._row(self.links, owner):
+                    reached.setdefault(f, set()).add(k)
+        found = [(-len(via), self.keys[f]) for f, via in reached.iteritems()
+                if f not in known]
+        found.sort()
+        return [(key, -count) for count, key in found[:limit]]
+
+    def bfs(self, user, max_depth=MAX_DEPTH, max_nodes=None):
+        i = self._user(user)
+        if i is None:
+            return {}
+        seen_users = set([i])
+        frontier = [i]
+        result = {}
+        seen = set(self._row(self.claims, i))
+        for depth in xrange(1, max_depth + 1):
+            found = set()
+            for u in frontier:
+                found.update(self._row(self.links, u))
+            # Sorting the indices sorts the URLs as the keys are sorted
+            found = sorted(found - seen)
+            if max_nodes is not None:
+                found = found[:max_nodes - len(result)]
+            for k in found:
+                result[self.keys[k]] = depth
+            seen.update(found)
+            if not found or len(result) == max_nodes or depth == max_depth:
+                break
+            owners = set()
+            for k in found:
+                owners.update(self._row(self.claimed_by, k))
+            frontier = owners - seen_users
+            seen_users.update(frontier)
+        return result
+
+_snapshot = None
+_lock = threading.Lock()
+
+def get_graph_snapshot(refresh_interval=REFRESH_INTERVAL):
+    """
+    Returns the (process wide) snapshot of the graph, loading it on first use
+    and reloading it once it is more than refresh_interval seconds old. Only
+    one thread reloads at a time - the others carry on with the old snapshot
+    rather than waiting for it.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None or (refresh_interval is not None and
+            time.time() - snapshot.loaded_at > refresh_interval):
+        # Block only if there's nothing to answer with yet
+        if _lock.acquire(snapshot is None):
+            try:
+                if _snapshot is snapshot:
+                    _snapshot = GraphSnapshot.load()
+            finally:
+                _lock.release()
+    return _snapshot
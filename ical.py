@@ -0,0 +1,138 @@
+# -*- coding: UTF-8 -*-
+"""
+Helpers for writing iCalendar (RFC2445) objects.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import datetime
+
+from microformats.recurrence import exdates
+from microformats.utils import tz_offset
+
+PRODID = '-//ntoll.org//Microformats//EN'
+
+def ical_datetime(value, utc=True):
+    """
+    Formats a datetime as an iCalendar DATE-TIME (in UTC unless utc is False,
+    in which case it's a "floating" local time)
+    """
+    return value.strftime(utc and '%Y%m%dT%H%M%SZ' or '%Y%m%dT%H%M%S')
+
+def ical_date(value):
+    return value.strftime('%Y%m%d')
+
+def escape(value):
+    """
+    Escapes a TEXT value
+    """
+    return unicode(value).replace(u'\\', u'\\\\').replace(u';', u'\\;'
+            ).replace(u',', u'\\,').replace(u'\r\n', u'\\n').replace(u'\n',
+                    u'\\n')
+
+def fold(line):
+    """
+    Folds content lines longer than 75 octets (RFC2445 4.1)
+    """
+    line = line.encode('utf-8')
+    parts = []
+    while len(line) > 75:
+        cut = 75
+        # Don't split a multi-byte character
+        while cut and ord(line[cut]) & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(line[:cut])
+        line = ' ' + line[cut:]
+    parts.append(line)
+    return '\r\n'.join(parts)
+
+def vcalendar(components):
+    """
+    Wraps the lines of the components (lists of unicode content lines) in a
+    VCALENDAR object and returns it as a UTF-8 encoded string
+    """
+    lines = [u'BEGIN:VCALENDAR', u'VERSION:2.0', u'PRODID:%s' % PRODID,
+            u'METHOD:PUBLISH']
+    for component in components:
+        lines.extend(component)
+    lines.append(u'END:VCALENDAR')
+    return '\r\n'.join([fold(line) for line in lines]) + '\r\n'
+
+def _event_datetime(event, value):
+    # Events with a tz are written in UTC, others as floating local times
+    if event.tz:
+        return ical_datetime(value - tz_offset(event.tz))
+    return ical_datetime(value, False)
+
+def vevent(event):
+    """
+    Returns the content lines of a VEVENT for an hCalendar instance
+    (including its recurrence rule and exceptions)
+    """
+    lines = [
+            u'BEGIN:VEVENT',
+            u'UID:hcalendar-%s@microformats' % event.pk,
+            u'DTSTAMP:%s' % ical_datetime(datetime.datetime.utcnow()),
+            ]
+    if event.all_day_event:
+        lines.append(u'DTSTART;VALUE=DATE:%s' % ical_date(event.dtstart))
+        if event.dtend:
+            # DTEND is exclusive for all day events
+            lines.append(u'DTEND;VALUE=DATE:%s' % ical_date(event.dtend +
+                datetime.timedelta(days=1)))
+    else:
+        lines.append(u'DTSTART:%s' % _event_datetime(event, event.dtstart))
+        if event.dtend:
+            lines.append(u'DTEND:%s' % _event_datetime(event, event.dtend))
+    lines.append(u'SUMMARY:%s' % escape(event.summary))
+    if event.location:
+        lines.append(u'LOCATION:%s' % escape(event.location))
+    if event.description:
+        lines.append(u'DESCRIPTION:%s' % escape(event.description))
+    if event.url:
+        lines.append(u'URL:%s' % event.url)
+    if event.rrule_freq:
+        rule = event.rrule()
+        if event.rrule_until:
+            # UNTIL must be in the same form as DTSTART
+            rule = rule.replace(event.rrule_until.strftime('%Y%m%dT%H%M%S'),
+                    event.all_day_event and ical_date(event.rrule_until) or
+                    _event_datetime(event, event.rrule_until))
+        lines.append(u'RRULE:%s' % rule)
+        for exdate in sorted(exdates(event)):
+            if event.all_day_event:
+                lines.append(u'EXDATE;VALUE=DATE:%s' % ical_date(exdate))
+            else:
+                lines.append(u'EXDATE:%s' % _event_datetime(event, exdate))
+    lines.append(u'END:VEVENT')
+    return lines
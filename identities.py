@@ -0,0 +1,273 @@
+# -*- coding: UTF-8 -*-
+"""
+rel="me" identity resolution. A user linking to URLs with rel="me" is saying
+they are all the same person, so the URLs are joined up into connected
+components (union-find) and each normalised URL is given the id of its
+component in the url_identity table.
+
+Identities are merged as new rel="me" links arrive. Removing a link never
+splits an identity - run rebuild_identities (./manage.py resolve_identities
+--rebuild) for that.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+
+from microformats.models import xfn, hCard, url_identity
+from microformats.graph import normalise_url, _pk, _links, _query, BATCH_SIZE
+
+ME_LINKS_SQL = u'SELECT e.%(source_id)s, e.%(url_key)s FROM %(edge)s e WHERE'\
+        u' e.%(link_id)s IN (%(me)s)'
+
+# Users with a rel="me" URL that has no identity yet...
+UNRESOLVED_SQL = u'SELECT DISTINCT e.%(source_id)s FROM %(edge)s e LEFT'\
+        u' OUTER JOIN %(identities)s i ON i.%(url_key)s = e.%(url_key)s WHERE'\
+        u' e.%(link_id)s IN (%(me)s) AND i.%(id)s IS NULL'
+
+# ...or whose rel="me" URLs have more than one
+SPLIT_SQL = u'SELECT e.%(source_id)s FROM %(edge)s e INNER JOIN'\
+        u' %(identities)s i ON i.%(url_key)s = e.%(url_key)s WHERE'\
+        u' e.%(link_id)s IN (%(me)s) GROUP BY e.%(source_id)s HAVING'\
+        u' COUNT(DISTINCT i.%(identity)s) > 1'
+
+def _add(key, identity=None):
+    """
+    Adds a URL to the index with the referenced identity (or a new one of its
+    own) and returns the identity it ends up with.
+    """
+    sid = transaction.savepoint()
+    try:
+        row = url_identity.objects.create(url_key=key, identity=identity or 0)
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # Somebody else added it in the meantime
+        transaction.savepoint_rollback(sid)
+        row = url_identity.objects.get(url_key=key)
+        if identity:
+            url_identity.objects.filter(identity=row.identity).update(
+                    identity=identity)
+            return identity
+        return row.identity
+    if not identity:
+        row.identity = row.pk
+        row.save()
+    return row.identity
+
+def link_identity(user):
+    """
+    Gives the URLs the user claims with rel="me" the same identity (merging
+    the identities they already have) and returns it, or None if the user
+    claims no URLs.
+
+    The rows of the smaller identities are relabelled (union by size) so a
+    URL is never more than one lookup away from its identity.
+    """
+    pk = _pk(user)
+    keys = sorted(_links([pk], True).get(pk, ()))
+    if not keys:
+        return None
+    known = dict(url_identity.objects.filter(url_key__in=keys).values_list(
+        'url_key', 'identity'))
+    identities = set(known.values())
+    if identities:
+        sizes = dict([(row['identity'], row['size']) for row in
+            url_identity.objects.filter(identity__in=list(identities)).values(
+                'identity').annotate(size=Count('id'))])
+        identity = max(identities, key=lambda i: (sizes.get(i, 0), -i))
+        identities.discard(identity)
+        if identities:
+            url_identity.objects.filter(identity__in=list(identities)).update(
+                    identity=identity)
+    else:
+        identity = _add(keys[0])
+        known[keys[0]] = identity
+    for key in keys:
+        if key not in known:
+            _add(key, identity)
+    return identity
+
+def relationships_saved(link):
+    """
+    Links the identity of the link's source if the link is marked rel="me".
+    Call it once the link's relationships have been saved (XfnForm, and so
+    the admin, does).
+    """
+    if link.relationships.filter(value='me').count():
+        link_identity(link.source_id)
+
+def update_identities(sender, instance, **kwargs):
+    """
+    post_save signal handler. Connected after the graph's handler so the
+    link's edge is up to date.
+
+    ModelForms save the relationships after the link itself, so this only
+    sees the relationships of links saved again; XfnForm calls
+    relationships_saved() once they are there. Links given their
+    relationships any other way are picked up by the next
+    resolve_identities().
+    """
+    relationships_saved(instance)
+
+post_save.connect(update_identities, sender=xfn)
+
+def resolve_identities():
+    """
+    Links the identities of the users with rel="me" URLs that are missing
+    from the index or are split between identities. Returns the number of
+    users linked.
+    """
+    extra = {'identities': url_identity, 'identity': 'identity'}
+    users = set([row[0] for row in _query(UNRESOLVED_SQL, **extra)])
+    users.update([row[0] for row in _query(SPLIT_SQL, **extra)])
+    for pk in sorted(users):
+        link_identity(pk)
+    return len(users)
+resolve_identities = transaction.commit_on_success(resolve_identities)
+
+def _find(parent, key):
+    while parent[key] != key:
+        # Path halving
+        parent[key] = parent[parent[key]]
+        key = parent[key]
+    return key
+
+def _union(parent, size, a, b):
+    a, b = _find(parent, a), _find(parent, b)
+    if a != b:
+        if size[a] < size[b]:
+            a, b = b, a
+        parent[b] = a
+        size[a] += size[b]
+
+def rebuild_identities():
+    """
+    Throws away and recomputes every identity from the rel="me" links (in
+    memory, with union-find). Returns the number of identities.
+    """
+    parent, size, claims = {}, {}, {}
+    for source, key in _query(ME_LINKS_SQL):
+        claims.setdefault(source, []).append(key)
+        parent[key] = key
+        size[key] = 1
+    for keys in claims.itervalues():
+        for key in keys[1:]:
+            _union(parent, size, keys[0], key)
+    components = {}
+    for key in parent:
+        components.setdefault(_find(parent, key), []).append(key)
+    url_identity.objects.all().delete()
+    for keys in sorted([sorted(keys) for keys in components.itervalues()]):
+        identity = _add(keys[0])
+        for key in keys[1:]:
+            _add(key, identity)
+    return len(components)
+rebuild_identities = transaction.commit_on_success(rebuild_identities)
+
+##########
+# Lookups
+##########
+
+def identities_for(urls):
+    """
+    Returns a dict mapping each of the urls (as given) to its identity. URLs
+    without one are left out.
+    """
+    keys = dict((url, normalise_url(url)) for url in urls)
+    wanted = sorted(set(keys.values()))
+    found = {}
+    for i in xrange(0, len(wanted), BATCH_SIZE):
+        found.update(url_identity.objects.filter(
+            url_key__in=wanted[i:i + BATCH_SIZE]).values_list('url_key',
+                'identity'))
+    return dict((url, found[key]) for url, key in keys.iteritems() if key in
+            found)
+
+def identity_for(url):
+    """
+    Returns the identity of the url or None.
+    """
+    return identities_for([url]).get(url)
+
+def same_identity(url, other):
+    """
+    True if the two urls belong to the same person.
+    """
+    if normalise_url(url) == normalise_url(other):
+        return True
+    identities = identities_for([url, other])
+    return len(identities) == 2 and identities[url] == identities[other]
+
+def identity_urls(identity):
+    """
+    Returns a sorted list of the (normalised) URLs of the identity.
+    """
+    return list(url_identity.objects.filter(identity=identity).order_by(
+        'url_key').values_list('url_key', flat=True))
+
+def user_identity(user):
+    """
+    Returns the identity of the user (through their rel="me" URLs) or None.
+    """
+    pk = _pk(user)
+    identities = identities_for(_links([pk], True).get(pk, ())).values()
+    return identities and min(identities) or None
+
+def collapse(urls):
+    """
+    Returns the urls (in order) leaving out any that belong to the same
+    person (or normalise to the same URL) as one before it. For rendering
+    blogrolls or search results without listing somebody twice.
+    """
+    identities = identities_for(urls)
+    seen = set()
+    result = []
+    for url in urls:
+        marker = identities.get(url, normalise_url(url))
+        if marker not in seen:
+            seen.add(marker)
+            result.append(url)
+    return result
+
+def hcards_for(url):
+    """
+    Returns a queryset of the hCards whose URL is one of those of the
+    person behind the url.
+    """
+    identity = identity_for(url)
+    keys = identity and identity_urls(identity) or [normalise_url(url)]
+    # hCard URLs aren't normalised: match them with and without a trailing
+    # slash (the most common difference)
+    return hCard.objects.filter(url__in=keys + [key + u'/' for key in keys])
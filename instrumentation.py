@@ -0,0 +1,337 @@
+# -*- coding: UTF-8 -*-
+"""
+Records the database queries made while microformats are rendered so that
+lazy queries (and N+1 patterns in particular) show up in logs and tests.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+# A query shape run this many times in one render is reported as N+1
+N_PLUS_ONE_QUERIES = getattr(settings, 'N_PLUS_ONE_QUERIES', False) and settings.N_PLUS_ONE_QUERIES or 3
+# Log every render (at DEBUG, and the N+1 ones at WARNING) when True
+LOG_MICROFORMAT_RENDERS = getattr(settings, 'LOG_MICROFORMAT_RENDERS', False)
+
+logger = logging.getLogger('microformats.renders')
+
+# Literal strings and numbers in the SQL
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Lists of parameters, e.g. an IN clause
+PARAMETER_LISTS = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+
+# The recorders, collectors and render in progress in this thread
+_state = threading.local()
+
+def query_shape(sql):
+    """
+    Returns the SQL with literals and lists of parameters collapsed so that
+    queries differing only in their values have the same shape.
+    """
+    sql = LITERALS.sub('%s', sql)
+    sql = PARAMETER_LISTS.sub('(%s, ...)', sql)
+    return u' '.join(sql.split())
+
+class _RecordingCursor(object):
+    """
+    Wraps a database cursor, passing the queries it runs (with the time they
+    took) to the active recorders
+    """
+    def __init__(self, cursor, recorders):
+        self.cursor = cursor
+        self.recorders = recorders
+
+    def _record(self, sql, params, start):
+        duration = time.time() - start
+        for recorder in self.recorders:
+            recorder.queries.append((sql, params, duration))
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self._record(sql, params, start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self._record(sql, param_list, start)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+class QueryRecorder(object):
+    """
+    Records the queries run in this thread between start() and stop() as
+    (sql, params, duration) tuples. Recorders can be nested.
+    """
+    def __init__(self):
+        self.queries = []
+
+    def start(self):
+        recorders = getattr(_state, 'recorders', None)
+        if recorders is None:
+            recorders = _state.recorders = []
+        if not recorders:
+            # The connection is local to the thread so this only affects us
+            cursor = connection.cursor
+            connection.cursor = lambda: _RecordingCursor(cursor(), recorders)
+        recorders.append(self)
+
+    def stop(self):
+        recorders = _state.recorders
+        recorders.remove(self)
+        if not recorders:
+            del connection.cursor
+
+    def count(self):
+        return len(self.queries)
+    count = property(count)
+
+    def duration(self):
+        return sum([duration for sql, params, duration in self.queries])
+    duration = property(duration)
+
+    def shapes(self):
+        """
+        Returns a dict of query shape -> the number of times it was run
+        """
+        result = {}
+        for sql, params, duration in self.queries:
+            shape = query_shape(sql)
+            result[shape] = result.get(shape, 0) + 1
+        return result
+
+    def repeated(self, threshold=N_PLUS_ONE_QUERIES):
+        """
+        Returns the (shape, count) tuples of the query shapes run at least
+        threshold times, the most repeated first
+        """
+        result = [(count, shape) for shape, count in self.shapes().items()
+                if count >= threshold]
+        result.sort(reverse=True)
+        return [(shape, count) for count, shape in result]
+
+def model_label(value):
+    """
+    Returns "app_label.ModelName" for a model instance or queryset and the
+    type name for anything else
+    """
+    model = getattr(value, 'model', type(value))
+    if getattr(model, '_deferred', False):
+        # Instances loaded with only() are of a generated subclass
+        model = model.__base__
+    opts = getattr(model, '_meta', None)
+    if opts is None:
+        return type(value).__name__
+    return u'%s.%s' % (opts.app_label, opts.object_name)
+
+class RenderRecord(QueryRecorder):
+    """
+    The queries run by one (outermost) filter or render_microformat call
+    along with the type and primary key of what was rendered, the template
+    used and how long it took
+    """
+    def __init__(self, name, value):
+        super(RenderRecord, self).__init__()
+        self.name = name
+        self.model = model_label(value)
+        self.pk = getattr(value, 'pk', None)
+        self.template_name = None
+        self.elapsed = 0.0
+
+    def n_plus_one(self):
+        return self.repeated()
+
+    def __unicode__(self):
+        return u'%s(%s pk=%s template=%s): %d queries in %.1fms' % (
+                self.name, self.model, self.pk, self.template_name,
+                self.count, self.elapsed * 1000)
+
+class RenderCollector(object):
+    """
+    Collects the RenderRecords of the renders made in this thread between
+    start() and stop()
+    """
+    def __init__(self):
+        self.renders = []
+
+    def start(self):
+        collectors = getattr(_state, 'collectors', None)
+        if collectors is None:
+            collectors = _state.collectors = []
+        collectors.append(self)
+
+    def stop(self):
+        _state.collectors.remove(self)
+
+    def queries(self):
+        return sum([record.count for record in self.renders])
+    queries = property(queries)
+
+    def n_plus_one(self):
+        """
+        Returns the renders that repeated a query shape
+        """
+        return [record for record in self.renders if record.n_plus_one()]
+
+def note_template(template_name):
+    """
+    Tells the render in progress (if any) which template it's using
+    """
+    record = getattr(_state, 'current', None)
+    if record is not None and record.template_name is None:
+        record.template_name = template_name
+
+def _log(record):
+    repeated = record.n_plus_one()
+    if repeated:
+        logger.warning(u'%s; N+1: %s', unicode(record), u'; '.join([
+            u'%dx %s' % (count, shape) for shape, count in repeated]))
+    else:
+        logger.debug(unicode(record))
+
+def instrumented(func, name=None):
+    """
+    Wraps a filter (or render_microformat) so that, when a RenderCollector
+    is active or LOG_MICROFORMAT_RENDERS is set, each outermost call is
+    recorded as a RenderRecord. Otherwise the function is called as it is.
+
+    The attributes Django reads off filters (needs_autoescape, is_safe...)
+    are kept.
+    """
+    name = name or func.__name__
+    def wrapper(value, *args, **kwargs):
+        if getattr(_state, 'current', None) is not None or not (
+                LOG_MICROFORMAT_RENDERS or getattr(_state, 'collectors', None)):
+            return func(value, *args, **kwargs)
+        record = _state.current = RenderRecord(name, value)
+        record.start()
+        start = time.time()
+        try:
+            return func(value, *args, **kwargs)
+        finally:
+            record.elapsed = time.time() - start
+            record.stop()
+            _state.current = None
+            for collector in getattr(_state, 'collectors', None) or []:
+                collector.renders.append(record)
+            if LOG_MICROFORMAT_RENDERS:
+                _log(record)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    wrapper.__dict__.update(func.__dict__)
+    # So Django checks the arguments against the real filter
+    wrapper._decorated_function = getattr(func, '_decorated_function', func)
+    return wrapper
+
+class RenderQueryAssertions(object):
+    """
+    Mix into a TestCase to check the queries renders make:
+
+    self.assertRenderQueries(2, hfeed, feed)
+    self.assertNoNPlusOne(hcal, event)
+    """
+    def _collect(self, func, *args, **kwargs):
+        collector = RenderCollector()
+        collector.start()
+        try:
+            func(*args, **kwargs)
+        finally:
+            collector.stop()
+        return collector
+
+    def assertRenderQueries(self, count, func, *args, **kwargs):
+        collector = self._collect(func, *args, **kwargs)
+        if collector.queries != count:
+            self.fail(u'%d queries rendering, expected %d:\n%s' % (
+                collector.queries, count, u'\n'.join([unicode(record) for
+                    record in collector.renders])))
+
+    def assertNoNPlusOne(self, func, *args, **kwargs):
+        collector = self._collect(func, *args, **kwargs)
+        repeated = collector.n_plus_one()
+        if repeated:
+            self.fail(u'N+1 queries rendering:\n%s' % u'\n'.join([
+                u'%s: %s' % (unicode(record), u'; '.join([u'%dx %s' % (
+                    count, shape) for shape, count in record.n_plus_one()]))
+                for record in repeated]))
+
+class RenderQueriesMiddleware(object):
+    """
+    When DEBUG is on, logs the renders each request made (N+1 ones at
+    WARNING) and adds an X-Microformat-Queries header with the totals.
+    Add 'microformats.instrumentation.RenderQueriesMiddleware' to
+    MIDDLEWARE_CLASSES.
+    """
+    def process_request(self, request):
+        if settings.DEBUG:
+            request.microformat_renders = RenderCollector()
+            request.microformat_renders.start()
+
+    def _stop(self, request):
+        collector = getattr(request, 'microformat_renders', None)
+        if collector is not None:
+            collector.stop()
+            del request.microformat_renders
+        return collector
+
+    def process_exception(self, request, exception):
+        # process_response isn't always called after an exception, and a
+        # collector left running would gather every later render of the
+        # thread
+        self._stop(request)
+
+    def process_response(self, request, response):
+        collector = self._stop(request)
+        if collector is None:
+            return response
+        if not LOG_MICROFORMAT_RENDERS:
+            for record in collector.renders:
+                _log(record)
+        response['X-Microformat-Queries'] = '%d renders, %d queries, %d N+1' % (
+                len(collector.renders), collector.queries,
+                len(collector.n_plus_one()))
+        return response
@@ -0,0 +1,174 @@
+# -*- coding: UTF-8 -*-
+"""
+Archives and removes expired hListings.
+
+Expired listings are copied, batch_size rows at a time, either to the compact
+hlisting_archive table or to a JSON lines file (one listing per line) and
+then deleted. Each batch is committed in its own transaction so the hListing
+table is never locked for long. The item photos of archived listings can be
+kept, deleted or moved to an archive directory in the same storage.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import datetime
+import os
+
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import simplejson
+
+from microformats.models import hListing, hlisting_archive
+
+# How many listings are archived and deleted in one transaction
+BATCH_SIZE = 500
+
+# What can be done with the item photos of archived listings
+PHOTO_ACTIONS = ('keep', 'delete', 'move')
+
+# Where moved photos go (relative to the photo's own directory)
+PHOTO_ARCHIVE_DIR = 'archive'
+
+def listing_record(listing):
+    """
+    Returns a dict holding every field of the listing (as would be produced
+    by the python serializer) suitable for dumping as JSON
+    """
+    return serializers.serialize('python', [listing])[0]
+
+def _photo_name(listing, action):
+    """
+    Returns the name the listing's item photo will have in storage once it
+    has been archived (or None if it will be deleted).
+    """
+    photo = listing.item_photo
+    if not photo or action == 'keep':
+        return photo and photo.name or None
+    if action == 'move':
+        directory, filename = os.path.split(photo.name)
+        return photo.storage.get_available_name(os.path.join(directory,
+            PHOTO_ARCHIVE_DIR, filename))
+    return None
+
+def _archive_photo(listing, action, target):
+    """
+    Deletes the listing's item photo or moves it to target. Photos that are
+    already gone are left alone so it is safe to run again.
+    """
+    photo = listing.item_photo
+    if not photo or action == 'keep':
+        return
+    storage = photo.storage
+    name = photo.name
+    if not storage.exists(name):
+        return
+    if action == 'move':
+        source = storage.open(name)
+        try:
+            storage.save(target, source)
+        finally:
+            source.close()
+    storage.delete(name)
+
+def _archive_batch(listings, to_file, photos):
+    """
+    Archives (to the table, or as the JSON lines returned if to_file) and
+    deletes the listings. Returns the (listing, photo name, line) of each.
+    """
+    result = []
+    for listing in listings:
+        record = listing_record(listing)
+        target = _photo_name(listing, photos)
+        record['fields']['item_photo'] = target
+        data = simplejson.dumps(record, cls=DjangoJSONEncoder)
+        if not to_file:
+            hlisting_archive.objects.create(original_id=listing.pk,
+                    listing_action=listing.listing_action,
+                    dtexprired=listing.dtexprired, data=data)
+        result.append((listing, target, data))
+    # The signals of the other subsystems (phones, emails, clusters...) are
+    # sent as the rows are deleted so their lookup tables stay correct
+    hListing.objects.filter(pk__in=[l.pk for l in listings]).delete()
+    return result
+_archive_batch = transaction.commit_on_success(_archive_batch)
+
+def archive_expired(before=None, outfile=None, photos='keep',
+        batch_size=BATCH_SIZE, listing_action=None):
+    """
+    Archives and deletes the listings that expired before before (default:
+    now). The listings go to the hlisting_archive table unless a file like
+    object is passed as outfile, in which case they're written to it as JSON
+    lines. photos is one of PHOTO_ACTIONS. Returns the number of listings
+    archived.
+
+    The lines are written and the photos deleted or moved once each batch
+    has been committed, so a batch that is rolled back leaves both alone.
+    """
+    if photos not in PHOTO_ACTIONS:
+        raise ValueError('Unknown photo action: %s' % photos)
+    before = before or datetime.datetime.now()
+    # Ordered by expiry so both the (listing_action, dtexprired) and
+    # (dtexprired) indexes in sql/hlisting.sql can be read in order
+    queryset = hListing.objects.expired(listing_action, before).order_by(
+            'dtexprired', 'pk')
+    count = 0
+    while True:
+        # Rows are deleted as we go so the first batch_size are always the
+        # next ones to archive
+        listings = list(queryset[:batch_size])
+        if not listings:
+            break
+        archived = _archive_batch(listings, outfile is not None, photos)
+        if outfile is not None:
+            outfile.write(''.join([data + '\n' for listing, target, data in
+                archived]))
+            outfile.flush()
+        for listing, target, data in archived:
+            _archive_photo(listing, photos, target)
+        count += len(archived)
+        if len(listings) < batch_size:
+            break
+    return count
+
+def restore(record):
+    """
+    Puts an archived listing (a dict as stored in hlisting_archive.data or
+    a line of an archive file) back in the hListing table with its original
+    primary key. Returns the listing.
+    """
+    if isinstance(record, basestring):
+        record = simplejson.loads(record)
+    listing = serializers.deserialize('python', [record]).next()
+    listing.save()
+    return listing.object
@@ -0,0 +1,53 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that archives and deletes expired hListings.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from microformats.listings import archive_expired, BATCH_SIZE, PHOTO_ACTIONS
+from microformats.utils import parse_datetime
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--output', dest='output', default=None,
+            help='Append the listings to this JSON lines file instead of the'\
+                    ' archive table'),
+        make_option('--before', dest='before', default=None,
+            help='Only archive listings that expired before this date'\
+                    ' (YYYY-MM-DD[THH:MM:SS]). Defaults to now'),
+        make_option('--action', dest='listing_action', default=None,
+            help='Only archive listings with this listing action'),
+        make_option('--photos', dest='photos', default='keep',
+            choices=PHOTO_ACTIONS,
+            help='What to do with the item photos: %s' % ', '.join(
+                PHOTO_ACTIONS)),
+        make_option('--batch-size', dest='batch_size', type='int',
+            default=BATCH_SIZE,
+            help='Number of listings archived and deleted per transaction'),
+    )
+    help = 'Archives the expired hListings (to the archive table or a JSON'\
+            ' lines file) and deletes them in small batches.'
+
+    def handle_noargs(self, **options):
+        before = None
+        if options['before']:
+            try:
+                before = parse_datetime(options['before'])
+            except ValueError, e:
+                raise CommandError(str(e))
+        outfile = None
+        if options['output']:
+            outfile = open(options['output'], 'a')
+        try:
+            count = archive_expired(before, outfile, options['photos'],
+                    options['batch_size'], options['listing_action'])
+        finally:
+            if outfile is not None:
+                outfile.close()
+        sys.stdout.write('Archived %d listings\n' % count)
@@ -0,0 +1,28 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that links every hEntry to its canonical author and
+recounts the authors' entries.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.authors import backfill_authors
+from microformats.utils import CHUNK_SIZE
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of entries read from the database at a time'),
+    )
+    help = 'Links the hEntries to their canonical authors and recounts the'\
+            ' entries of each author.'
+
+    def handle_noargs(self, **options):
+        count = backfill_authors(options['chunk_size'])
+        sys.stdout.write('Linked %d entries to their authors\n' % count)
@@ -0,0 +1,27 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that fills in the normalised hFeed tags from the
+category text.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.tags import backfill_tags
+from microformats.utils import CHUNK_SIZE
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of feeds read from the database at a time'),
+    )
+    help = 'Rebuilds the normalised tags of every hFeed from its categories.'
+
+    def handle_noargs(self, **options):
+        count = backfill_tags(options['chunk_size'])
+        sys.stdout.write('Tagged %d feeds\n' % count)
@@ -0,0 +1,28 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that parses the price of every existing hListing into the
+price_amount and price_currency columns.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.prices import backfill_prices
+from microformats.utils import CHUNK_SIZE
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+    )
+    help = 'Parses the free text price of every hListing into an amount and'\
+            ' a currency.'
+
+    def handle_noargs(self, **options):
+        count = backfill_prices(options['chunk_size'])
+        sys.stdout.write('Parsed the prices of %d listings\n' % count)
@@ -0,0 +1,35 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that fills in the UTC shadow columns of existing hCalendar
+and hReview rows.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from microformats.timezones import backfill_utc, MODELS
+from microformats.utils import CHUNK_SIZE
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+    )
+    help = 'Fills in the UTC copies of the date/time fields. Optionally pass'\
+            ' the names of the models to update (hcalendar, hreview).'
+    args = '[model ...]'
+
+    def handle(self, *args, **options):
+        models = []
+        for name in args:
+            if name.lower() not in MODELS:
+                raise CommandError('Unknown model: %s' % name)
+            models.append(MODELS[name.lower()])
+        result = backfill_utc(models, options['chunk_size'])
+        for name in sorted(result):
+            sys.stdout.write('%s: %d rows updated\n' % (name, result[name]))
@@ -0,0 +1,54 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that exports the geo-tagged rows as a GeoJSON
+FeatureCollection.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from microformats.geojson import export, MODELS
+from microformats.utils import parse_bbox, CHUNK_SIZE
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--bbox', dest='bbox', default=None,
+            help='Only export rows inside west,south,east,north'),
+        make_option('--output', dest='output', default=None,
+            help='The file to write to (defaults to stdout)'),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+    )
+    help = 'Exports the located rows as GeoJSON. Optionally pass the names'\
+            ' of the models to export (hcard, hcalendar, hlisting, hreview,'\
+            ' hnews, geo).'
+    args = '[model ...]'
+
+    def handle(self, *args, **options):
+        models = []
+        for name in args:
+            if name.lower() not in MODELS:
+                raise CommandError('Unknown model: %s' % name)
+            models.append(MODELS[name.lower()])
+        bbox = None
+        if options['bbox']:
+            try:
+                bbox = parse_bbox(options['bbox'])
+            except ValueError:
+                raise CommandError('Invalid bounding box: %s' %
+                        options['bbox'])
+        if options['output']:
+            outfile = open(options['output'], 'w')
+        else:
+            outfile = sys.stdout
+        try:
+            count = export(outfile, models, bbox, options['chunk_size'])
+        finally:
+            if options['output']:
+                outfile.close()
+        sys.stderr.write('Exported %d features\n' % count)
@@ -0,0 +1,29 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that moves the occurrence horizon of (recurring)
+hCalendar events along. Run it regularly (e.g. daily from cron).
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.recurrence import extend_horizon
+from microformats.utils import CHUNK_SIZE
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of events read from the database at a time'),
+    )
+    help = 'Materialises the occurrences of every hCalendar event up to the'\
+            ' horizon from now (settings.OCCURRENCE_HORIZON). Run it daily'\
+            ' so date range queries see a full horizon ahead.'
+
+    def handle_noargs(self, **options):
+        count = extend_horizon(chunk_size=options['chunk_size'])
+        sys.stdout.write('Added %d occurrences\n' % count)
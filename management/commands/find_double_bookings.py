@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that lists the people who are booked on overlapping events.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from microformats.freebusy import double_booked
+from microformats.utils import parse_period
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--start', dest='start', default=None,
+            help='Start of the period in UTC (YYYY-MM-DD[THH:MM:SS]).'\
+                    ' Defaults to now'),
+        make_option('--end', dest='end', default=None,
+            help='End of the period in UTC (YYYY-MM-DD[THH:MM:SS]).'\
+                    ' Defaults to four weeks after the start'),
+    )
+    help = 'Lists the hCards that are attendees, contacts or organizers of'\
+            ' overlapping events. Optionally pass the ids of the hCards to'\
+            ' check.'
+    args = '[hcard_id ...]'
+
+    def handle(self, *args, **options):
+        try:
+            start, end = parse_period(options['start'], options['end'])
+            hcards = args and [int(arg) for arg in args] or None
+        except ValueError, e:
+            raise CommandError(str(e))
+        result = double_booked(start, end, hcards)
+        for hcard_pk in sorted(result):
+            for event_pk, other_pk, overlap_start, overlap_end in\
+                    result[hcard_pk]:
+                sys.stdout.write('hcard %d: events %d and %d overlap from %s'\
+                        ' to %s\n' % (hcard_pk, event_pk, other_pk,
+                            overlap_start, overlap_end))
+        sys.stdout.write('%d people double booked\n' % len(result))
@@ -0,0 +1,46 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that lists clusters of (probably) duplicate contacts.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from microformats.dedupe import find_duplicates, MODELS, DEFAULT_THRESHOLD,\
+        DEFAULT_MAX_BLOCK_SIZE
+from microformats.utils import CHUNK_SIZE
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--model', dest='model', default='hcard',
+            help='Either "hcard" or "hcardcomplete" (default: hcard)'),
+        make_option('--threshold', dest='threshold', type='float',
+            default=DEFAULT_THRESHOLD,
+            help='Minimum similarity score for a match (0.0 - 1.0)'),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+        make_option('--processes', dest='processes', type='int', default=1,
+            help='Number of worker processes to use'),
+        make_option('--max-block-size', dest='max_block_size', type='int',
+            default=DEFAULT_MAX_BLOCK_SIZE,
+            help='Blocks with more members than this are skipped'),
+    )
+    help = 'Outputs clusters of candidate duplicate contacts, one cluster'\
+            ' (a space separated list of primary keys) per line.'
+
+    def handle(self, *args, **options):
+        model = MODELS.get(options['model'].lower())
+        if not model:
+            raise CommandError('Unknown model: %s' % options['model'])
+        clusters = find_duplicates(model.objects.all(),
+                threshold=options['threshold'],
+                chunk_size=options['chunk_size'],
+                processes=options['processes'],
+                max_block_size=options['max_block_size'])
+        for cluster in clusters:
+            sys.stdout.write(' '.join(str(pk) for pk in cluster) + '\n')
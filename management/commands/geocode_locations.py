@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that fills in missing latitude / longitude values from an
+offline gazetteer.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from microformats.geocoder import Gazetteer, GazetteerError, build_index,\
+        fill_missing_coordinates, GEOCODED_MODELS
+from microformats.utils import CHUNK_SIZE
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--gazetteer', dest='gazetteer', default=None,
+            help='A GeoNames postal code TSV file to (re)build the index'\
+                    ' from before geocoding'),
+        make_option('--index', dest='index', default=None,
+            help='The path of the compiled gazetteer index'),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+    )
+    help = 'Fills in the coordinates of rows with an address but no'\
+            ' latitude / longitude. Optionally pass the names of the models'\
+            ' to geocode (hcard, hcalendar, hlisting, hreview, hnews).'
+    args = '[model ...]'
+
+    def handle(self, *args, **options):
+        index = options['index']
+        if not index:
+            raise CommandError('You must supply the path of the index'\
+                    ' with --index')
+        models = dict((m._meta.object_name.lower(), m) for m in
+                GEOCODED_MODELS)
+        selected = []
+        for name in args:
+            if name.lower() not in models:
+                raise CommandError('Unknown model: %s' % name)
+            selected.append(models[name.lower()])
+        if options['gazetteer']:
+            count = build_index(options['gazetteer'], index)
+            sys.stdout.write('Built index of %d keys\n' % count)
+        try:
+            gazetteer = Gazetteer(index)
+        except (GazetteerError, EnvironmentError), e:
+            raise CommandError(str(e))
+        try:
+            result = fill_missing_coordinates(gazetteer,
+                    selected or GEOCODED_MODELS, options['chunk_size'])
+        finally:
+            gazetteer.close()
+        for name in sorted(result):
+            sys.stdout.write('%s: %d rows geocoded\n' % (name, result[name]))
@@ -0,0 +1,35 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that (re)builds the normalised telephone number index for
+rows that existed before the index did.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from microformats.phones import backfill_phone_index, MODELS
+from microformats.utils import CHUNK_SIZE
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+    )
+    help = 'Indexes the telephone numbers of existing rows. Optionally pass'\
+            ' the names of the models to index (hcard, tel, hlisting,'\
+            ' hreview).'
+    args = '[model ...]'
+
+    def handle(self, *args, **options):
+        models = []
+        for name in args:
+            if name.lower() not in MODELS:
+                raise CommandError('Unknown model: %s' % name)
+            models.append(MODELS[name.lower()])
+        count = backfill_phone_index(models, options['chunk_size'])
+        sys.stdout.write('Indexed %d rows\n' % count)
@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that fills the participant table from the hCalendar
+attendees, contacts and organizers many-to-many tables. Links made before the
+participant table existed are only in those tables.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+
+from django.core.management.base import NoArgsCommand
+from django.db import connection, transaction
+
+from microformats.models import hCalendar, participant, PARTICIPANT_FIELDS
+
+class Command(NoArgsCommand):
+    help = 'Copies the hCalendar attendees, contacts and organizers that are'\
+            ' missing from the participant table into it. Run it once after'\
+            ' syncdb has created the participant table.'
+
+    def handle_noargs(self, **options):
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        target = participant._meta.db_table
+        for name, role in PARTICIPANT_FIELDS:
+            field = hCalendar._meta.get_field(name)
+            table = field.m2m_db_table()
+            event_col = qn(field.m2m_column_name())
+            hcard_col = qn(field.m2m_reverse_name())
+            # Copy everything in one statement, skipping rows that are
+            # already there so the command can safely be run again
+            cursor.execute(u'INSERT INTO %s (%s, %s, %s) SELECT o.%s, o.%s,'\
+                    u' %%s FROM %s o WHERE NOT EXISTS (SELECT 1 FROM %s p'\
+                    u' WHERE p.%s = o.%s AND p.%s = o.%s AND p.%s = %%s)' % (
+                        qn(target), qn('event_id'), qn('hcard_id'), qn('role'),
+                        event_col, hcard_col, qn(table), qn(target),
+                        qn('event_id'), event_col, qn('hcard_id'), hcard_col,
+                        qn('role')),
+                    [role, role])
+            sys.stdout.write('Copied %d %s from %s\n' % (cursor.rowcount,
+                name, table))
+    handle_noargs = transaction.commit_on_success(handle_noargs)
@@ -0,0 +1,33 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that rebuilds the case-insensitive email address index.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from microformats.emails import rebuild_email_index, MODELS
+from microformats.utils import CHUNK_SIZE
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+    )
+    help = 'Rebuilds the email address index. Optionally pass the names of'\
+            ' the models to rebuild (hcard, email, hlisting).'
+    args = '[model ...]'
+
+    def handle(self, *args, **options):
+        models = []
+        for name in args:
+            if name.lower() not in MODELS:
+                raise CommandError('Unknown model: %s' % name)
+            models.append(MODELS[name.lower()])
+        count = rebuild_email_index(models, options['chunk_size'])
+        sys.stdout.write('Indexed %d rows\n' % count)
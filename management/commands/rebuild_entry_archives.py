@@ -0,0 +1,27 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that recomputes the monthly hEntry archive counts.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.archives import rebuild_archives
+from microformats.utils import CHUNK_SIZE
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of entries read from the database at a time'),
+    )
+    help = 'Recomputes the number of entries per feed and month from the'\
+            ' hEntries.'
+
+    def handle_noargs(self, **options):
+        count = rebuild_archives(options['chunk_size'])
+        sys.stdout.write('Counted the entries of %d months\n' % count)
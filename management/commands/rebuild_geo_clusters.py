@@ -0,0 +1,36 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that recomputes the marker clusters used by the map views.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from microformats.clusters import rebuild_clusters, MODELS
+from microformats.spatial import LOCATED_MODELS
+from microformats.utils import CHUNK_SIZE
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+    )
+    help = 'Recomputes the geo clusters. Optionally pass the names of the'\
+            ' models to recompute (hcard, hcalendar, hlisting, hreview,'\
+            ' hnews, geo).'
+    args = '[model ...]'
+
+    def handle(self, *args, **options):
+        models = []
+        for name in args:
+            if name.lower() not in MODELS:
+                raise CommandError('Unknown model: %s' % name)
+            models.append(MODELS[name.lower()])
+        count = rebuild_clusters(models or LOCATED_MODELS,
+                options['chunk_size'])
+        sys.stdout.write('Clustered %d rows\n' % count)
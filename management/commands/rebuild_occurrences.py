@@ -0,0 +1,29 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that rebuilds the occurrence table used for date range
+queries on (recurring) hCalendar events.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.recurrence import rebuild_all_occurrences
+from microformats.utils import CHUNK_SIZE
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of events read from the database at a time'),
+    )
+    help = 'Rebuilds the occurrences of every hCalendar event up to the'\
+            ' horizon (settings.OCCURRENCE_HORIZON). Run it after upgrading'\
+            ' or loading events in bulk.'
+
+    def handle_noargs(self, **options):
+        count = rebuild_all_occurrences(options['chunk_size'])
+        sys.stdout.write('Rebuilt the occurrences of %d events\n' % count)
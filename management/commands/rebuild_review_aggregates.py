@@ -0,0 +1,27 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that recomputes the hReview rating aggregates.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.ratings import rebuild_aggregates
+from microformats.utils import CHUNK_SIZE
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of reviews read from the database at a time'),
+    )
+    help = 'Recomputes the rating aggregates of every reviewed item from the'\
+            ' hReviews.'
+
+    def handle_noargs(self, **options):
+        count = rebuild_aggregates(options['chunk_size'])
+        sys.stdout.write('Aggregated the reviews of %d items\n' % count)
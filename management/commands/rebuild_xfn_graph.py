@@ -0,0 +1,27 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that rebuilds the XFN graph's edge index.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.graph import rebuild_xfn_graph
+from microformats.utils import CHUNK_SIZE
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of rows read from the database at a time'),
+    )
+    help = 'Rebuilds the index of normalised URLs the XFN graph is walked'\
+            ' with.'
+
+    def handle_noargs(self, **options):
+        count = rebuild_xfn_graph(options['chunk_size'])
+        sys.stdout.write('Indexed %d XFN links\n' % count)
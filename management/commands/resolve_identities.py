@@ -0,0 +1,30 @@
+# -*- coding: UTF-8 -*-
+"""
+Management command that brings the rel="me" identities up to date.
+
+Author: Nicholas H.Tollervey
+
+"""
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from microformats.identities import resolve_identities, rebuild_identities
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--rebuild', action='store_true', dest='rebuild',
+            default=False,
+            help='Recompute every identity (needed after rel="me" links are'\
+                    ' removed)'),
+    )
+    help = 'Merges the identities of URLs newly claimed with rel="me".'
+
+    def handle_noargs(self, **options):
+        if options['rebuild']:
+            count = rebuild_identities()
+            sys.stdout.write('Found %d identities\n' % count)
+        else:
+            count = resolve_identities()
+            sys.stdout.write('Linked the identities of %d users\n' % count)
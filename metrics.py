@@ -0,0 +1,274 @@
+# -*- coding: UTF-8 -*-
+"""
+Always-on metrics for the template filters: calls, latency (as a fixed
+bucket histogram) and output size per filter, plus a log of slow renders.
+
+Only the outermost filter call is measured. Filters called while another is
+rendering (e.g. rel_tag inside hfeed, or hentry inside river) are part of
+that filter's time and bytes, so the totals across filters add up to the
+time spent in filters rather than counting nested work twice.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from microformats.instrumentation import model_label
+
+# The upper bounds (in seconds) of the latency histogram buckets. There is
+# a last bucket for anything slower.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5, 1.0, 2.5)
+# Renders taking longer than this many seconds are logged (over-ridden in
+# settings.py, None turns the log off)
+SLOW_MICROFORMAT_RENDER = getattr(settings, 'SLOW_MICROFORMAT_RENDER', False) and settings.SLOW_MICROFORMAT_RENDER or None
+# The number of slow renders kept for slow_renders()
+SLOW_RENDERS_KEPT = 100
+
+logger = logging.getLogger('microformats.slow')
+
+_lock = threading.Lock()
+# filter name -> FilterMetrics
+_metrics = {}
+# The most recent slow renders, oldest first
+_slow = []
+# Whether a filter is being measured in this thread
+_state = threading.local()
+
+def _bucket(elapsed):
+    for i, bound in enumerate(BUCKETS):
+        if elapsed <= bound:
+            return i
+    return len(BUCKETS)
+
+class FilterMetrics(object):
+    """
+    The calls, total time, latency histogram and bytes (UTF-8) emitted of
+    one filter
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, elapsed, size):
+        bucket = _bucket(elapsed)
+        _lock.acquire()
+        try:
+            self.calls += 1
+            self.seconds += elapsed
+            self.bytes += size
+            self.buckets[bucket] += 1
+        finally:
+            _lock.release()
+
+    def percentile(self, q):
+        """
+        Returns an estimate of the q-th (0 - 100) percentile latency,
+        interpolating within the bucket it falls in (as Prometheus'
+        histogram_quantile does). None if there have been no calls.
+        """
+        if not self.calls:
+            return None
+        rank = self.calls * q / 100.0
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                if i == len(BUCKETS):
+                    # We don't know how slow, only that it's over the top
+                    return BUCKETS[-1]
+                lower = i and BUCKETS[i - 1] or 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'bytes': self.bytes,
+            'buckets': zip(BUCKETS + (None,), self.buckets),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            }
+
+def _get(name):
+    metrics = _metrics.get(name)
+    if metrics is None:
+        _lock.acquire()
+        try:
+            metrics = _metrics.setdefault(name, FilterMetrics(name))
+        finally:
+            _lock.release()
+    return metrics
+
+def _size(result):
+    if isinstance(result, unicode):
+        return len(result.encode('utf-8'))
+    if isinstance(result, str):
+        return len(result)
+    return 0
+
+def measured(func, name=None):
+    """
+    Wraps a filter so that its calls are counted, timed and sized unless
+    another filter is already being measured. The attributes Django reads
+    off filters are kept.
+    """
+    metrics = _get(name or func.__name__)
+    def wrapper(value, *args, **kwargs):
+        if getattr(_state, 'measuring', False):
+            return func(value, *args, **kwargs)
+        _state.measuring = True
+        start = time.time()
+        try:
+            result = func(value, *args, **kwargs)
+        finally:
+            _state.measuring = False
+        metrics.observe(time.time() - start, _size(result))
+        return result
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    wrapper.__dict__.update(func.__dict__)
+    wrapper._decorated_function = getattr(func, '_decorated_function', func)
+    return wrapper
+
+def _log_slow(instance, template_name, elapsed):
+    record = {
+        'model': model_label(instance),
+        'pk': getattr(instance, 'pk', None),
+        'template_name': template_name,
+        'seconds': elapsed,
+        }
+    _lock.acquire()
+    try:
+        _slow.append(record)
+        del _slow[:-SLOW_RENDERS_KEPT]
+    finally:
+        _lock.release()
+    logger.warning(u'Slow render: %(model)s pk=%(pk)s template=%(template_name)s took %(seconds).3fs' % record)
+
+def timed_render(func):
+    """
+    Wraps render_microformat(instance, template_name, ...) so that renders
+    slower than SLOW_MICROFORMAT_RENDER are logged. With the log off the
+    render is called straight through.
+    """
+    def wrapper(instance, template_name, *args, **kwargs):
+        if not SLOW_MICROFORMAT_RENDER:
+            return func(instance, template_name, *args, **kwargs)
+        start = time.time()
+        result = func(instance, template_name, *args, **kwargs)
+        elapsed = time.time() - start
+        if elapsed > SLOW_MICROFORMAT_RENDER:
+            _log_slow(instance, template_name, elapsed)
+        return result
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    wrapper.__dict__.update(func.__dict__)
+    return wrapper
+
+def filter_metrics():
+    """
+    Returns a dict of filter name -> dict of calls, seconds, bytes,
+    buckets ((upper bound, count) tuples, None for the last) and p50, p90
+    and p99 latency estimates in seconds
+    """
+    _lock.acquire()
+    try:
+        return dict([(name, metrics.as_dict()) for name, metrics in
+            _metrics.items()])
+    finally:
+        _lock.release()
+
+def slow_renders():
+    """
+    Returns the most recent slow renders (dicts of model, pk, template_name
+    and seconds), oldest first
+    """
+    _lock.acquire()
+    try:
+        return list(_slow)
+    finally:
+        _lock.release()
+
+def reset_metrics():
+    """
+    Zeroes the metrics and forgets the slow renders
+    """
+    _lock.acquire()
+    try:
+        for metrics in _metrics.values():
+            metrics.__init__(metrics.name)
+        del _slow[:]
+    finally:
+        _lock.release()
+
+def _number(value):
+    return repr(float(value))
+
+def prometheus_text():
+    """
+    Returns the metrics in the Prometheus text exposition format
+    """
+    metrics = filter_metrics()
+    names = sorted(metrics.keys())
+    lines = [
+        '# HELP microformat_filter_seconds Time spent in each microformat template filter.',
+        '# TYPE microformat_filter_seconds histogram',
+        ]
+    for name in names:
+        total = 0
+        for bound, count in metrics[name]['buckets']:
+            total += count
+            lines.append('microformat_filter_seconds_bucket{filter="%s",le="%s"} %d' % (
+                name, bound is None and '+Inf' or _number(bound), total))
+        lines.append('microformat_filter_seconds_sum{filter="%s"} %s' % (name,
+            _number(metrics[name]['seconds'])))
+        lines.append('microformat_filter_seconds_count{filter="%s"} %d' % (
+            name, metrics[name]['calls']))
+    lines.extend([
+        '# HELP microformat_filter_bytes_total Bytes (UTF-8) emitted by each microformat template filter.',
+        '# TYPE microformat_filter_bytes_total counter',
+        ])
+    for name in names:
+        lines.append('microformat_filter_bytes_total{filter="%s"} %d' % (name,
+            metrics[name]['bytes']))
+    return '\n'.join(lines) + '\n'
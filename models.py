@@ -35,10 +35,15 @@ OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 """
-from django.db import models
-from django.utils.translation import ugettext_lazy as _, ugettext as __
+from django.db import models, connection, transaction
+from django.utils.translation import ugettext_lazy as _, ugettext as __,\
+        get_language
+from django.utils.encoding import force_unicode
 from django.contrib.auth.models import User
 from datetime import date
+import datetime
+
+from microformats.utils import normalise_tag
 
 ########################################
 # Constant tuples used in several models
@@ -329,6 +334,117 @@ COUNTRY_LIST = (
         ('ZW', _('Zimbabwe')),
     )
 
+# The ways in which an hCalendar event can repeat (a subset of the RFC2445
+# RRULE FREQ values)
+RRULE_FREQUENCIES = (
+        ('DAILY', _('Daily')),
+        ('WEEKLY', _('Weekly')),
+        ('MONTHLY', _('Monthly')),
+    )
+
+# The parts people can play in an hCalendar event (see the participant model)
+PARTICIPANT_ROLES = (
+        ('attendee', _('Attendee')),
+        ('contact', _('Contact')),
+        ('organizer', _('Organizer')),
+    )
+
+###########################################################
+# Precomputed lookups for the display names of the choices
+###########################################################
+
+# Django's get_FOO_display() builds a dict from the choices and translates the
+# result on every call. For the long COUNTRY_LIST and TIMEZONE tuples we build
+# a dict of translated names once per language instead (lazily, the first time
+# a language is used).
+_CHOICE_INDEXES = {}
+
+def choice_index(name, choices):
+    """
+    Returns a dict mapping the values of choices to their display names in the
+    currently active language. name identifies the choices in the cache.
+    """
+    key = (name, get_language())
+    index = _CHOICE_INDEXES.get(key)
+    if index is None:
+        index = dict((k, force_unicode(v)) for k, v in choices)
+        _CHOICE_INDEXES[key] = index
+    return index
+
+def country_name_display(code):
+    """
+    Returns the display name of the country with the referenced ISO 3166
+    code (or the code itself if it isn't recognised).
+    """
+    return choice_index('country', COUNTRY_LIST).get(code, code)
+
+def timezone_display(offset):
+    """
+    Returns the display name of the referenced timezone offset (or the offset
+    itself if it isn't recognised).
+    """
+    return choice_index('timezone', TIMEZONE).get(offset, offset)
+
+##############################################
+# Accessors for the people at hCalendar events
+##############################################
+
+# The hCalendar ManyToManyFields holding the people at an event and the role
+# their links have in the participant table
+PARTICIPANT_FIELDS = (
+        ('attendees', 'attendee'),
+        ('contacts', 'contact'),
+        ('organizers', 'organizer'),
+    )
+
+class ParticipantRole(object):
+    """
+    Wraps the descriptor of one of the attendees, contacts and organizers
+    ManyToManyFields (or of its reverse accessor on hCard) so that add(),
+    remove(), clear(), create() and assignment through the related manager
+    are copied to the participant table. The fields themselves are left
+    alone so ORM lookups, ModelForms and the admin work as they always have.
+    """
+    def __init__(self, descriptor, role, reverse=False):
+        self.descriptor = descriptor
+        self.role = role
+        self.reverse = reverse
+
+    def __get__(self, instance, owner):
+        manager = self.descriptor.__get__(instance, owner)
+        if instance is None:
+            return manager
+        role = self.role
+        reverse = self.reverse
+        add, remove, clear = manager.add, manager.remove, manager.clear
+        def split(objs):
+            if reverse:
+                return objs, [instance]
+            return [instance], objs
+        def synced_add(*objs):
+            add(*objs)
+            events, hcards = split(objs)
+            participant.objects.index(events, hcards, role)
+        def synced_remove(*objs):
+            remove(*objs)
+            events, hcards = split(objs)
+            participant.objects.unindex(events, hcards, role)
+        def synced_clear():
+            clear()
+            lookup = reverse and 'hcard' or 'event'
+            participant.objects.filter(role=role,
+                    **{lookup: instance}).delete()
+        # create() calls self.add() so it is kept in step too
+        manager.add = synced_add
+        manager.remove = synced_remove
+        manager.clear = synced_clear
+        return manager
+
+    def __set__(self, instance, value):
+        manager = self.__get__(instance, None)
+        manager.clear()
+        manager.add(*value)
+
 ########
 # Models
 ########
@@ -419,7 +535,7 @@ class LocationAwareMicroformat(models.Model):
             self.extended_address,
             self.locality, 
             self.region, 
-            self.country_name and self.get_country_name_display() or self.country_name, 
+            self.country_name and country_name_display(self.country_name), 
             self.postal_code,
             self.post_office_box,
             ) if x and x.strip()))
@@ -679,10 +795,61 @@ class hCalendar(LocationAwareMicroformat):
             choices=TIMEZONE,
             help_text=_("Hour(s) from GMT")
             )
+    # dtstart and dtend converted to UTC using tz - see timezones.py
+    dtstart_utc = models.DateTimeField(
+            null=True,
+            blank=True,
+            editable=False,
+            db_index=True
+            )
+    dtend_utc = models.DateTimeField(
+            null=True,
+            blank=True,
+            editable=False,
+            db_index=True
+            )
     description = models.TextField(
             _('Description'),
             blank=True
             )
+    # Recurrence - see recurrence.py
+    rrule_freq = models.CharField(
+            _('Repeats'),
+            max_length=8,
+            blank=True,
+            choices=RRULE_FREQUENCIES
+            )
+    rrule_interval = models.PositiveIntegerField(
+            _('Repeat every'),
+            default=1,
+            blank=True,
+            help_text=_("e.g. 2 for a weekly event that happens every other"\
+                    " week")
+            )
+    rrule_count = models.PositiveIntegerField(
+            _('Number of times'),
+            null=True,
+            blank=True
+            )
+    rrule_until = models.DateTimeField(
+            _('Repeat until'),
+            null=True,
+            blank=True
+            )
+    exdates = models.TextField(
+            _('Exceptions'),
+            blank=True,
+            help_text=_("Comma separated dates (YYYY-MM-DD) or date/times"\
+                    " (YYYY-MM-DDTHH:MM:SS) when the event doesn't happen")
+            )
+    # How far ahead the occurrence table has been filled in for this event
+    materialised_until = models.DateTimeField(
+            null=True,
+            blank=True,
+            editable=False,
+            db_index=True
+            )
+    # The people taking part in the event (copied to the participant table)
     attendees = models.ManyToManyField(
             hCard,
             related_name='attendees',
@@ -710,6 +877,226 @@ class hCalendar(LocationAwareMicroformat):
         return u"%s - %s"%(self.dtstart.strftime('%a %b %d %Y, %I:%M%p'),
                 self.summary)
 
+    def exdate_list(self):
+        """
+        The exception dates (or date/times) as a list of strings
+        """
+        return [x.strip() for x in self.exdates.split(',') if x.strip()]
+
+    def rrule(self):
+        """
+        The recurrence rule in RFC2445 format (e.g. "FREQ=WEEKLY;COUNT=10") or
+        an empty string if the event doesn't repeat
+        """
+        if not self.rrule_freq:
+            return u''
+        parts = [u'FREQ=%s' % self.rrule_freq]
+        if self.rrule_interval and self.rrule_interval > 1:
+            parts.append(u'INTERVAL=%d' % self.rrule_interval)
+        if self.rrule_count:
+            parts.append(u'COUNT=%d' % self.rrule_count)
+        if self.rrule_until:
+            parts.append(u'UNTIL=%s' % self.rrule_until.strftime(
+                '%Y%m%dT%H%M%S'))
+        return u';'.join(parts)
+
+    def recurrence_display(self):
+        """
+        A human readable description of the recurrence rule
+        """
+        if not self.rrule_freq:
+            return u''
+        result = force_unicode(self.get_rrule_freq_display())
+        if self.rrule_interval and self.rrule_interval > 1:
+            result = __(u'%(freq)s (every %(interval)d)') % {
+                    'freq': result, 'interval': self.rrule_interval}
+        if self.rrule_count:
+            result = __(u'%(rule)s, %(count)d times') % {'rule': result,
+                    'count': self.rrule_count}
+        if self.rrule_until:
+            result = __(u'%(rule)s until %(until)s') % {'rule': result,
+                    'until': self.rrule_until.strftime('%a %b %d %Y')}
+        return result
+
+class ParticipantManager(models.Manager):
+    """
+    Bulk operations on the participant table. It holds a copy of the links in
+    the attendees, contacts and organizers tables (kept in step by the
+    accessors, see ParticipantRole) so "every event this person is involved
+    in" is a single index scan.
+    """
+    def _ids(self, events, hcards):
+        return sorted(set([getattr(e, 'pk', e) for e in events])),\
+                sorted(set([getattr(h, 'pk', h) for h in hcards]))
+
+    def _m2m(self, role):
+        """
+        Returns the quoted table, event column and hcard column of the
+        ManyToManyField that holds the role.
+        """
+        qn = connection.ops.quote_name
+        field = hCalendar._meta.get_field(dict([(r, name) for name, r in
+            PARTICIPANT_FIELDS])[role])
+        return qn(field.m2m_db_table()), qn(field.m2m_column_name()),\
+                qn(field.m2m_reverse_name())
+
+    def _where(self, event_col, hcard_col, event_ids, hcard_ids):
+        return u'%s IN (%s) AND %s IN (%s)' % (event_col, u', '.join(
+            [u'%s'] * len(event_ids)), hcard_col, u', '.join([u'%s'] *
+                len(hcard_ids)))
+
+    def index(self, events, hcards, role):
+        """
+        Adds the missing participant rows (only) for every one of the hcards
+        in every one of the events, in a single statement. Instances or
+        primary keys may be passed. Returns the number of rows added.
+        """
+        event_ids, hcard_ids = self._ids(events, hcards)
+        if not (event_ids and hcard_ids):
+            return 0
+        existing = set(self.filter(role=role, event__in=event_ids,
+            hcard__in=hcard_ids).values_list('event', 'hcard'))
+        rows = [(event_id, hcard_id, role) for event_id in event_ids
+                for hcard_id in hcard_ids
+                if (event_id, hcard_id) not in existing]
+        if rows:
+            qn = connection.ops.quote_name
+            cursor = connection.cursor()
+            cursor.executemany(u'INSERT INTO %s (%s, %s, %s) VALUES (%%s, %%s,'\
+                    u' %%s)' % (qn(self.model._meta.db_table), qn('event_id'),
+                        qn('hcard_id'), qn('role')), rows)
+            transaction.commit_unless_managed()
+        return len(rows)
+
+    def unindex(self, events, hcards, role=None):
+        """
+        Removes the participant rows (only) of the hcards in the events (in
+        every role unless role is given).
+        """
+        queryset = self.filter(event__in=[getattr(e, 'pk', e) for e in events],
+                hcard__in=[getattr(h, 'pk', h) for h in hcards])
+        if role:
+            queryset = queryset.filter(role=role)
+        queryset.delete()
+
+    def assign(self, events, hcards, role):
+        """
+        Makes every one of the hcards a participant (in the referenced role)
+        in every one of the events, as event.<role>s.add() would but for many
+        events at once. Instances or primary keys may be passed. Existing
+        links are left alone and the rest are inserted with one statement per
+        table. Returns the number of participant rows added.
+        """
+        event_ids, hcard_ids = self._ids(events, hcards)
+        if not (event_ids and hcard_ids):
+            return 0
+        table, event_col, hcard_col = self._m2m(role)
+        cursor = connection.cursor()
+        cursor.execute(u'SELECT %s, %s FROM %s WHERE %s' % (event_col,
+            hcard_col, table, self._where(event_col, hcard_col, event_ids,
+                hcard_ids)), event_ids + hcard_ids)
+        existing = set([tuple(row) for row in cursor.fetchall()])
+        rows = [(event_id, hcard_id) for event_id in event_ids
+                for hcard_id in hcard_ids
+                if (event_id, hcard_id) not in existing]
+        if rows:
+            cursor.executemany(u'INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+                table, event_col, hcard_col), rows)
+            transaction.commit_unless_managed()
+        return self.index(event_ids, hcard_ids, role)
+
+    def unassign(self, events, hcards, role=None):
+        """
+        Removes the hcards from the events (in every role unless role is
+        given), as event.<role>s.remove() would.
+        """
+        event_ids, hcard_ids = self._ids(events, hcards)
+        if not (event_ids and hcard_ids):
+            return
+        cursor = connection.cursor()
+        for name, field_role in PARTICIPANT_FIELDS:
+            if role and role != field_role:
+                continue
+            table, event_col, hcard_col = self._m2m(field_role)
+            cursor.execute(u'DELETE FROM %s WHERE %s' % (table, self._where(
+                event_col, hcard_col, event_ids, hcard_ids)),
+                event_ids + hcard_ids)
+        transaction.commit_unless_managed()
+        self.unindex(event_ids, hcard_ids, role)
+
+    def events_for(self, hcard, roles=None):
+        """
+        Returns the events hcard takes part in (in any of the roles) as a
+        single scan of the (hcard_id, role, event_id) index.
+        """
+        queryset = hCalendar.objects.filter(
+                participants__hcard=getattr(hcard, 'pk', hcard))
+        if roles:
+            queryset = queryset.filter(participants__role__in=roles)
+        return queryset.distinct()
+
+class participant(models.Model):
+    """
+    Links an hCard to an hCalendar event in which it plays a role (attendee,
+    contact or organizer). A copy of the attendees, contacts and organizers
+    links in one table means "every event this person is involved in" is a
+    single index scan (see sql/participant.sql).
+    """
+    event = models.ForeignKey(
+            hCalendar,
+            related_name='participants'
+            )
+    hcard = models.ForeignKey(
+            hCard,
+            related_name='participations'
+            )
+    role = models.CharField(
+            _('Role'),
+            max_length=16,
+            choices=PARTICIPANT_ROLES
+            )
+
+    objects = ParticipantManager()
+
+    class Meta:
+        verbose_name = _('Participant')
+        verbose_name_plural = _('Participants')
+        unique_together = (('event', 'hcard', 'role'),)
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.hcard, self.get_role_display())
+
+# Copy the changes made through the people accessors to the participant table
+for name, role in PARTICIPANT_FIELDS:
+    setattr(hCalendar, name, ParticipantRole(hCalendar.__dict__[name], role))
+    setattr(hCard, name, ParticipantRole(hCard.__dict__[name], role,
+        reverse=True))
+
+class ListingManager(models.Manager):
+    """
+    Knows which listings have expired (see dtexprired). Both queries are
+    answered by the (listing_action, dtexprired) index in sql/hlisting.sql.
+    """
+    def active(self, listing_action=None, now=None):
+        """
+        The listings that haven't expired (optionally only those with the
+        referenced listing_action)
+        """
+        queryset = self.get_query_set()
+        if listing_action:
+            queryset = queryset.filter(listing_action=listing_action)
+        return queryset.filter(models.Q(dtexprired__isnull=True) |
+                models.Q(dtexprired__gt=now or datetime.datetime.now()))
+
+    def expired(self, listing_action=None, now=None):
+        """
+        The listings that have expired
+        """
+        queryset = self.get_query_set()
+        if listing_action:
+            queryset = queryset.filter(listing_action=listing_action)
+        return queryset.filter(dtexprired__lte=now or datetime.datetime.now())
+
 class hListing(LocationAwareMicroformat):
     """
     hListing is a proposal for an open, distributed listings (UK English:
@@ -783,6 +1170,23 @@ class hListing(LocationAwareMicroformat):
             max_length=128,
             blank=True
             )
+    # The price parsed into an amount and an ISO 4217 currency code - see
+    # prices.py
+    price_amount = models.DecimalField(
+            _('Price amount'),
+            max_digits=14,
+            decimal_places=2,
+            null=True,
+            blank=True,
+            editable=False,
+            db_index=True
+            )
+    price_currency = models.CharField(
+            _('Price currency'),
+            max_length=3,
+            blank=True,
+            editable=False
+            )
     item_fn = models.CharField(
             _('Item Name'),
             max_length=128,
@@ -800,6 +1204,8 @@ class hListing(LocationAwareMicroformat):
             blank=True
             )
 
+    objects = ListingManager()
+
     class Meta:
         verbose_name = _('hListing')
         verbose_name_plural = _('hListings')
@@ -810,6 +1216,41 @@ class hListing(LocationAwareMicroformat):
                 self.lister_fn,
                 self.description)
 
+class hlisting_archive(models.Model):
+    """
+    A compact copy of an expired hListing that has been removed from the
+    hListing table - see listings.py. data holds every field of the original
+    as JSON.
+    """
+    original_id = models.PositiveIntegerField(
+            _('Original ID'),
+            db_index=True
+            )
+    listing_action = models.CharField(
+            _('Listing Action'),
+            max_length=8,
+            choices=hListing.LISTING_TYPE
+            )
+    dtexprired = models.DateTimeField(
+            _('Expired'),
+            null=True,
+            blank=True
+            )
+    archived = models.DateTimeField(
+            _('Archived'),
+            auto_now_add=True
+            )
+    data = models.TextField(
+            _('Data')
+            )
+
+    class Meta:
+        verbose_name = _('Archived hListing')
+        verbose_name_plural = _('Archived hListings')
+
+    def __unicode__(self):
+        return u"%s (%s)" % (self.original_id, self.get_listing_action_display())
+
 class hReview(LocationAwareMicroformat):
     """
     hReview is a simple, open, distributed format, suitable for embedding
@@ -942,6 +1383,26 @@ class hReview(LocationAwareMicroformat):
             choices=TIMEZONE,
             help_text=_("Hour(s) from GMT")
             )
+    # dtreviewed, dtstart and dtend converted to UTC using tz - see
+    # timezones.py
+    dtreviewed_utc = models.DateTimeField(
+            null=True,
+            blank=True,
+            editable=False,
+            db_index=True
+            )
+    dtstart_utc = models.DateTimeField(
+            null=True,
+            blank=True,
+            editable=False,
+            db_index=True
+            )
+    dtend_utc = models.DateTimeField(
+            null=True,
+            blank=True,
+            editable=False,
+            db_index=True
+            )
     
     class Meta:
         verbose_name = _('hReview')
@@ -1092,6 +1553,45 @@ class xfn(models.Model):
         else:
             return self.target 
 
+class FeedManager(models.Manager):
+    """
+    Finds hFeeds by their (normalised) categories - see feed_tag. Tags can be
+    given as they were typed.
+    """
+    def _names(self, tags):
+        names = set([normalise_tag(tag) for tag in tags])
+        names.discard(u'')
+        return list(names)
+
+    def tagged_any(self, *tags):
+        """
+        The feeds with at least one of the tags
+        """
+        names = self._names(tags)
+        if not names:
+            return self.none()
+        return self.filter(tags__name__in=names).distinct()
+
+    def tagged_all(self, *tags):
+        """
+        The feeds with every one of the tags
+        """
+        names = self._names(tags)
+        if not names:
+            return self.none()
+        return self.filter(tags__name__in=names).annotate(
+                matched_tags=models.Count('tags')).filter(
+                        matched_tags=len(names))
+
+    def tag_counts(self, min_count=1):
+        """
+        A list of (tag, number of feeds) tuples, most used first
+        """
+        rows = feed_tag.objects.values('name').annotate(
+                count=models.Count('id')).filter(
+                        count__gte=min_count).order_by('-count', 'name')
+        return [(row['name'], row['count']) for row in rows]
+
 class hFeed(models.Model):
     """
     The hFeed model is used for representing feeds in the hAtom microformat.
@@ -1112,6 +1612,8 @@ class hFeed(models.Model):
             help_text=_('A comma-separated list of keywords or phrases')
             )
 
+    objects = FeedManager()
+
     class Meta:
         verbose_name = _('hFeed');
         verbose_name_plural = _('hFeeds')
@@ -1122,6 +1624,76 @@ class hFeed(models.Model):
         else:
             return _('Uncategorized feed')
 
+class feed_tag(models.Model):
+    """
+    One of the categories of an hFeed, normalised so feeds can be found by
+    tag with an index lookup rather than a LIKE over the text. Kept in step
+    with hFeed.category by microformats.tags - don't edit the rows by hand.
+    """
+    hfeed = models.ForeignKey(
+            hFeed,
+            related_name='tags'
+            )
+    # The normalised tag (see utils.normalise_tag)
+    name = models.CharField(
+            _('Tag'),
+            max_length=255
+            )
+    # The tag as it was typed
+    label = models.CharField(
+            _('Label'),
+            max_length=255
+            )
+
+    class Meta:
+        verbose_name = _('hFeed tag')
+        verbose_name_plural = _('hFeed tags')
+        unique_together = (('hfeed', 'name'),)
+        # In the order they appear in the category
+        ordering = ('id',)
+
+    def __unicode__(self):
+        return self.label
+
+class entry_author(models.Model):
+    """
+    The canonical form of an hEntry author. Entries whose author is spelled
+    the same (ignoring case, spacing and punctuation) share a row, which can
+    optionally be linked to the author's hCard. Filled in (and the entries
+    counted) by microformats.authors.
+    """
+    name = models.CharField(
+            _('Name'),
+            max_length=256
+            )
+    # The normalised name (see authors.normalise_author)
+    key = models.CharField(
+            _('Key'),
+            max_length=256,
+            unique=True
+            )
+    hcard = models.ForeignKey(
+            hCard,
+            null=True,
+            blank=True,
+            related_name='entry_authors',
+            help_text=_('The hCard of the author (optional)')
+            )
+    # The number of entries by the author
+    entry_count = models.IntegerField(
+            _('Entries'),
+            default=0,
+            editable=False
+            )
+
+    class Meta:
+        verbose_name = _('hEntry author')
+        verbose_name_plural = _('hEntry authors')
+        ordering = ('name',)
+
+    def __unicode__(self):
+        return self.name
+
 class hEntry(models.Model):
     """
     The hEntry model is used for representing entries in the hAtom microformat.
@@ -1183,6 +1755,14 @@ class hEntry(models.Model):
             default=_('Anonymous'),
             help_text=_('Defaults to "Anonymous" if not supplied')
             )
+    # The canonical author, filled in from the author by microformats.authors
+    canonical_author = models.ForeignKey(
+            entry_author,
+            null=True,
+            blank=True,
+            editable=False,
+            related_name='entries'
+            )
     # A permalink to the referenced entry
     bookmark = models.URLField(
             _('Bookmark (permalink)'),
@@ -1207,6 +1787,36 @@ class hEntry(models.Model):
                 self.updated.strftime('%c')
                 )
 
+class entry_archive(models.Model):
+    """
+    The number of entries (hEntry and hNews) of a feed updated in a month, for
+    archive lists and the admin date drill-down. Kept up to date by
+    microformats.archives - don't edit the rows by hand.
+    """
+    hfeed = models.ForeignKey(
+            hFeed,
+            null=True,
+            related_name='archives'
+            )
+    year = models.PositiveIntegerField(
+            _('Year')
+            )
+    month = models.PositiveIntegerField(
+            _('Month')
+            )
+    count = models.PositiveIntegerField(
+            _('Count'),
+            default=0
+            )
+
+    class Meta:
+        verbose_name = _('hEntry archive month')
+        verbose_name_plural = _('hEntry archive months')
+        unique_together = (('hfeed', 'year', 'month'),)
+
+    def __unicode__(self):
+        return u'%d-%02d: %d' % (self.year, self.month, self.count)
+
 class hNews(hEntry, LocationAwareMicroformat):
     """
     The hNews model is used for representing online news content.
@@ -1274,7 +1884,7 @@ class hNews(hEntry, LocationAwareMicroformat):
         """
         result = u', '.join((x for x in (
             self.locality, 
-            self.country_name and self.get_country_name_display() or self.country_name, 
+            self.country_name and country_name_display(self.country_name), 
             ) if x and x.strip()))
         if result:
             return result
@@ -1588,7 +2198,7 @@ class adr(models.Model):
             self.extended_address,
             self.locality, 
             self.region, 
-            self.get_country_name_display(), 
+            country_name_display(self.country_name), 
             self.postal_code,
             self.post_office_box) if x.strip()))
          if result:
@@ -1962,3 +2572,330 @@ class mailer(models.Model):
 
     def __unicode__(self):
         return self.name
+
+##########################################
+# Lookup tables maintained by the signals
+##########################################
+
+class phone_number(models.Model):
+    """
+    A normalised (digits only / E.164 style) copy of a telephone number held
+    in one of the other models. Used for reverse ("caller-ID") lookups - see
+    phones.py.
+    """
+    # The lower case name of the model holding the telephone number and the
+    # primary key of the instance
+    model = models.CharField(
+            _('Model'),
+            max_length=32
+            )
+    object_id = models.PositiveIntegerField(
+            _('Object ID')
+            )
+    # The name of the field holding the telephone number
+    field = models.CharField(
+            _('Field'),
+            max_length=32
+            )
+    number = models.CharField(
+            _('Normalised number'),
+            max_length=32,
+            db_index=True
+            )
+
+    class Meta:
+        verbose_name = _('Normalised Telephone Number')
+        verbose_name_plural = _('Normalised Telephone Numbers')
+        unique_together = (('model', 'object_id', 'field'),)
+
+    def __unicode__(self):
+        return self.number
+
+class email_address(models.Model):
+    """
+    A lower cased copy of an email address held in one of the other models.
+    Used to find the owners of an address without case-insensitive scans of
+    several tables - see emails.py.
+    """
+    # The lower case name of the model holding the address and the primary
+    # key of the instance
+    model = models.CharField(
+            _('Model'),
+            max_length=32
+            )
+    object_id = models.PositiveIntegerField(
+            _('Object ID')
+            )
+    # The name of the field holding the address
+    field = models.CharField(
+            _('Field'),
+            max_length=32
+            )
+    address = models.CharField(
+            _('Email address'),
+            max_length=75,
+            db_index=True
+            )
+
+    class Meta:
+        verbose_name = _('Indexed Email Address')
+        verbose_name_plural = _('Indexed Email Addresses')
+        unique_together = (('model', 'object_id', 'field'),)
+
+    def __unicode__(self):
+        return self.address
+
+class geo_cluster(models.Model):
+    """
+    The number and centroid of the geo-tagged rows of a model that fall into
+    a grid cell at a map zoom level. Used for server-side marker clustering -
+    see clusters.py.
+    """
+    zoom = models.PositiveSmallIntegerField(
+            _('Zoom level')
+            )
+    # The position of the cell in the grid for this zoom level
+    cell_x = models.IntegerField(
+            _('Cell X')
+            )
+    cell_y = models.IntegerField(
+            _('Cell Y')
+            )
+    # The lower case name of the clustered model
+    model = models.CharField(
+            _('Model'),
+            max_length=32
+            )
+    count = models.PositiveIntegerField(
+            _('Count'),
+            default=0
+            )
+    # The centroid is latitude_sum / count, longitude_sum / count
+    latitude_sum = models.FloatField(
+            _('Sum of latitudes'),
+            default=0.0
+            )
+    longitude_sum = models.FloatField(
+            _('Sum of longitudes'),
+            default=0.0
+            )
+    # The primary key of one of the rows in the cluster
+    representative = models.PositiveIntegerField(
+            _('Representative object ID')
+            )
+    updated = models.DateTimeField(
+            _('Updated on'),
+            auto_now=True
+            )
+
+    class Meta:
+        verbose_name = _('Geo Cluster')
+        verbose_name_plural = _('Geo Clusters')
+        unique_together = (('zoom', 'cell_x', 'cell_y', 'model'),)
+
+    def __unicode__(self):
+        return u'%s: %d @ %d/%d/%d' % (self.model, self.count, self.zoom,
+                self.cell_x, self.cell_y)
+
+class geo_cluster_zoom(models.Model):
+    """
+    When the clusters of a zoom level last changed in a way the updated
+    column of geo_cluster can't show (cells being emptied and deleted). Used
+    with it for the Last-Modified of the geo_clusters view - see clusters.py.
+    """
+    zoom = models.PositiveSmallIntegerField(
+            _('Zoom level'),
+            unique=True
+            )
+    changed = models.DateTimeField(
+            _('Changed on')
+            )
+
+    class Meta:
+        verbose_name = _('Geo Cluster Zoom Level')
+        verbose_name_plural = _('Geo Cluster Zoom Levels')
+
+    def __unicode__(self):
+        return u'%d: %s' % (self.zoom, self.changed)
+
+class occurrence(models.Model):
+    """
+    A single occurrence of an hCalendar event. Events that repeat have one for
+    every repeat up to a rolling horizon so date range queries are a scan of
+    the start index - see recurrence.py.
+    """
+    event = models.ForeignKey(
+            hCalendar,
+            related_name='occurrences'
+            )
+    start = models.DateTimeField(
+            _('Start'),
+            db_index=True
+            )
+    # Null when the event has no end
+    end = models.DateTimeField(
+            _('End'),
+            null=True,
+            blank=True
+            )
+
+    class Meta:
+        verbose_name = _('Occurrence')
+        verbose_name_plural = _('Occurrences')
+        unique_together = (('event', 'start'),)
+        ordering = ('start',)
+
+    def __unicode__(self):
+        return u"%s - %s"%(self.start.strftime('%a %b %d %Y, %I:%M%p'),
+                self.event.summary)
+
+class review_aggregate(models.Model):
+    """
+    The number, total, lowest, highest and histogram of the ratings of the
+    hReviews of an item (identified by its normalised name and type). Kept
+    up to date as reviews are saved and deleted - see ratings.py.
+    """
+    item_key = models.CharField(
+            _('Normalised item name'),
+            max_length=256
+            )
+    type = models.CharField(
+            _('Item Type'),
+            max_length=8,
+            blank=True,
+            choices=hReview.ITEM_TYPE
+            )
+    # The name of the item as it appears in the most recent review
+    fn = models.CharField(
+            _('Item Name'),
+            max_length=256
+            )
+    count = models.PositiveIntegerField(
+            _('Number of reviews'),
+            default=0
+            )
+    rating_sum = models.PositiveIntegerField(
+            _('Total of the ratings'),
+            default=0
+            )
+    rating_min = models.PositiveIntegerField(
+            _('Lowest rating'),
+            null=True,
+            blank=True
+            )
+    rating_max = models.PositiveIntegerField(
+            _('Highest rating'),
+            null=True,
+            blank=True
+            )
+    # The histogram of the ratings (one column for each of hReview.RATINGS)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(
+            _('Updated'),
+            auto_now=True
+            )
+
+    class Meta:
+        verbose_name = _('Review Aggregate')
+        verbose_name_plural = _('Review Aggregates')
+        unique_together = (('item_key', 'type'),)
+
+    def __unicode__(self):
+        return u'%s: %s/5 (%d)' % (self.fn, self.average(), self.count)
+
+    def average(self):
+        """
+        The mean rating to one decimal place (as in the hReview rating)
+        """
+        if not self.count:
+            return None
+        return round(float(self.rating_sum) / self.count, 1)
+
+    def histogram(self):
+        """
+        A list of (rating, number of reviews) tuples
+        """
+        return [(rating, getattr(self, 'rating_%d' % rating)) for rating, name
+                in hReview.RATINGS]
+
+    def best(self):
+        return hReview.RATINGS[-1][0]
+
+    def worst(self):
+        return hReview.RATINGS[0][0]
+
+class xfn_edge(models.Model):
+    """
+    The adjacency index of the XFN graph: one row per xfn link holding the
+    normalised URL it points at, so "who links to this URL" and "who does
+    this user link to" are index scans. Kept up to date by
+    microformats.graph - don't edit the rows by hand.
+    """
+    link = models.OneToOneField(
+            xfn,
+            related_name='edge'
+            )
+    # Copied from the link so the graph can be walked without joining it
+    source = models.ForeignKey(
+            User,
+            related_name='xfn_edges'
+            )
+    url_key = models.CharField(
+            _('Normalised URL'),
+            max_length=255
+            )
+
+    class Meta:
+        verbose_name = _('XFN graph edge')
+        verbose_name_plural = _('XFN graph edges')
+
+    def __unicode__(self):
+        return u'%s -> %s' % (self.source, self.url_key)
+
+class url_identity(models.Model):
+    """
+    The person (or organisation) behind a normalised URL. URLs claimed with
+    rel="me" by the same user share an identity, so every URL of a person can
+    be collapsed to one id with a single indexed lookup. Kept up to date by
+    microformats.identities - don't edit the rows by hand.
+    """
+    url_key = models.CharField(
+            _('Normalised URL'),
+            max_length=255,
+            unique=True
+            )
+    # The pk of one of the rows for the identity's URLs
+    identity = models.IntegerField(
+            _('Identity'),
+            db_index=True
+            )
+
+    class Meta:
+        verbose_name = _('URL identity')
+        verbose_name_plural = _('URL identities')
+
+    def __unicode__(self):
+        return u'%s (%d)' % (self.url_key, self.identity)
+
+#################################################################
+# Subsystems that keep themselves up to date by listening to the
+# signals of the models defined above
+#################################################################
+import microformats.vocabulary
+import microformats.phones
+import microformats.emails
+import microformats.spatial
+import microformats.clusters
+import microformats.recurrence
+import microformats.timezones
+import microformats.prices
+import microformats.ratings
+import microformats.graph
+import microformats.identities
+import microformats.tags
+import microformats.authors
+import microformats.archives
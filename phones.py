@@ -0,0 +1,165 @@
+# -*- coding: UTF-8 -*-
+"""
+Normalisation and reverse lookup of the telephone numbers stored by the
+microformat models.
+
+Telephone numbers are free text (e.g. "+44(0)1234 567876") so each one is
+reduced to a canonical key that is stored in the indexed phone_number table
+whenever an instance is saved. find_by_phone() then answers "who has this
+number?" with a single indexed lookup.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import re
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+
+from microformats.models import hCard, tel, hListing, hReview, phone_number
+from microformats.utils import chunked_queryset, model_name, index_fields,\
+        CHUNK_SIZE
+
+# The country calling code assumed for numbers without an international
+# prefix (over-ridden in settings.py). When set, "01234 567876" and
+# "+44 1234 567876" normalise to the same key.
+PHONE_DEFAULT_COUNTRY_CODE = None
+
+# The models (and their fields) holding telephone numbers
+PHONE_FIELDS = {
+        hCard: ('tel_work', 'tel_home', 'tel_fax'),
+        tel: ('value',),
+        hListing: ('lister_tel',),
+        hReview: ('tel',),
+        }
+
+NON_DIGIT = re.compile(r'\D')
+# Extensions are ignored: "01234 567876 ext. 123"
+EXTENSION = re.compile(r'\s*(?:ext|x|#)\.?\s*\d+\s*$', re.IGNORECASE)
+
+def default_country_code():
+    return getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', False) and\
+            settings.PHONE_DEFAULT_COUNTRY_CODE or PHONE_DEFAULT_COUNTRY_CODE
+
+def normalise_phone(value, country_code=None):
+    """
+    Returns the canonical key for a telephone number.
+
+    International numbers (starting with "+" or "00") become E.164 style
+    strings: "+44(0)1234 567876" -> "+441234567876" (the "(0)" trunk prefix
+    is dropped). National numbers are converted to E.164 if a country code is
+    passed in (or configured in settings.PHONE_DEFAULT_COUNTRY_CODE) otherwise
+    they are reduced to their digits. Returns an empty string if there are no
+    digits.
+    """
+    if not value:
+        return u''
+    value = EXTENSION.sub(u'', value.strip())
+    value = value.replace(u'(0)', u'')
+    digits = NON_DIGIT.sub(u'', value)
+    if not digits:
+        return u''
+    if value.startswith(u'+'):
+        return u'+' + digits
+    if digits.startswith(u'00'):
+        return u'+' + digits[2:]
+    country_code = country_code or default_country_code()
+    if country_code:
+        return u'+%s%s' % (country_code, digits.lstrip(u'0'))
+    return digits
+
+MODELS = dict((model_name(m), m) for m in PHONE_FIELDS)
+
+def index_phone_numbers(instance, model=None):
+    """
+    Indexes the normalised telephone numbers of the instance in phone_number.
+    Pass the model class if the instance was loaded with only() or defer().
+    """
+    model = model or instance.__class__
+    index_fields(phone_number, 'number', instance, model,
+            PHONE_FIELDS[model], normalise_phone)
+
+def update_phone_index(sender, instance, **kwargs):
+    """
+    post_save signal handler.
+    """
+    index_phone_numbers(instance)
+
+def remove_from_phone_index(sender, instance, **kwargs):
+    """
+    post_delete signal handler.
+    """
+    phone_number.objects.filter(model=model_name(sender),
+            object_id=instance.pk).delete()
+
+for model in PHONE_FIELDS:
+    post_save.connect(update_phone_index, sender=model)
+    post_delete.connect(remove_from_phone_index, sender=model)
+
+def find_by_phone(value, models=None):
+    """
+    Returns a list of the instances (hCard, tel, hListing or hReview) holding
+    a telephone number that normalises to the same key as value. Pass a list
+    of model classes to limit the search.
+
+    One indexed query finds the matches and then one query per model fetches
+    the instances.
+    """
+    number = normalise_phone(value)
+    if not number:
+        return []
+    rows = phone_number.objects.filter(number=number)
+    if models:
+        rows = rows.filter(model__in=[model_name(m) for m in models])
+    ids = {}
+    for name, object_id in rows.values_list('model', 'object_id'):
+        ids.setdefault(name, set()).add(object_id)
+    result = []
+    for name in sorted(ids):
+        found = MODELS[name].objects.in_bulk(list(ids[name]))
+        result.extend(found[pk] for pk in sorted(found))
+    return result
+
+def backfill_phone_index(models=None, chunk_size=CHUNK_SIZE):
+    """
+    Indexes the telephone numbers of all existing rows, reading them in
+    chunks. Returns the number of instances processed.
+    """
+    count = 0
+    for model in models or PHONE_FIELDS.keys():
+        fields = PHONE_FIELDS[model]
+        for chunk in chunked_queryset(model.objects.only(*fields), chunk_size):
+            for instance in chunk:
+                index_phone_numbers(instance, model)
+            count += len(chunk)
+    return count
@@ -0,0 +1,240 @@
+# -*- coding: UTF-8 -*-
+"""
+Parses the free text hListing price ("£1,250 ono", "EUR 99.50", "$1.5k") into
+an amount and an ISO 4217 currency code.
+
+The results are stored in the indexed price_amount and price_currency columns
+of hListing (filled in just before a listing is saved) so searching for and
+sorting by price are done by the database rather than by parsing every row.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import re
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import pre_save
+
+from microformats.models import hListing
+from microformats.utils import chunked_queryset, CHUNK_SIZE
+
+# The currency of prices that don't mention one (over-ridden in settings.py
+# with PRICE_DEFAULT_CURRENCY). Blank means unknown.
+PRICE_DEFAULT_CURRENCY = ''
+
+# Symbols (longest first so "US$" isn't mistaken for "$")
+CURRENCY_SYMBOLS = (
+        (u'US$', 'USD'),
+        (u'AU$', 'AUD'),
+        (u'A$', 'AUD'),
+        (u'CA$', 'CAD'),
+        (u'C$', 'CAD'),
+        (u'NZ$', 'NZD'),
+        (u'HK$', 'HKD'),
+        (u'£', 'GBP'),
+        (u'€', 'EUR'),
+        (u'¥', 'JPY'),
+        (u'₹', 'INR'),
+        (u'$', 'USD'),
+        )
+
+CURRENCY_CODES = ('AUD', 'CAD', 'CHF', 'CNY', 'DKK', 'EUR', 'GBP', 'HKD',
+        'INR', 'JPY', 'NOK', 'NZD', 'SEK', 'USD', 'ZAR')
+
+CURRENCY_WORDS = {
+        'pound': 'GBP',
+        'pounds': 'GBP',
+        'quid': 'GBP',
+        'euro': 'EUR',
+        'euros': 'EUR',
+        'dollar': 'USD',
+        'dollars': 'USD',
+        'yen': 'JPY',
+        }
+
+CODE = re.compile(r'\b(%s)\b' % '|'.join(CURRENCY_CODES), re.IGNORECASE)
+WORD = re.compile(r'\b(%s)\b' % '|'.join(CURRENCY_WORDS), re.IGNORECASE)
+FREE = re.compile(r'\bfree\b', re.IGNORECASE)
+# Whole units (optionally grouped in thousands with commas, full stops or
+# spaces), an optional fraction of one or two digits and an optional
+# thousands (k) or millions (m) suffix
+NUMBER = re.compile(r'(\d{1,3}(?:([,. ])\d{3})(?:\2\d{3})*|\d+)'\
+        r'(?:[.,](\d{1,2}))?(?!\d)(?:\s?([km])\b)?', re.IGNORECASE)
+MULTIPLIERS = {'k': 1000, 'm': 1000000}
+# "Was £20 now £15": the price is the one after "now"
+WAS_NOW = re.compile(r'\bwas\b.*?\bnow\b', re.IGNORECASE | re.DOTALL)
+CENTS = Decimal('0.01')
+
+def _default_currency():
+    return getattr(settings, 'PRICE_DEFAULT_CURRENCY', False) and\
+            settings.PRICE_DEFAULT_CURRENCY or PRICE_DEFAULT_CURRENCY
+
+def _mention(text):
+    """
+    Returns a (code, start, end) tuple for the first mention of the currency
+    in the text (symbols before codes before words), or None
+    """
+    for symbol, code in CURRENCY_SYMBOLS:
+        start = text.find(symbol)
+        if start != -1:
+            return code, start, start + len(symbol)
+    match = CODE.search(text)
+    if match:
+        return match.group(1).upper(), match.start(), match.end()
+    match = WORD.search(text)
+    if match:
+        return CURRENCY_WORDS[match.group(1).lower()], match.start(),\
+                match.end()
+    return None
+
+def parse_currency(text):
+    """
+    Returns the ISO 4217 code of the currency mentioned in the text (or the
+    default currency)
+    """
+    mention = _mention(text)
+    return mention and mention[0] or _default_currency()
+
+def _number(text, mention):
+    """
+    Returns the match of the number just after (or else just before) the
+    mention of the currency, or the first number in the text.
+    """
+    if mention:
+        code, start, end = mention
+        after = end + len(text[end:]) - len(text[end:].lstrip())
+        match = NUMBER.match(text, after)
+        if match:
+            return match
+        for match in NUMBER.finditer(text, 0, start):
+            if not text[match.end():start].strip():
+                return match
+    return NUMBER.search(text)
+
+def parse_price(text):
+    """
+    Returns an (amount, currency) tuple for the free text price. amount is a
+    Decimal (or None if there's no price in the text) and currency an ISO
+    4217 code (or '' if unknown). The amount is the number next to the
+    currency ("2 bed flat, £850 pcm" is 850) or the first number if there's
+    no currency. Where the text holds a range ("£100 - £150") the first
+    figure is used and "was £20 now £15" is 15.
+    """
+    if not text:
+        return None, ''
+    text = unicode(text)
+    currency = parse_currency(text)
+    was = WAS_NOW.search(text)
+    if was and NUMBER.search(text, was.end()):
+        text = text[was.end():]
+    mention = _mention(text)
+    if mention:
+        currency = mention[0]
+    match = _number(text, mention)
+    if not match:
+        if FREE.search(text):
+            return Decimal('0.00'), currency
+        return None, ''
+    whole, separator, fraction, multiplier = match.groups()
+    if separator:
+        whole = whole.replace(separator, '')
+    amount = Decimal('%s.%s' % (whole, fraction or '0'))
+    if multiplier:
+        amount *= MULTIPLIERS[multiplier.lower()]
+    return amount.quantize(CENTS), currency
+
+def set_price_fields(sender, instance, **kwargs):
+    """
+    pre_save signal handler.
+    """
+    instance.price_amount, instance.price_currency = parse_price(
+            instance.price)
+
+pre_save.connect(set_price_fields, sender=hListing)
+
+def price_between(low=None, high=None, currency=None, queryset=None):
+    """
+    Returns the listings (from the queryset if given) priced from low up to
+    and including high (either may be None for an open range), cheapest
+    first. Pass a currency code to only match prices in that currency.
+    """
+    if queryset is None:
+        queryset = hListing.objects.all()
+    queryset = queryset.filter(price_amount__isnull=False)
+    if currency:
+        queryset = queryset.filter(price_currency=currency.upper())
+    if low is not None:
+        queryset = queryset.filter(price_amount__gte=Decimal(str(low)))
+    if high is not None:
+        queryset = queryset.filter(price_amount__lte=Decimal(str(high)))
+    # No NULLs to put last, so (with a currency) the rows can be read in
+    # order from the (price_currency, price_amount) index
+    return order_by_price(queryset, nulls=False)
+
+def order_by_price(queryset, descending=False, nulls=True):
+    """
+    Orders listings by price. Listings without a price come last; pass
+    nulls=False if the queryset can't have any so the ordering can use the
+    price index.
+    """
+    if not nulls:
+        if descending:
+            return queryset.order_by('-price_amount', 'pk')
+        return queryset.order_by('price_amount', 'pk')
+    qn = connection.ops.quote_name
+    queryset = queryset.extra(select={'price_is_null': '%s.%s IS NULL' % (
+        qn(hListing._meta.db_table), qn('price_amount'))})
+    if descending:
+        return queryset.order_by('price_is_null', '-price_amount', 'pk')
+    return queryset.order_by('price_is_null', 'price_amount', 'pk')
+
+def _backfill_chunk(chunk):
+    for instance in chunk:
+        amount, currency = parse_price(instance.price)
+        hListing.objects.filter(pk=instance.pk).update(price_amount=amount,
+                price_currency=currency)
+    return len(chunk)
+_backfill_chunk = transaction.commit_on_success(_backfill_chunk)
+
+def backfill_prices(chunk_size=CHUNK_SIZE):
+    """
+    Parses the price of every existing listing, chunk_size rows at a time.
+    Each chunk is committed in its own transaction. Returns the number of
+    listings processed.
+    """
+    count = 0
+    for chunk in chunked_queryset(hListing.objects.only('price'), chunk_size):
+        count += _backfill_chunk(chunk)
+    return count
@@ -0,0 +1,293 @@
+# -*- coding: UTF-8 -*-
+"""
+Works out which fields of a model a microformat template actually uses so
+that querysets rendered with it can be narrowed with only() and
+select_related().
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import re
+
+from django.template import Template, Node, Variable, FilterExpression
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
+from django.template.loader import select_template
+from django.template.defaulttags import ForNode
+from django.template.loader_tags import IncludeNode, ExtendsNode
+
+# Matches the get_FOO_display methods Django adds for fields with choices
+DISPLAY = re.compile(r'^get_(\w+)_display$')
+
+# (model, template name, name, included templates) -> projection
+_projections = {}
+
+class _Unknown(Exception):
+    """
+    Raised when a template uses the instance in a way we can't see through
+    (e.g. passes it whole to a filter or includes a template whose name we
+    can't work out). The queryset is then left alone.
+    """
+    pass
+
+def _load(template_name):
+    return select_template([template_name,])
+
+def _included(value, includes):
+    """
+    Returns the template an {% include %} refers to. Template names held in
+    context variables are looked up in includes.
+    """
+    if isinstance(value, FilterExpression):
+        value = value.var
+    if isinstance(value, basestring):
+        return _load(value)
+    if value.lookups is None:
+        return _load(value.literal)
+    if len(value.lookups) == 1 and value.lookups[0] in includes:
+        return _load(includes[value.lookups[0]])
+    raise _Unknown
+
+def _walk(value, name, includes, paths, seen, loops=None):
+    """
+    Adds the attribute lookups made on the variable called name anywhere in
+    value (a template, node, filter expression or list of them) to paths as
+    tuples, e.g. {{instance.updated.isoformat}} adds ('updated', 'isoformat').
+    If loops is a set, the names {% for %} loops over the variable give its
+    items are added to it (rather than the loop being an unknown use).
+
+    Nodes we know nothing about are searched attribute by attribute so that
+    the arguments of custom tags are seen as well.
+    """
+    if isinstance(value, Variable):
+        if value.lookups and value.lookups[0] == name:
+            if len(value.lookups) == 1:
+                raise _Unknown
+            paths.add(tuple(value.lookups[1:]))
+    elif isinstance(value, FilterExpression):
+        var = value.var
+        filters = value.filters
+        if isinstance(var, Variable) and var.lookups == (name,) and filters\
+                and hasattr(filters[0][0], 'fields_used'):
+            # e.g. {{instance|adr_country_name}}
+            for field in filters[0][0].fields_used:
+                paths.add((field,))
+        else:
+            _walk(var, name, includes, paths, seen, loops)
+        for func, args in filters:
+            _walk(args, name, includes, paths, seen, loops)
+    elif isinstance(value, (Node, Template)):
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+        if isinstance(value, Template):
+            _walk(value.nodelist, name, includes, paths, seen, loops)
+        elif isinstance(value, IncludeNode):
+            _walk(_included(value.template_name, includes), name, includes,
+                    paths, seen, loops)
+        elif loops is not None and isinstance(value, ForNode) and\
+                isinstance(value.sequence.var, Variable) and\
+                value.sequence.var.lookups == (name,) and\
+                not value.sequence.filters and len(value.loopvars) == 1:
+            # e.g. {% for entry in entries %}
+            loops.add(value.loopvars[0])
+            _walk([value.nodelist_loop, value.nodelist_empty], name,
+                    includes, paths, seen, loops)
+        else:
+            if isinstance(value, ExtendsNode):
+                if not value.parent_name:
+                    raise _Unknown
+                _walk(_load(value.parent_name), name, includes, paths, seen,
+                        loops)
+            _walk(value.__dict__.values(), name, includes, paths, seen,
+                    loops)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _walk(item, name, includes, paths, seen, loops)
+    elif isinstance(value, dict):
+        _walk(value.values(), name, includes, paths, seen, loops)
+
+def template_paths(template, name='instance', includes=None):
+    """
+    Returns the set of attribute lookups (as tuples) the template makes on
+    the variable called name, or None if it uses the variable in a way that
+    can't be worked out from the template alone.
+
+    template is a template name or a Template. includes maps the context
+    variables used by {% include %} to the names of the templates they hold.
+    Custom tags that look variables up by a raw name rather than through
+    Variable can't be seen.
+    """
+    if isinstance(template, basestring):
+        template = _load(template)
+    paths = set()
+    try:
+        _walk(template, name, includes or {}, paths, set())
+    except _Unknown:
+        return None
+    return paths
+
+def loop_names(template, sequence, includes=None):
+    """
+    Returns the set of names the template's {% for %} loops over the
+    variable called sequence give its items (e.g. set(['e']) for
+    {% for e in entries %}), or None if the variable is used any other way
+    (filtered, indexed, tested...).
+    """
+    if isinstance(template, basestring):
+        template = _load(template)
+    paths = set()
+    loops = set()
+    try:
+        _walk(template, sequence, includes or {}, paths, set(), loops)
+    except _Unknown:
+        return None
+    if paths:
+        return None
+    return loops
+
+def _relations(model):
+    """
+    Returns the names of the related managers (many to many fields and the
+    reverse accessors of other models' relations) on the model.
+    """
+    opts = model._meta
+    names = set([field.name for field in opts.many_to_many])
+    for related in opts.get_all_related_objects() +\
+            opts.get_all_related_many_to_many_objects():
+        names.add(related.get_accessor_name())
+    return names
+
+def projection(model, paths):
+    """
+    Turns the attribute lookups made by a template into a (fields, related)
+    tuple: the names of the model's fields to load and the foreign keys to
+    follow with select_related(). Returns None if something other than a
+    field or related manager is used (e.g. a method or property whose fields
+    we can't know).
+    """
+    if paths is None:
+        return None
+    opts = model._meta
+    by_name = {}
+    for field in opts.fields:
+        by_name[field.name] = field
+        by_name[field.attname] = field
+    managers = _relations(model)
+    fields = set()
+    related = set()
+    for path in paths:
+        attr = path[0]
+        if attr == 'pk':
+            continue
+        match = DISPLAY.match(attr)
+        if match and match.group(1) in by_name:
+            attr = match.group(1)
+        if attr in managers:
+            # Only needs the primary key, which is always loaded
+            continue
+        if attr not in by_name:
+            return None
+        field = by_name[attr]
+        if field.primary_key:
+            continue
+        fields.add(field.name)
+        if field.rel and attr == field.name and (len(path) == 1 or
+                path[1] not in ('pk', field.rel.get_related_field().attname)):
+            related.add(field.name)
+    return fields, related
+
+def _loop_paths(template_name, sequence, includes):
+    template = _load(template_name)
+    names = loop_names(template, sequence, includes)
+    if names is None:
+        return None
+    paths = set()
+    for name in names:
+        found = template_paths(template, name, includes)
+        if found is None:
+            return None
+        paths.update(found)
+    return paths
+
+def template_projection(model, template_name, name='instance',
+        includes=None, sequence=None):
+    """
+    As projection() for the instances of model rendered with the named
+    template as the variable called name or, if sequence is given, as the
+    items of the {% for %} loops over the variable called sequence (whatever
+    the loops call them). The result is cached per model, template and
+    variable.
+
+    A template that never mentions the variable tells us nothing (e.g. it
+    loops with another name) so it is treated like one we can't work out.
+    """
+    includes = includes or {}
+    key = (model, template_name, sequence and (sequence,) or name,
+            tuple(sorted(includes.items())))
+    if key not in _projections:
+        try:
+            if sequence:
+                paths = _loop_paths(template_name, sequence, includes)
+            else:
+                paths = template_paths(template_name, name, includes)
+        except (TemplateDoesNotExist, TemplateSyntaxError):
+            # Rendering will report the problem
+            paths = None
+        _projections[key] = projection(model, paths or None)
+    return _projections[key]
+
+def narrow(queryset, template_name, name='instance', includes=None,
+        sequence=None):
+    """
+    Returns the queryset loading only the fields (and following only the
+    foreign keys) that template_name uses on the variable called name (or
+    on the items of the loops over sequence, see template_projection()), or
+    the queryset as it is if that can't be worked out.
+
+    The instances are meant for display: saving a deferred instance skips
+    the signal handlers connected to its model.
+    """
+    result = template_projection(queryset.model, template_name, name,
+            includes, sequence)
+    if result is None:
+        return queryset
+    fields, related = result
+    if related:
+        queryset = queryset.select_related(*sorted(related))
+    return queryset.only(*(sorted(fields) or [queryset.model._meta.pk.name]))
+
+def clear_cache():
+    """
+    Forgets the cached projections (e.g. after the templates have changed)
+    """
+    _projections.clear()
@@ -0,0 +1,194 @@
+# -*- coding: UTF-8 -*-
+"""
+Materialised rating aggregates for hReviews.
+
+Reviews of the same item (the same type and name once case, punctuation and
+spacing are ignored) share a review_aggregate row holding the count, total,
+lowest and highest rating and a histogram of the ratings. The row is adjusted
+as reviews are saved and deleted so showing the average rating of an item
+is a single lookup rather than an aggregate over all its reviews.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from microformats.models import hReview, review_aggregate
+from microformats.utils import chunked_queryset, CHUNK_SIZE
+
+RATINGS = [rating for rating, name in hReview.RATINGS]
+
+NOT_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+def normalise_item(fn):
+    """
+    Returns the key used to group the reviews of an item: the name in lower
+    case with punctuation removed and the spacing collapsed
+    """
+    return u' '.join(NOT_WORD.sub(u' ', fn or u'').lower().split())
+
+def _counts(rating, delta):
+    result = {
+            'count': F('count') + delta,
+            'rating_sum': F('rating_sum') + delta * rating,
+            }
+    if rating in RATINGS:
+        column = 'rating_%d' % rating
+        result[column] = F(column) + delta
+    return result
+
+def _fix_extremes(rows):
+    # The lowest and highest ratings are read from the histogram so removing
+    # a review never means looking at the other reviews
+    for row in rows:
+        ratings = [r for r, n in row.histogram() if n > 0]
+        row.rating_min = ratings and ratings[0] or None
+        row.rating_max = ratings and ratings[-1] or None
+        review_aggregate.objects.filter(pk=row.pk).update(
+                rating_min=row.rating_min, rating_max=row.rating_max)
+
+def add_rating(fn, type, rating):
+    """
+    Adds a rating to the aggregate of the item
+    """
+    key = normalise_item(fn)
+    rows = review_aggregate.objects.filter(item_key=key, type=type)
+    if not rows.update(fn=fn, **_counts(rating, 1)):
+        sid = transaction.savepoint()
+        try:
+            histogram = dict(('rating_%d' % r, int(r == rating)) for r in
+                    RATINGS)
+            review_aggregate.objects.create(item_key=key, type=type, fn=fn,
+                    count=1, rating_sum=rating, rating_min=rating,
+                    rating_max=rating, **histogram)
+            transaction.savepoint_commit(sid)
+            return
+        except IntegrityError:
+            # Somebody else created the row in the meantime
+            transaction.savepoint_rollback(sid)
+            rows.update(fn=fn, **_counts(rating, 1))
+    _fix_extremes(rows)
+
+def remove_rating(fn, type, rating):
+    """
+    Removes a rating from the aggregate of the item
+    """
+    rows = review_aggregate.objects.filter(item_key=normalise_item(fn),
+            type=type)
+    rows.update(**_counts(rating, -1))
+    rows.filter(count__lte=0).delete()
+    _fix_extremes(rows)
+
+def _key(fn, type, rating):
+    return normalise_item(fn), type, rating
+
+def remember_old_rating(sender, instance, **kwargs):
+    """
+    pre_save signal handler: makes a note of what the review used to say.
+    """
+    instance._old_rating = None
+    if instance.pk:
+        old = sender.objects.filter(pk=instance.pk).values_list('fn', 'type',
+                'rating')
+        if old:
+            instance._old_rating = old[0]
+
+def update_aggregate(sender, instance, **kwargs):
+    """
+    post_save signal handler.
+    """
+    old = getattr(instance, '_old_rating', None)
+    if old and _key(*old) == _key(instance.fn, instance.type,
+            instance.rating):
+        if old[0] != instance.fn:
+            # Keep the display name up to date
+            review_aggregate.objects.filter(item_key=normalise_item(
+                instance.fn), type=instance.type).update(fn=instance.fn)
+        return
+    if old:
+        remove_rating(*old)
+    add_rating(instance.fn, instance.type, instance.rating)
+
+def remove_from_aggregate(sender, instance, **kwargs):
+    """
+    post_delete signal handler.
+    """
+    remove_rating(instance.fn, instance.type, instance.rating)
+
+pre_save.connect(remember_old_rating, sender=hReview)
+post_save.connect(update_aggregate, sender=hReview)
+post_delete.connect(remove_from_aggregate, sender=hReview)
+
+def aggregate_for(fn, type=''):
+    """
+    Returns the review_aggregate of the item (or None if it hasn't been
+    reviewed)
+    """
+    rows = list(review_aggregate.objects.filter(item_key=normalise_item(fn),
+        type=type or ''))
+    return rows and rows[0] or None
+
+def rebuild_aggregates(chunk_size=CHUNK_SIZE):
+    """
+    Recomputes every review_aggregate from the hReviews, reading them in
+    chunks. Returns the number of items.
+    """
+    items = {}
+    queryset = hReview.objects.only('fn', 'type', 'rating')
+    for chunk in chunked_queryset(queryset, chunk_size):
+        for review in chunk:
+            key = (normalise_item(review.fn), review.type)
+            item = items.setdefault(key, {'fn': review.fn, 'count': 0,
+                'rating_sum': 0, 'ratings': dict((r, 0) for r in RATINGS)})
+            # The name from the most recent review is shown
+            item['fn'] = review.fn
+            item['count'] += 1
+            item['rating_sum'] += review.rating
+            if review.rating in item['ratings']:
+                item['ratings'][review.rating] += 1
+    review_aggregate.objects.all().delete()
+    for (key, type), item in items.iteritems():
+        ratings = [r for r in RATINGS if item['ratings'][r]]
+        histogram = dict(('rating_%d' % r, n) for r, n in
+                item['ratings'].iteritems())
+        review_aggregate.objects.create(item_key=key, type=type,
+                fn=item['fn'], count=item['count'],
+                rating_sum=item['rating_sum'],
+                rating_min=ratings and ratings[0] or None,
+                rating_max=ratings and ratings[-1] or None, **histogram)
+    return len(items)
+rebuild_aggregates = transaction.commit_on_success(rebuild_aggregates)
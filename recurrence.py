@@ -0,0 +1,223 @@
+# -*- coding: UTF-8 -*-
+"""
+Recurring hCalendar events.
+
+An hCalendar may repeat daily, weekly or monthly (every rrule_interval days,
+weeks or months) either forever, rrule_count times or until rrule_until, and
+skips the dates listed in exdates. This is a subset of the RFC2445 RRULE.
+
+Rather than storing a copy of the event for every repeat, each occurrence is
+written to the indexed occurrence table, so date range queries are always a
+scan of the occurrence start index. Events that don't repeat get a single
+occurrence so every event can be found the same way.
+
+Occurrences are only materialised up to a rolling horizon (OCCURRENCE_HORIZON
+from now): when an event is saved and by ./manage.py extend_occurrences,
+which should be run regularly (e.g. daily from cron) to move the horizon
+along. Queries never write, so they don't see occurrences beyond it.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+
+from microformats.models import hCalendar, occurrence
+from microformats.utils import chunked_queryset, parse_datetime, CHUNK_SIZE
+
+# How far ahead of now occurrences are materialised (over-ridden in
+# settings.py with OCCURRENCE_HORIZON)
+OCCURRENCE_HORIZON = datetime.timedelta(days=365)
+
+# The materialised_until of events with no more occurrences to add
+FOREVER = datetime.datetime(9999, 12, 31)
+
+def _horizon():
+    return getattr(settings, 'OCCURRENCE_HORIZON', False) and\
+            settings.OCCURRENCE_HORIZON or OCCURRENCE_HORIZON
+
+def _add_months(value, months):
+    month = value.month - 1 + months
+    try:
+        return value.replace(year=value.year + month // 12,
+                month=month % 12 + 1)
+    except ValueError:
+        # e.g. the 31st of a month with 30 days
+        return None
+
+def rule_starts(event):
+    """
+    Yields the start of every instance of the event's recurrence rule in
+    order (including the exceptions). Events that repeat forever yield
+    forever.
+    """
+    if not event.rrule_freq:
+        yield event.dtstart
+        return
+    interval = event.rrule_interval or 1
+    step = 0
+    count = 0
+    while True:
+        if event.rrule_freq == 'MONTHLY':
+            # Months without the day of the month of dtstart are skipped
+            value = _add_months(event.dtstart, step * interval)
+        elif event.rrule_freq == 'WEEKLY':
+            value = event.dtstart + datetime.timedelta(weeks=step * interval)
+        else:
+            value = event.dtstart + datetime.timedelta(days=step * interval)
+        step += 1
+        if value is None:
+            continue
+        if event.rrule_until and value > event.rrule_until:
+            return
+        yield value
+        count += 1
+        if event.rrule_count and count >= event.rrule_count:
+            return
+
+def exdates(event):
+    """
+    Returns the set of starts that are exceptions to the event's recurrence
+    rule. Exceptions given as dates apply to the occurrence on that date.
+    Anything that can't be parsed is ignored.
+    """
+    result = set()
+    for value in event.exdate_list():
+        try:
+            exdate = parse_datetime(value)
+        except ValueError:
+            continue
+        if 'T' not in value:
+            exdate = datetime.datetime.combine(exdate.date(),
+                    event.dtstart.time())
+        result.add(exdate)
+    return result
+
+def materialise(event, until):
+    """
+    Adds the occurrences of the event that start before until (and after
+    those already in the occurrence table). Returns the number added.
+    """
+    done = event.materialised_until
+    if done and done >= until:
+        return 0
+    duration = event.dtend and event.dtend - event.dtstart
+    rows = []
+    finished = True
+    skip = exdates(event)
+    for value in rule_starts(event):
+        if value >= until:
+            finished = False
+            break
+        if (done and value < done) or value in skip:
+            continue
+        end = duration and value + duration or None
+        rows.append((event.pk, connection.ops.value_to_db_datetime(value),
+            connection.ops.value_to_db_datetime(end)))
+    if rows:
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.executemany(u'INSERT INTO %s (%s, %s, %s) VALUES (%%s, %%s,'\
+                u' %%s)' % (qn(occurrence._meta.db_table), qn('event_id'),
+                    qn('start'), qn('end')), rows)
+    event.materialised_until = finished and FOREVER or until
+    # update() so the post_save handler below isn't triggered again
+    hCalendar.objects.filter(pk=event.pk).update(
+            materialised_until=event.materialised_until)
+    return len(rows)
+
+def rebuild_occurrences(event):
+    """
+    Replaces the occurrences of the event (e.g. after it has been edited)
+    """
+    occurrence.objects.filter(event=event).delete()
+    event.materialised_until = None
+    now = datetime.datetime.now()
+    count = materialise(event, max(now, event.dtstart) + _horizon())
+    transaction.commit_unless_managed()
+    return count
+
+def update_occurrences(sender, instance, **kwargs):
+    """
+    post_save signal handler.
+    """
+    rebuild_occurrences(instance)
+
+post_save.connect(update_occurrences, sender=hCalendar)
+
+def extend_horizon(until=None, chunk_size=CHUNK_SIZE):
+    """
+    Makes sure the occurrences of every event have been materialised up to
+    until (defaults to the horizon from now). Returns the number of
+    occurrences added.
+    """
+    target = datetime.datetime.now() + _horizon()
+    until = until or target
+    target = max(until, target)
+    count = 0
+    queryset = hCalendar.objects.filter(Q(materialised_until__lt=until) |
+            Q(materialised_until__isnull=True))
+    for chunk in chunked_queryset(queryset, chunk_size):
+        for event in chunk:
+            count += materialise(event, target)
+    transaction.commit_unless_managed()
+    return count
+
+def occurrences(start, end, events=None):
+    """
+    Returns the occurrences (with their events) that overlap the window
+    ordered by start. Pass a queryset or list of hCalendars to limit the
+    events considered. Only the occurrences materialised so far are returned
+    (see extend_horizon()).
+    """
+    queryset = occurrence.objects.filter(start__lt=end).filter(
+            Q(end__gt=start) | Q(end__isnull=True, start__gte=start))
+    if events is not None:
+        queryset = queryset.filter(event__in=events)
+    return queryset.select_related('event').order_by('start', 'event')
+
+def rebuild_all_occurrences(chunk_size=CHUNK_SIZE):
+    """
+    Rebuilds the occurrences of every event (e.g. after upgrading). Returns
+    the number of events processed.
+    """
+    count = 0
+    for chunk in chunked_queryset(hCalendar.objects.all(), chunk_size):
+        for event in chunk:
+            rebuild_occurrences(event)
+            count += 1
+    return count
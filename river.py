@@ -0,0 +1,212 @@
+# -*- coding: UTF-8 -*-
+"""
+A "river" of the newest entries (hEntry and hNews) across a number of hFeeds,
+most recently updated first, a page at a time.
+
+Each feed is read newest first with a (hfeed_id, updated, id) index range
+scan - see sql/hentry.sql - and the streams are merged with a heap, so only
+about a page of rows is read from each. That is a query per feed, so rivers
+of more than MERGE_FEEDS feeds are read in groups instead. An IN list can't
+be read in order from that index, so a group is read with a backwards scan
+of the (updated, id) index that skips the entries of other feeds: cheap when
+the group's feeds hold a good share of the entries, a long scan when they
+are a small part of a big table (pass feeds_per_query=1 to river() then).
+Pages are continued with an opaque cursor (the position of the last entry)
+rather than an offset.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import datetime
+import heapq
+import time
+
+from django.db.models import Q
+
+from microformats.models import hFeed, hEntry, hNews
+
+# The number of entries in a page
+RIVER_SIZE = 20
+# Up to this many feeds are read with a query each. Above it the feeds are
+# read in groups of BATCH_SIZE (one query per group, read from the (updated,
+# id) index rather than the per-feed one - see above).
+MERGE_FEEDS = 32
+# The number of values in a single IN clause (kept under SQLite's limit on
+# the number of parameters in a query)
+BATCH_SIZE = 500
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def _pk(value):
+    return isinstance(value, hFeed) and value.pk or value
+
+def make_cursor(updated, pk):
+    """
+    Returns the cursor for the position of an entry
+    """
+    return u'%s/%d' % (updated.isoformat(), pk)
+
+def parse_cursor(cursor):
+    """
+    Turns a cursor back into an (updated, pk) tuple. Raises ValueError if it
+    isn't a valid cursor.
+    """
+    try:
+        value, pk = cursor.rsplit('/', 1)
+        value, microseconds = (value.split('.', 1) + ['0'])[:2]
+        updated = datetime.datetime(*time.strptime(value,
+            '%Y-%m-%dT%H:%M:%S')[:6])
+        return (updated.replace(microsecond=int(microseconds.ljust(6, '0'))),
+                int(pk))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor: %r' % cursor)
+
+def _older(position):
+    updated, pk = position
+    return Q(updated__lt=updated) | Q(updated=updated, pk__lt=pk)
+
+def _not_older(position):
+    updated, pk = position
+    return Q(updated__gt=updated) | Q(updated=updated, pk__gte=pk)
+
+def _stream(feeds, before, page_size):
+    """
+    Yields (updated, pk, bookmark) for the entries of the feeds older than
+    the before position (if any), newest first, reading page_size rows at a
+    time.
+    """
+    queryset = hEntry.objects.filter(hfeed__in=feeds).order_by('-updated',
+            '-id').values_list('updated', 'id', 'bookmark')
+    while True:
+        rows = queryset
+        if before:
+            rows = rows.filter(_older(before))
+        rows = list(rows[:page_size])
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        before = rows[-1][:2]
+
+def _key(row):
+    # heapq pops the smallest item so the newest entries get the smallest key
+    return (EPOCH - row[0], -row[1])
+
+def merge(streams):
+    """
+    Merges streams of (updated, pk, ...) rows that are each newest first into
+    one newest first stream, holding a single row of each in a heap.
+    """
+    heap = []
+    for i, stream in enumerate(streams):
+        for row in stream:
+            heap.append((_key(row), i, row, stream))
+            break
+    heapq.heapify(heap)
+    while heap:
+        key, i, row, stream = heap[0]
+        yield row
+        for row in stream:
+            heapq.heapreplace(heap, (_key(row), i, row, stream))
+            break
+        else:
+            heapq.heappop(heap)
+
+def _shown_before(feeds, bookmarks, before):
+    """
+    Returns the bookmarks that belong to an entry of the feeds at or newer
+    than the before position, i.e. that were on an earlier page.
+    """
+    shown = set()
+    size = BATCH_SIZE / 2
+    for i in xrange(0, len(feeds), size):
+        for j in xrange(0, len(bookmarks), size):
+            shown.update(hEntry.objects.filter(hfeed__in=feeds[i:i + size],
+                bookmark__in=bookmarks[j:j + size]).filter(
+                    _not_older(before)).values_list('bookmark', flat=True))
+    return shown
+
+def _entries(pks):
+    """
+    Returns the entries in the order of the pks, as hNews instances where
+    they are one.
+    """
+    entries = hEntry.objects.in_bulk(pks)
+    entries.update(hNews.objects.in_bulk(pks))
+    return [entries[pk] for pk in pks if pk in entries]
+
+def river(feeds, count=RIVER_SIZE, cursor=None, feeds_per_query=None):
+    """
+    Returns an (entries, cursor) tuple: the newest count entries of the feeds
+    (hFeed instances or pks) after the cursor and the cursor for the next
+    page, or None if there are no more entries.
+
+    Entries sharing a bookmark are only shown once, the most recently updated
+    one. Raises ValueError if the cursor isn't valid.
+
+    By default each feed is read with a query of its own (up to MERGE_FEEDS
+    of them) or in groups of BATCH_SIZE; pass feeds_per_query to choose
+    (feeds_per_query=1 always uses the per-feed index).
+    """
+    pks = sorted(set([_pk(feed) for feed in feeds]))
+    before = cursor and parse_cursor(cursor) or None
+    if not feeds_per_query:
+        feeds_per_query = len(pks) <= MERGE_FEEDS and 1 or BATCH_SIZE
+    rows = merge([_stream(pks[i:i + feeds_per_query], before, count + 1) for
+        i in xrange(0, len(pks), feeds_per_query)])
+    page = []
+    seen = set()
+    more = True
+    while more and len(page) < count:
+        more = False
+        chunk = []
+        for row in rows:
+            if row[2]:
+                if row[2] in seen:
+                    continue
+                seen.add(row[2])
+            chunk.append(row)
+            if len(page) + len(chunk) == count:
+                more = True
+                break
+        if before:
+            shown = _shown_before(pks, [row[2] for row in chunk if row[2]],
+                    before)
+            # Shown on an earlier page - the loop goes round again to fill
+            # the gaps
+            chunk = [row for row in chunk if row[2] not in shown]
+        page.extend(chunk)
+    entries = _entries([row[1] for row in page])
+    if len(page) < count:
+        return entries, None
+    return entries, make_cursor(*page[-1][:2])
@@ -0,0 +1,448 @@
+# -*- coding: UTF-8 -*-
+"""
+An optional, in-process coordinate index for fast radius and nearest
+neighbour queries over the geo-tagged microformats.
+
+The (model, pk, latitude, longitude) of every located row is loaded into
+contiguous NumPy arrays sorted by a grid cell id. A query only looks at the
+cells overlapping its bounding box (each row of cells is a single contiguous
+slice of the arrays) and measures the candidates with a vectorised haversine
+formula.
+
+Rows saved or deleted after the index was loaded are tracked by signal
+handlers in a small overlay that is consulted by every query, and the whole
+index is re-read from the database every refresh_interval seconds.
+
+NumPy is optional: without it nearest() and within_radius() query the
+bounding box of the search in the database and measure the distances in
+pure Python instead (and CoordinateIndex raises ImproperlyConfigured).
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+import math
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from microformats.models import hCard, hCalendar, hListing, hReview, hNews,\
+        geo
+from microformats.utils import model_name
+
+# The models with latitude and longitude fields
+LOCATED_MODELS = (hCard, hCalendar, hListing, hReview, hNews, geo)
+MODELS = dict((model_name(m), m) for m in LOCATED_MODELS)
+
+EARTH_RADIUS_KM = 6371.0088
+# Roughly half the circumference of the earth
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+# The size (in degrees) of the grid cells
+CELL_SIZE = 0.5
+# How often (in seconds) the index is re-read from the database
+REFRESH_INTERVAL = 300
+# The overlay is folded into the arrays once it gets bigger than this
+MAX_PENDING = 1000
+
+def haversine(lat, lng, lats, lngs):
+    """
+    Returns an array of the distances (in km) from the point (lat, lng) to the
+    points in the arrays lats and lngs. All values are in radians.
+    """
+    dlat = lats - lat
+    dlng = lngs - lng
+    a = numpy.sin(dlat / 2.0) ** 2 +\
+            math.cos(lat) * numpy.cos(lats) * numpy.sin(dlng / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(
+        numpy.minimum(a, 1.0)))
+
+class CoordinateIndex(object):
+    """
+    An in-memory index of the coordinates of the located models.
+    """
+    def __init__(self, models=LOCATED_MODELS, cell_size=CELL_SIZE,
+            refresh_interval=REFRESH_INTERVAL):
+        if numpy is None:
+            raise ImproperlyConfigured('The coordinate index requires NumPy')
+        self.models = tuple(models)
+        self.names = [model_name(m) for m in self.models]
+        self.type_codes = dict((name, i) for i, name in enumerate(self.names))
+        self.cell_size = cell_size
+        self.rows = int(math.ceil(180.0 / cell_size))
+        self.cols = int(math.ceil(360.0 / cell_size))
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.state = None
+        # (type code, pk) -> (latitude, longitude) or None if deleted
+        self.pending = {}
+        self.loaded_at = 0
+
+    ##########
+    # Loading
+    ##########
+
+    def cell_ids(self, lats, lngs):
+        """
+        Returns the grid cell ids for arrays of latitudes and longitudes (in
+        degrees).
+        """
+        rows = numpy.clip(((lats + 90.0) / self.cell_size).astype(numpy.int64),
+                0, self.rows - 1)
+        cols = ((lngs + 180.0) / self.cell_size).astype(numpy.int64) %\
+                self.cols
+        return rows * self.cols + cols
+
+    def build(self, types, pks, lats, lngs):
+        """
+        Returns the immutable state tuple for the referenced (unsorted)
+        arrays: the arrays sorted by cell id plus the radian coordinates.
+        """
+        cells = self.cell_ids(lats, lngs)
+        order = numpy.argsort(cells, kind='mergesort')
+        return (cells[order], types[order], pks[order],
+                numpy.radians(lats[order]), numpy.radians(lngs[order]))
+
+    def load(self):
+        """
+        (Re)reads every located row from the database.
+        """
+        types, pks, lats, lngs = [], [], [], []
+        for code, model in enumerate(self.models):
+            rows = model.objects.filter(latitude__isnull=False,
+                    longitude__isnull=False).values_list('pk', 'latitude',
+                            'longitude')
+            for pk, lat, lng in rows.iterator():
+                types.append(code)
+                pks.append(pk)
+                lats.append(lat)
+                lngs.append(lng)
+        state = self.build(numpy.array(types, dtype=numpy.int8),
+                numpy.array(pks, dtype=numpy.int64),
+                numpy.array(lats, dtype=numpy.float64),
+                numpy.array(lngs, dtype=numpy.float64))
+        self.lock.acquire()
+        try:
+            self.state = state
+            self.pending = {}
+            self.loaded_at = time.time()
+        finally:
+            self.lock.release()
+
+    def _ensure_loaded(self):
+        if self.state is None or (self.refresh_interval and
+                time.time() - self.loaded_at > self.refresh_interval):
+            self.load()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self.state[0]) + len([x for x in self.pending.itervalues()
+            if x])
+
+    #######################
+    # Incremental updates
+    #######################
+
+    def update(self, model, pk, lat, lng):
+        """
+        Records a new position for a row (or its removal if lat or lng is
+        None). Does nothing until the index has been loaded.
+        """
+        if self.state is None:
+            return
+        key = (self.type_codes[model_name(model)], pk)
+        self.lock.acquire()
+        try:
+            if lat is None or lng is None:
+                self.pending[key] = None
+            else:
+                self.pending[key] = (lat, lng)
+            fold = len(self.pending) > MAX_PENDING
+        finally:
+            self.lock.release()
+        if fold:
+            self.fold()
+
+    def fold(self):
+        """
+        Merges the overlay into the arrays without going to the database.
+        """
+        self.lock.acquire()
+        try:
+            cells, types, pks, lats, lngs = self.state
+            pending = self.pending
+            keep = ~self._overridden(types, pks, pending)
+            added = [(k, v) for k, v in pending.iteritems() if v]
+            new_types = numpy.array([k[0] for k, v in added], dtype=numpy.int8)
+            new_pks = numpy.array([k[1] for k, v in added], dtype=numpy.int64)
+            new_lats = numpy.array([v[0] for k, v in added],
+                    dtype=numpy.float64)
+            new_lngs = numpy.array([v[1] for k, v in added],
+                    dtype=numpy.float64)
+            self.state = self.build(
+                    numpy.concatenate((types[keep], new_types)),
+                    numpy.concatenate((pks[keep], new_pks)),
+                    numpy.concatenate((numpy.degrees(lats[keep]), new_lats)),
+                    numpy.concatenate((numpy.degrees(lngs[keep]), new_lngs)))
+            self.pending = {}
+        finally:
+            self.lock.release()
+
+    def _overridden(self, types, pks, pending):
+        """
+        Returns a boolean array marking the entries superseded by the overlay.
+        """
+        mask = numpy.zeros(len(pks), dtype=bool)
+        for code in set(k[0] for k in pending):
+            changed = numpy.array([k[1] for k in pending if k[0] == code],
+                    dtype=numpy.int64)
+            mask |= (types == code) & numpy.in1d(pks, changed)
+        return mask
+
+    ##########
+    # Queries
+    ##########
+
+    def _candidates(self, state, lat, lng, km):
+        """
+        Returns an array of the positions (in the state arrays) of the entries
+        in the cells overlapping the bounding box of the circle.
+        """
+        cells = state[0]
+        dlat = km / KM_PER_DEGREE
+        row_from = max(int((lat - dlat + 90.0) / self.cell_size), 0)
+        row_to = min(int((lat + dlat + 90.0) / self.cell_size), self.rows - 1)
+        max_lat = min(abs(lat) + dlat, 90.0)
+        if max_lat >= 89.9:
+            col_ranges = [(0, self.cols - 1)]
+        else:
+            dlng = dlat / math.cos(math.radians(max_lat))
+            if dlng >= 180.0:
+                col_ranges = [(0, self.cols - 1)]
+            else:
+                col_from = int((lng - dlng + 180.0) / self.cell_size) %\
+                        self.cols
+                col_to = int((lng + dlng + 180.0) / self.cell_size) % self.cols
+                if col_from <= col_to:
+                    col_ranges = [(col_from, col_to)]
+                else:
+                    col_ranges = [(col_from, self.cols - 1), (0, col_to)]
+        starts, ends = [], []
+        for row in xrange(row_from, row_to + 1):
+            for col_from, col_to in col_ranges:
+                starts.append(row * self.cols + col_from)
+                ends.append(row * self.cols + col_to + 1)
+        starts = numpy.searchsorted(cells, starts)
+        ends = numpy.searchsorted(cells, ends)
+        slices = [numpy.arange(s, e) for s, e in zip(starts, ends) if e > s]
+        if not slices:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(slices)
+
+    def _type_filter(self, models):
+        if not models:
+            return None
+        return [self.type_codes[isinstance(m, basestring) and m.lower() or
+            model_name(m)] for m in models]
+
+    def radius(self, lat, lng, km, models=None):
+        """
+        Returns a list of (distance in km, model name, pk) tuples for every
+        row within km kilometres of (lat, lng), nearest first. Pass a list of
+        models (or model names) to restrict the search.
+        """
+        self._ensure_loaded()
+        self.lock.acquire()
+        try:
+            state, pending = self.state, dict(self.pending)
+        finally:
+            self.lock.release()
+        codes = self._type_filter(models)
+        found = []
+        idx = self._candidates(state, lat, lng, km)
+        if len(idx):
+            types, pks = state[1][idx], state[2][idx]
+            keep = numpy.ones(len(idx), dtype=bool)
+            if codes is not None:
+                keep &= numpy.in1d(types, codes)
+            if pending:
+                keep &= ~self._overridden(types, pks, pending)
+            idx = idx[keep]
+            distances = haversine(math.radians(lat), math.radians(lng),
+                    state[3][idx], state[4][idx])
+            within = distances <= km
+            found = zip(distances[within].tolist(),
+                    state[1][idx][within].tolist(),
+                    state[2][idx][within].tolist())
+        for (code, pk), position in pending.iteritems():
+            if position and (codes is None or code in codes):
+                distance = haversine(math.radians(lat), math.radians(lng),
+                        numpy.radians(numpy.array([position[0]])),
+                        numpy.radians(numpy.array([position[1]])))[0]
+                if distance <= km:
+                    found.append((float(distance), code, pk))
+        found.sort()
+        return [(d, self.names[code], pk) for d, code, pk in found]
+
+    def nearest(self, lat, lng, k=20, models=None, max_km=MAX_DISTANCE_KM):
+        """
+        Returns the k rows nearest to (lat, lng) as a list of (distance in km,
+        model name, pk) tuples, nearest first.
+
+        The search radius starts at the size of a grid cell and doubles until
+        at least k rows fall inside it - as the radius search is exact the k
+        nearest rows must then be among them.
+        """
+        km = self.cell_size * KM_PER_DEGREE
+        while True:
+            found = self.radius(lat, lng, min(km, max_km), models)
+            if len(found) >= k or km >= max_km:
+                return found[:k]
+            km *= 2
+
+##############
+# Without NumPy
+##############
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    Returns the great circle distance (in km) between two points given in
+    degrees.
+    """
+    lat1, lng1, lat2, lng2 = [math.radians(x) for x in (lat1, lng1, lat2,
+        lng2)]
+    a = math.sin((lat2 - lat1) / 2.0) ** 2 +\
+            math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+def database_radius(lat, lng, km, models=None):
+    """
+    As CoordinateIndex.radius() but reads the rows inside the bounding box
+    of the circle from the database and measures them in pure Python.
+    """
+    dlat = km / KM_PER_DEGREE
+    max_lat = min(abs(lat) + dlat, 90.0)
+    longitudes = Q(longitude__isnull=False)
+    # Near the poles every longitude is in range
+    dlng = max_lat < 89.9 and dlat / math.cos(math.radians(max_lat)) or 180.0
+    if dlng < 180.0:
+        west, east = lng - dlng, lng + dlng
+        if west < -180.0:
+            longitudes = Q(longitude__gte=west + 360.0) |\
+                    Q(longitude__lte=east)
+        elif east > 180.0:
+            longitudes = Q(longitude__gte=west) |\
+                    Q(longitude__lte=east - 360.0)
+        else:
+            longitudes = Q(longitude__gte=west, longitude__lte=east)
+    found = []
+    for model in models and [isinstance(m, basestring) and MODELS[m.lower()]
+            or m for m in models] or LOCATED_MODELS:
+        name = model_name(model)
+        rows = model.objects.filter(longitudes, latitude__gte=lat - dlat,
+                latitude__lte=lat + dlat).values_list('pk', 'latitude',
+                        'longitude')
+        for pk, row_lat, row_lng in rows.iterator():
+            distance = distance_km(lat, lng, row_lat, row_lng)
+            if distance <= km:
+                found.append((distance, name, pk))
+    found.sort()
+    return found
+
+def database_nearest(lat, lng, k=20, models=None, max_km=MAX_DISTANCE_KM):
+    """
+    As CoordinateIndex.nearest() using database_radius()
+    """
+    km = CELL_SIZE * KM_PER_DEGREE
+    while True:
+        found = database_radius(lat, lng, min(km, max_km), models)
+        if len(found) >= k or km >= max_km:
+            return found[:k]
+        km *= 2
+
+_index = None
+
+def get_coordinate_index():
+    """
+    Returns the (process wide) coordinate index, loading it on first use.
+    """
+    global _index
+    if _index is None:
+        _index = CoordinateIndex()
+        _index.load()
+    return _index
+
+def nearest(lat, lng, k=20, models=None):
+    """
+    Shortcut for get_coordinate_index().nearest() (or database_nearest()
+    without NumPy)
+    """
+    if numpy is None:
+        return database_nearest(lat, lng, k, models)
+    return get_coordinate_index().nearest(lat, lng, k, models)
+
+def within_radius(lat, lng, km, models=None):
+    """
+    Shortcut for get_coordinate_index().radius() (or database_radius()
+    without NumPy)
+    """
+    if numpy is None:
+        return database_radius(lat, lng, km, models)
+    return get_coordinate_index().radius(lat, lng, km, models)
+
+def update_coordinate_index(sender, instance, **kwargs):
+    """
+    post_save signal handler.
+    """
+    if _index is not None:
+        _index.update(sender, instance.pk, instance.latitude,
+                instance.longitude)
+
+def remove_from_coordinate_index(sender, instance, **kwargs):
+    """
+    post_delete signal handler.
+    """
+    if _index is not None:
+        _index.update(sender, instance.pk, None, None)
+
+for model in LOCATED_MODELS:
+    post_save.connect(update_coordinate_index, sender=model)
+    post_delete.connect(remove_from_coordinate_index, sender=model)
@@ -0,0 +1,3 @@
+-- Archive lists across feeds (newest month first) are answered by a scan of
+-- this index. The unique (hfeed_id, year, month) index covers a single feed.
+CREATE INDEX microformats_entry_archive_month ON microformats_entry_archive (year, month);
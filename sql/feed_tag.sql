@@ -0,0 +1,3 @@
+-- FeedManager.tagged_any(), tagged_all() and tag_counts() are answered by a
+-- scan of this index. The unique (hfeed_id, name) index covers a feed's tags.
+CREATE INDEX microformats_feed_tag_name ON microformats_feed_tag (name, hfeed_id);
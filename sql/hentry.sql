@@ -0,0 +1,13 @@
+-- The river (river.py) reads each feed newest first with a range scan of
+-- this index.
+CREATE INDEX microformats_hentry_feed_updated ON microformats_hentry (hfeed_id, updated, id);
+
+-- Rivers of many feeds read them in groups (hfeed_id IN (...)), which the
+-- index above can't return in order, so they scan this one newest first and
+-- skip the entries of other feeds. Cheap when the group holds a good share
+-- of the entries; it costs another index to maintain on every write.
+CREATE INDEX microformats_hentry_updated ON microformats_hentry (updated, id);
+
+-- Per-author pages (an author's entries, newest first) are answered by a
+-- scan of this index.
+CREATE INDEX microformats_hentry_author_updated ON microformats_hentry (canonical_author_id, updated);
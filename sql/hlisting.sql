@@ -0,0 +1,11 @@
+-- Searching for listings in a currency between two prices (and sorting them
+-- by price) is answered by a scan of this index.
+CREATE INDEX microformats_hlisting_price ON microformats_hlisting (price_currency, price_amount);
+
+-- ListingManager.active() and expired() (by listing action) are answered by a
+-- scan of this index.
+CREATE INDEX microformats_hlisting_action_expiry ON microformats_hlisting (listing_action, dtexprired);
+
+-- Archiving the expired listings of every listing action
+-- (./manage.py archive_expired_listings without --action) walks this index.
+CREATE INDEX microformats_hlisting_expiry ON microformats_hlisting (dtexprired);
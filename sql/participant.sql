@@ -0,0 +1,4 @@
+-- Person-centric calendar queries (every event an hCard takes part in, in a
+-- given role) are answered by a scan of this index. Event-centric queries
+-- use the unique (event_id, hcard_id, role) index.
+CREATE INDEX microformats_participant_hcard_role ON microformats_participant (hcard_id, role, event_id);
@@ -0,0 +1,4 @@
+-- Walking the XFN graph goes both ways: from a user to the URLs they link to
+-- and from a URL to the users linking to (or claiming, with rel="me") it.
+CREATE INDEX microformats_xfn_edge_source_url ON microformats_xfn_edge (source_id, url_key);
+CREATE INDEX microformats_xfn_edge_url_source ON microformats_xfn_edge (url_key, source_id);
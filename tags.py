@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+"""
+Keeps the feed_tag rows in step with the comma-separated hFeed.category
+text so feeds can be found by tag with an index lookup.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from microformats.models import hFeed, feed_tag
+from microformats.utils import chunked_queryset, split_tags, CHUNK_SIZE
+
+def index_tags(feed, created=False):
+    """
+    Brings the feed_tag rows for the feed up to date. Only rows that have
+    actually changed are written.
+    """
+    wanted = split_tags(feed.category)
+    existing = {}
+    if not created:
+        existing = dict((t.name, t) for t in feed_tag.objects.filter(
+            hfeed=feed.pk))
+    names = set([name for name, label in wanted])
+    gone = [name for name in existing if name not in names]
+    if gone:
+        feed_tag.objects.filter(hfeed=feed.pk, name__in=gone).delete()
+    for name, label in wanted:
+        row = existing.get(name)
+        if row is None:
+            feed_tag.objects.create(hfeed=feed, name=name, label=label)
+        elif row.label != label:
+            row.label = label
+            row.save()
+
+def update_tags(sender, instance, created=False, **kwargs):
+    """
+    post_save signal handler. (The tags go when the feed is deleted as they
+    have a foreign key to it.)
+    """
+    index_tags(instance, created)
+
+post_save.connect(update_tags, sender=hFeed)
+
+def backfill_tags(chunk_size=CHUNK_SIZE):
+    """
+    Throws away and rebuilds the tags of every feed, reading the feeds in
+    chunks. Returns the number of feeds processed.
+    """
+    feed_tag.objects.all().delete()
+    count = 0
+    for chunk in chunked_queryset(hFeed.objects.only('category'), chunk_size):
+        for feed in chunk:
+            index_tags(feed, True)
+        count += len(chunk)
+    return count
+backfill_tags = transaction.commit_on_success(backfill_tags)
@@ -41,11 +41,23 @@ from django.template.loader import select_template
 from django.conf import settings
 from django.utils.translation import ugettext as _
 from django.utils.html import conditional_escape
+from django.utils.http import urlquote
 from django.utils.safestring import mark_safe
 from django.forms.fields import email_re, url_re
+from django.db.models.query import QuerySet
 # We'll be using all the models at some point or other
 import microformats.models
+import microformats.ratings
+import microformats.archives
+from microformats.utils import isoformat, normalise_tag
+from microformats.projection import narrow
+from microformats.instrumentation import instrumented, note_template
+from microformats.metrics import measured, timed_render
 import datetime
+import re
+
+# A TIMEZONE value: "Z" (UTC) or an offset such as "+01:00" or "-03:30"
+TZ_OFFSET = re.compile(r'^(Z|[+-]\d\d:\d\d)$')
 
 ################################################
 # Default templates (over-ridden in settings.py)
@@ -55,10 +67,16 @@ HCARD_MICROFORMAT_TEMPLATE = 'hcard.html'
 HCAL_MICROFORMAT_TEMPLATE = 'hcal.html'
 HLISTING_MICROFORMAT_TEMPLATE = 'hlisting.html'
 HREVIEW_MICROFORMAT_TEMPLATE = 'hreview.html'
+HREVIEW_AGGREGATE_MICROFORMAT_TEMPLATE = 'hreview_aggregate.html'
 ADR_MICROFORMAT_TEMPLATE = 'adr.html'
 HFEED_MICROFORMAT_TEMPLATE = 'hfeed.html'
 HENTRY_MICROFORMAT_TEMPLATE = 'hentry.html'
 HNEWS_MICROFORMAT_TEMPLATE = 'hnews.html'
+RIVER_MICROFORMAT_TEMPLATE = 'river.html'
+
+# Where rel="tag" links point (over-ridden in settings.py) - the tag is the
+# last segment of the path
+REL_TAG_URL = '/tag/%s'
 
 # For registering the templates
 register = template.Library()
@@ -109,6 +127,11 @@ def fragment(value, arg, autoescape=None):
 
     <abbr class="dtstart" title="2009-05-03">Sun 3 May 2009</abbr>
 
+    If the second arg is a timezone offset it is added to the title, so
+    "dtstart +01:00 %a %d %b %y" gives:
+
+    <abbr class="dtstart" title="2009-05-03T00:00:00+01:00">Sun 3 May 2009</abbr>
+
     Verging of the redundant, this function *does* save typing, incorporates
     some useful heuristics and abstracts the output of individual field values 
     in a neat way.
@@ -124,6 +147,9 @@ def fragment(value, arg, autoescape=None):
             # formatting
             args = arg.split()
             klass = args[0]
+            tz = None
+            if len(args)>1 and TZ_OFFSET.match(args[1]):
+                tz = args.pop(1)
             if len(args)>1:
                 # We're assuming these are strftime formatting instructions
                 format = str(' '.join(args[1:]).strip())
@@ -132,7 +158,7 @@ def fragment(value, arg, autoescape=None):
                 format = '%c'
             result = u'<abbr class="%s" title="%s">%s</abbr>' % (
                             esc(klass),
-                            esc(value.isoformat()),
+                            esc(isoformat(value, tz)),
                             esc(value.strftime(format))
                         )
         elif arg == 'longitude' or arg == 'latitude' or arg == 'long' or arg == 'lat':
@@ -169,19 +195,90 @@ def fragment(value, arg, autoescape=None):
         result = esc(value)
     return mark_safe(result)
 
-def render_microformat(instance, template_name):
+def included_templates():
+    """
+    Returns the context variables holding the names of templates the
+    microformat templates {% include %}
+    """
+    adr_template = getattr(settings, 'ADR_MICROFORMAT_TEMPLATE', False) and settings.ADR_MICROFORMAT_TEMPLATE or ADR_MICROFORMAT_TEMPLATE
+    return {
+        'adr_microformat_template': adr_template,
+        }
+
+def render_microformat(instance, template_name, extra=None):
     """
     A generic function that simply takes an instance of a microformat and a
     template name, creates an appropriate context object and returns the rendered
-    result.
+    result. Anything in extra is added to the context.
     """
+    note_template(template_name)
     template = select_template([template_name,])
-    adr_template = getattr(settings, 'ADR_MICROFORMAT_TEMPLATE', False) and settings.ADR_MICROFORMAT_TEMPLATE or ADR_MICROFORMAT_TEMPLATE
-    context = Context({
-        'instance': instance,
-        'adr_microformat_template': adr_template,
-        })
+    context = Context(included_templates())
+    context['instance'] = instance
+    if extra:
+        context.update(extra)
     return template.render(context)
+render_microformat = instrumented(timed_render(render_microformat))
+
+def narrow_entries(queryset, template_name, name='instance', sequence=None):
+    """
+    Narrows a queryset of entries to the fields the template uses (see
+    microformats.projection)
+    """
+    return narrow(queryset, template_name, name, included_templates(),
+            sequence)
+
+@register.filter
+def country_name(value):
+    """
+    Returns the display name of an ISO 3166 country code in the currently
+    active language (from a precomputed index rather than by walking the
+    COUNTRY_LIST choices).
+
+    {{instance.country_name|country_name}}
+    """
+    return microformats.models.country_name_display(value)
+
+@register.filter
+def adr_country_name(instance):
+    """
+    Returns the country name to display for an adr-like instance. If the
+    instance is a model with a country_name choice field the code is looked up
+    in the precomputed index, otherwise (e.g. for a dict) the country_name is
+    returned as it is.
+
+    {{instance|adr_country_name}}
+    """
+    if hasattr(instance, 'get_country_name_display'):
+        return microformats.models.country_name_display(instance.country_name)
+    try:
+        return instance['country_name']
+    except (TypeError, KeyError):
+        return getattr(instance, 'country_name', u'')
+# The only field of the instance the filter reads (see microformats.projection)
+adr_country_name.fields_used = ('country_name',)
+
+@register.filter
+def timezone_name(value):
+    """
+    Returns the display name of a timezone offset (e.g. "+01:00") in the
+    currently active language.
+
+    {{instance.tz|timezone_name}}
+    """
+    return microformats.models.timezone_display(value)
+
+@register.filter
+def iso_datetime(value, arg=None):
+    """
+    Returns the ISO 8601 representation of a date/time qualified with the
+    timezone offset passed as the arg (if any).
+
+    <abbr class="dtstart" title="{{instance.dtstart|iso_datetime:instance.tz}}">
+    """
+    if not value:
+        return u''
+    return isoformat(value, arg)
 
 @register.filter
 def geo(value, arg=None, autoescape=None):
@@ -347,6 +444,33 @@ def hreview(value, arg=None, autoescape=None):
         return mark_safe(render_microformat(value, template_name))
 hreview.needs_autoescape = True
 
+@register.filter
+def hreview_aggregate(value, arg=None):
+    """
+    Renders the hReview-aggregate microformat (the average rating and number
+    of reviews of an item) from the precomputed review_aggregate table.
+
+    The value can be a review_aggregate, an hReview (for the item it
+    reviews) or the name of an item, in which case the arg is its type:
+
+    {{review|hreview_aggregate}}
+    {{product.name|hreview_aggregate:"product"}}
+
+    Items that haven't been reviewed render as an empty string.
+
+    For more information see:
+
+    http://microformats.org/wiki/hreview-aggregate
+    """
+    if isinstance(value, microformats.models.hReview):
+        value = microformats.ratings.aggregate_for(value.fn, value.type)
+    elif isinstance(value, basestring):
+        value = microformats.ratings.aggregate_for(value, arg)
+    if not value:
+        return u''
+    template_name = getattr(settings, 'HREVIEW_AGGREGATE_MICROFORMAT_TEMPLATE', False) and settings.HREVIEW_AGGREGATE_MICROFORMAT_TEMPLATE or HREVIEW_AGGREGATE_MICROFORMAT_TEMPLATE
+    return mark_safe(render_microformat(value, template_name))
+
 @register.filter
 def xfn(value, arg=None, autoescape=None):
     """
@@ -378,6 +502,33 @@ def xfn(value, arg=None, autoescape=None):
         return mark_safe(result)
 xfn.needs_autoescape = True
 
+@register.filter
+def rel_tag(value, autoescape=None):
+    """
+    Formats a tag (an instance of the feed_tag model or a string) to conform
+    with the rel-tag microformat, e.g.:
+
+    <a href="/tag/django%20tips" rel="tag">Django tips</a>
+
+    For more information see:
+
+    http://microformats.org/wiki/rel-tag
+    """
+    if autoescape:
+        esc = conditional_escape
+    else:
+        esc = lambda x: x
+    if isinstance(value, microformats.models.feed_tag):
+        name, label = value.name, value.label
+    else:
+        label = value
+        name = normalise_tag(value)
+    url = getattr(settings, 'REL_TAG_URL', False) and settings.REL_TAG_URL or REL_TAG_URL
+    # The tag is the last segment of the path so a "/" in it is quoted too
+    return mark_safe(u'<a href="%s" rel="tag">%s</a>' % (esc(url %
+        urlquote(name, safe='')), esc(label)))
+rel_tag.needs_autoescape = True
+
 @register.filter
 def hfeed(value, arg=None, autoescape=None):
     """
@@ -393,7 +544,11 @@ def hfeed(value, arg=None, autoescape=None):
         # lets try rendering something with the correct attributes for this
         # microformat
         template_name = getattr(settings, 'HFEED_MICROFORMAT_TEMPLATE', False) and settings.HFEED_MICROFORMAT_TEMPLATE or HFEED_MICROFORMAT_TEMPLATE
-        return mark_safe(render_microformat(value, template_name))
+        # Only load the columns of the entries the template shows
+        entries = narrow_entries(value.entries.all(), template_name,
+                sequence='entries')
+        return mark_safe(render_microformat(value, template_name,
+            {'entries': entries}))
 hfeed.needs_autoescape = True
 
 @register.filter
@@ -430,4 +585,114 @@ def hnews(value, arg=None, autoescape=None):
         # microformat
         template_name = getattr(settings, 'HNEWS_MICROFORMAT_TEMPLATE', False) and settings.HNEWS_MICROFORMAT_TEMPLATE or HNEWS_MICROFORMAT_TEMPLATE
         return mark_safe(render_microformat(value, template_name))
-hentry.needs_autoescape = True
\ No newline at end of file
+hentry.needs_autoescape = True
+
+@register.filter
+def river(value):
+    """
+    Renders a list of entries (e.g. a page of microformats.river.river()) as
+    a single hFeed, the hNews items with the hNews template and the rest with
+    the hEntry template.
+
+    {{entries|river}}
+
+    A queryset of hEntry or hNews is narrowed to the fields its template
+    uses before it is read.
+    """
+    if isinstance(value, QuerySet):
+        if issubclass(value.model, microformats.models.hNews):
+            template_name = getattr(settings, 'HNEWS_MICROFORMAT_TEMPLATE', False) and settings.HNEWS_MICROFORMAT_TEMPLATE or HNEWS_MICROFORMAT_TEMPLATE
+        else:
+            template_name = getattr(settings, 'HENTRY_MICROFORMAT_TEMPLATE', False) and settings.HENTRY_MICROFORMAT_TEMPLATE or HENTRY_MICROFORMAT_TEMPLATE
+        value = narrow_entries(value, template_name)
+    entries = []
+    for entry in value:
+        if isinstance(entry, microformats.models.hNews):
+            entries.append(hnews(entry))
+        else:
+            entries.append(hentry(entry))
+    template_name = getattr(settings, 'RIVER_MICROFORMAT_TEMPLATE', False) and settings.RIVER_MICROFORMAT_TEMPLATE or RIVER_MICROFORMAT_TEMPLATE
+    return mark_safe(render_microformat(entries, template_name))
+
+################
+# Archive lists
+################
+
+def entry_archive(feed=None, url=None):
+    """
+    Renders the months with entries (of the feed, or of every feed) and the
+    number of entries in each, newest first, from the archive counts:
+
+    {% entry_archive feed "/blog/%(year)d/%(month)02d/" %}
+
+    If given, the url is formatted with the year and month of each link.
+    """
+    months = []
+    for year, month, count in microformats.archives.archive_months(
+            feed or None):
+        months.append({
+            'date': datetime.date(year, month, 1),
+            'year': year,
+            'month': month,
+            'count': count,
+            'url': url and url % {'year': year, 'month': month} or u'',
+            })
+    return {'months': months}
+register.inclusion_tag('entry_archive.html')(entry_archive)
+
+def archive_date_hierarchy(cl):
+    """
+    A replacement for the admin's date_hierarchy tag on the hEntry change
+    list (see admin.py) that lists the years and months from the archive
+    counts rather than with a GROUP BY over the entries. The days of a month
+    and searched or filtered lists are left to the admin's own tag.
+    """
+    from django.contrib.admin.templatetags.admin_list import date_hierarchy
+    from django.contrib.admin.views.main import ORDER_VAR, ORDER_TYPE_VAR
+    from django.utils import dateformat
+    from django.utils.translation import get_partial_date_formats
+    field_name = cl.date_hierarchy
+    year_field = '%s__year' % field_name
+    month_field = '%s__month' % field_name
+    year = cl.params.get(year_field)
+    others = [k for k in cl.params if k not in (year_field, ORDER_VAR,
+        ORDER_TYPE_VAR)]
+    if cl.model is not microformats.models.hEntry or field_name != 'updated'\
+            or cl.query or others or (year and not year.isdigit()):
+        return date_hierarchy(cl)
+    year_month_format, month_day_format = get_partial_date_formats()
+    link = lambda d: mark_safe(cl.get_query_string(d, ['%s__' % field_name]))
+    if year:
+        months = microformats.archives.archive_months(year=int(year))
+        months.reverse()
+        return {
+            'show': True,
+            'back': {
+                'link': link({}),
+                'title': _('All dates')
+                },
+            'choices': [{
+                'link': link({year_field: year, month_field: month}),
+                'title': dateformat.format(datetime.date(int(year), month, 1),
+                    year_month_format)
+                } for y, month, count in months]
+            }
+    return {
+        'show': True,
+        'choices': [{
+            'link': link({year_field: y}),
+            'title': y
+            } for y in microformats.archives.archive_years()]
+        }
+register.inclusion_tag('admin/date_hierarchy.html')(archive_date_hierarchy)
+
+def _instrument_filters():
+    """
+    Records the queries made by each filter (see
+    microformats.instrumentation) and its calls, latency and output size
+    (see microformats.metrics)
+    """
+    for name, func in register.filters.items():
+        register.filters[name] = globals()[name] = measured(
+                instrumented(func, name), name)
+_instrument_filters()
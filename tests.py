@@ -10,3 +10,25 @@ from unit_tests.test_views import *
 from unit_tests.test_models import *
 from unit_tests.test_forms import *
 from unit_tests.test_templatetags import *
+from unit_tests.test_dedupe import *
+from unit_tests.test_phones import *
+from unit_tests.test_emails import *
+from unit_tests.test_geocoder import *
+from unit_tests.test_spatial import *
+from unit_tests.test_clusters import *
+from unit_tests.test_geojson import *
+from unit_tests.test_freebusy import *
+from unit_tests.test_recurrence import *
+from unit_tests.test_timezones import *
+from unit_tests.test_prices import *
+from unit_tests.test_listings import *
+from unit_tests.test_ratings import *
+from unit_tests.test_graph import *
+from unit_tests.test_identities import *
+from unit_tests.test_tags import *
+from unit_tests.test_river import *
+from unit_tests.test_authors import *
+from unit_tests.test_archives import *
+from unit_tests.test_projection import *
+from unit_tests.test_instrumentation import *
+from unit_tests.test_metrics import *
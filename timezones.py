@@ -0,0 +1,137 @@
+# -*- coding: UTF-8 -*-
+"""
+UTC copies of the local date/times of hCalendar and hReview.
+
+dtstart, dtend (and dtreviewed) are stored as naive local times with the
+offset from GMT in the tz field, so comparing events in different timezones
+means converting every row. Instead each of them has an indexed *_utc shadow
+column holding the same moment in UTC, filled in just before the row is
+saved, and range queries are made against those. Rows without a tz are taken
+to already be in UTC.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import pre_save
+
+from microformats.models import hCalendar, hReview
+from microformats.utils import chunked_queryset, tz_offset, CHUNK_SIZE
+
+# The local date/time fields of each model and their UTC shadow columns
+UTC_FIELDS = {
+        hCalendar: (('dtstart', 'dtstart_utc'), ('dtend', 'dtend_utc')),
+        hReview: (('dtreviewed', 'dtreviewed_utc'), ('dtstart', 'dtstart_utc'),
+            ('dtend', 'dtend_utc')),
+        }
+
+MODELS = dict((m._meta.object_name.lower(), m) for m in UTC_FIELDS)
+
+def to_utc(value, tz):
+    """
+    Converts a naive local date/time with the referenced TIMEZONE offset
+    (e.g. "+05:30") into a naive UTC date/time
+    """
+    if value is None:
+        return None
+    return value - tz_offset(tz)
+
+def from_utc(value, tz):
+    """
+    Converts a naive UTC date/time into local time at the TIMEZONE offset
+    """
+    if value is None:
+        return None
+    return value + tz_offset(tz)
+
+def utc_values(instance, model=None):
+    """
+    Returns a dict of the UTC shadow column values for the instance
+    """
+    model = model or instance.__class__
+    return dict((utc_field, to_utc(getattr(instance, field), instance.tz))
+            for field, utc_field in UTC_FIELDS[model])
+
+def set_utc_fields(sender, instance, **kwargs):
+    """
+    pre_save signal handler.
+    """
+    for field, value in utc_values(instance, sender).iteritems():
+        setattr(instance, field, value)
+
+for model in UTC_FIELDS:
+    pre_save.connect(set_utc_fields, sender=model)
+
+def _backfill_chunk(model, chunk):
+    for instance in chunk:
+        model.objects.filter(pk=instance.pk).update(**utc_values(instance,
+            model))
+    return len(chunk)
+_backfill_chunk = transaction.commit_on_success(_backfill_chunk)
+
+def backfill_utc(models=None, chunk_size=CHUNK_SIZE):
+    """
+    Fills in the UTC shadow columns of every existing row, chunk_size rows at
+    a time. Each chunk is committed in its own transaction. Returns a dict
+    mapping the model names to the number of rows updated.
+    """
+    result = {}
+    for model in models or UTC_FIELDS.keys():
+        fields = [field for field, utc_field in UTC_FIELDS[model]] + ['tz']
+        count = 0
+        for chunk in chunked_queryset(model.objects.only(*fields),
+                chunk_size):
+            count += _backfill_chunk(model, chunk)
+        result[model._meta.object_name] = count
+    return result
+
+def events_between(start, end, tz=None):
+    """
+    Returns the hCalendar events that overlap the window. start and end are
+    local times at the tz offset (UTC if tz isn't given). Events without a
+    dtend only match if they start inside the window.
+    """
+    start = to_utc(start, tz)
+    end = to_utc(end, tz)
+    return hCalendar.objects.filter(dtstart_utc__lt=end).filter(
+            Q(dtend_utc__gt=start) | Q(dtend_utc__isnull=True,
+                dtstart_utc__gte=start)).order_by('dtstart_utc')
+
+def reviews_between(start, end, tz=None):
+    """
+    Returns the hReviews reviewed during the window (start and end as for
+    events_between), most recent first
+    """
+    return hReview.objects.filter(dtreviewed_utc__gte=to_utc(start, tz),
+            dtreviewed_utc__lt=to_utc(end, tz)).order_by('-dtreviewed_utc')
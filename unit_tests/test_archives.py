@@ -0,0 +1,95 @@
+# -*- coding: UTF-8 -*-
+"""
+hEntry archive tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+from django.template import Template, Context
+
+# project
+from microformats.models import hFeed, hEntry, hNews, entry_archive
+from microformats.archives import archive_months, archive_years,\
+        rebuild_archives
+
+class ArchiveTestCase(TestCase):
+        """
+        Testing the monthly archive counts
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def entry(self, feed, year, month, day=1):
+            entry = hEntry(hfeed=feed, entry_title='Title',
+                    updated=datetime.datetime(year, month, day))
+            entry.save()
+            return entry
+
+        def setUp(self):
+            self.blog = hFeed(category='blog')
+            self.blog.save()
+            self.news = hFeed(category='news')
+            self.news.save()
+            self.entry(self.blog, 2009, 3)
+            self.entry(self.blog, 2009, 3, 20)
+            self.moving = self.entry(self.blog, 2009, 4)
+            self.entry(self.news, 2009, 4)
+            self.entry(None, 2008, 12)
+            item = hNews(hfeed=self.news, entry_title='News', source_org='Org',
+                    updated=datetime.datetime(2009, 4, 2))
+            item.save()
+
+        def test_counts(self):
+            """
+            Make sure the counts follow the entries
+            """
+            self.assertEquals([(2009, 4, 3), (2009, 3, 2), (2008, 12, 1)],
+                    archive_months())
+            self.assertEquals([(2009, 4, 1), (2009, 3, 2)],
+                    archive_months(self.blog))
+            self.assertEquals([(2009, 4, 2)], archive_months([self.news.pk]))
+            self.assertEquals([(2009, 3, 2)], archive_months(year=2009,
+                feeds=self.blog.pk)[1:])
+            self.assertEquals([2008, 2009], archive_years())
+            # Move an entry to another month and feed
+            self.moving.updated = datetime.datetime(2009, 5, 1)
+            self.moving.hfeed = self.news
+            self.moving.save()
+            self.assertEquals([(2009, 3, 2)], archive_months(self.blog))
+            self.assertEquals([(2009, 5, 1), (2009, 4, 2)],
+                    archive_months(self.news))
+            self.moving.delete()
+            hNews.objects.all().delete()
+            self.assertEquals([(2009, 4, 1), (2009, 3, 2), (2008, 12, 1)],
+                    archive_months())
+            # Empty months go
+            self.assertEquals(3, entry_archive.objects.count())
+
+        def test_rebuild(self):
+            """
+            Make sure the counts can be recomputed from the entries
+            """
+            expected = archive_months()
+            entry_archive.objects.all().delete()
+            self.assertEquals(4, rebuild_archives(chunk_size=2))
+            self.assertEquals(expected, archive_months())
+
+        def test_entry_archive(self):
+            """
+            Make sure the archive list is rendered
+            """
+            template = Template('{% load microformat_extras %}'\
+                    '{% entry_archive feed "/blog/%(year)d/%(month)02d/" %}')
+            result = template.render(Context({'feed': self.blog}))
+            self.assertEquals(True, u'<li><a href="/blog/2009/04/">April'\
+                    u' 2009</a> (1)</li>' in result)
+            self.assertEquals(True, u'<li><a href="/blog/2009/03/">March'\
+                    u' 2009</a> (2)</li>' in result)
+            result = Template('{% load microformat_extras %}'\
+                    '{% entry_archive %}').render(Context())
+            self.assertEquals(True, u'<li>December 2008 (1)</li>' in result)
@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+"""
+hEntry author tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hEntry, hNews, entry_author
+from microformats.authors import normalise_author, backfill_authors,\
+        entries_by, top_authors
+
+class AuthorTestCase(TestCase):
+        """
+        Testing the canonical hEntry authors
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def entry(self, author, day=1):
+            entry = hEntry(entry_title='Title', author=author,
+                    updated=datetime.datetime(2009, 6, day))
+            entry.save()
+            return entry
+
+        def counts(self):
+            return [(a.name, a.entry_count) for a in
+                    entry_author.objects.all()]
+
+        def test_normalise_author(self):
+            """
+            Make sure different spellings of a name are matched
+            """
+            self.assertEquals(u'a n other', normalise_author(u' A.N. Other'))
+            self.assertEquals(u'', normalise_author(None))
+
+        def test_counts(self):
+            """
+            Make sure the entries are linked and counted as they're saved
+            """
+            first = self.entry(u'A.N. Other', 1)
+            second = self.entry(u'a n other', 2)
+            third = self.entry(u'Sidney Humphries', 3)
+            news = hNews(entry_title='News', author=u'Sidney  Humphries',
+                    source_org='Org', updated=datetime.datetime(2009, 6, 4))
+            news.save()
+            self.assertEquals(first.canonical_author, second.canonical_author)
+            self.assertEquals([(u'A.N. Other', 2), (u'Sidney Humphries', 2)],
+                    self.counts())
+            second.author = u'Sidney Humphries'
+            second.save()
+            self.assertEquals([(u'A.N. Other', 1), (u'Sidney Humphries', 3)],
+                    self.counts())
+            # Saving without a change leaves the counts alone
+            second.save()
+            news.delete()
+            third.delete()
+            self.assertEquals([(u'A.N. Other', 1), (u'Sidney Humphries', 1)],
+                    self.counts())
+            self.assertEquals([second.pk], [e.pk for e in
+                entries_by(u'sidney humphries')])
+            self.assertEquals([], list(entries_by(u'Nobody')))
+
+        def test_backfill(self):
+            """
+            Make sure existing entries can be linked up and counted
+            """
+            self.entry(u'A.N. Other', 1)
+            self.entry(u'Sidney Humphries', 2)
+            self.entry(u'sidney humphries', 3)
+            hEntry.objects.update(canonical_author=None)
+            entry_author.objects.update(entry_count=0)
+            self.assertEquals(3, backfill_authors(chunk_size=2))
+            self.assertEquals([(u'A.N. Other', 1), (u'Sidney Humphries', 2)],
+                    self.counts())
+            self.assertEquals([u'Sidney Humphries', u'A.N. Other'],
+                    [a.name for a in top_authors()])
+            self.assertEquals([3, 2], [e.updated.day for e in
+                entries_by(u'Sidney Humphries')])
@@ -0,0 +1,117 @@
+# -*- coding: UTF-8 -*-
+"""
+Marker clustering tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hListing, geo, geo_cluster
+from microformats.clusters import clusters, cell_for, cell_bounds,\
+        rebuild_clusters, add_point, remove_point, remember_old_position,\
+        MAX_ZOOM
+from microformats.instrumentation import QueryRecorder
+
+class ClusterTestCase(TestCase):
+        """
+        Testing the incrementally maintained geo clusters
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def test_cells(self):
+            """
+            Make sure points fall inside the bounds of their cell
+            """
+            for zoom in (0, 5, MAX_ZOOM):
+                x, y = cell_for(51.5072, -0.1275, zoom)
+                south, west, north, east = cell_bounds(x, y, zoom)
+                self.assertTrue(south <= 51.5072 < north)
+                self.assertTrue(west <= -0.1275 < east)
+
+        def test_clusters(self):
+            """
+            Make sure the clusters follow saves and deletes
+            """
+            g1 = geo(latitude=51.5072, longitude=-0.1275)
+            g1.save()
+            g2 = geo(latitude=51.5, longitude=-0.12)
+            g2.save()
+            listing = hListing(listing_action='sell', description='Pony',
+                    lister_fn='John Doe', item_fn='Django', latitude=50.8225,
+                    longitude=-0.1372)
+            listing.save()
+            # Zoomed right out everything is in one cluster
+            result = clusters(-90, -180, 90, 180, 0)
+            self.assertEquals(1, len(result))
+            self.assertEquals(3, result[0]['count'])
+            self.assertEquals('geo', result[0]['model'])
+            self.assertAlmostEquals((51.5072 + 51.5 + 50.8225) / 3,
+                    result[0]['latitude'])
+            # Zoomed in they're apart
+            result = clusters(50, -1, 52, 1, 10)
+            self.assertEquals([2, 1], sorted([c['count'] for c in result],
+                reverse=True))
+            self.assertEquals(1, len(clusters(50, -1, 52, 1, 10, ['hlisting'])))
+            self.assertEquals([], clusters(0, 10, 10, 20, 10))
+            # Moving and deleting
+            listing.latitude = 51.5
+            listing.longitude = -0.12
+            listing.save()
+            self.assertEquals([3], [c['count'] for c in
+                clusters(50, -1, 52, 1, 10)])
+            g1.delete()
+            result = clusters(50, -1, 52, 1, 10, [geo])
+            self.assertEquals([1], [c['count'] for c in result])
+            self.assertEquals(g2.pk, result[0]['pk'])
+            # Rebuilding gives the same answer
+            def summary():
+                return [(c['count'], c['model'], c['pk'],
+                    round(c['latitude'], 6), round(c['longitude'], 6))
+                    for c in clusters(-90, -180, 90, 180, 7)]
+            before = summary()
+            geo_cluster.objects.all().delete()
+            self.assertEquals(2, rebuild_clusters())
+            self.assertEquals(before, summary())
+
+        def count_queries(self, func, *args):
+            recorder = QueryRecorder()
+            recorder.start()
+            try:
+                func(*args)
+            finally:
+                recorder.stop()
+            return recorder.count
+
+        def test_write_queries(self):
+            """
+            Make sure changes cost a few statements whatever the number of
+            zoom levels
+            """
+            g = geo(latitude=51.5072, longitude=-0.1275)
+            g.save()
+            # Some of the cells exist, the rest are inserted in one go
+            self.assertEquals(3, self.count_queries(add_point, geo, 999, 51.5,
+                -0.12))
+            # Each zoom level has a cell shared with g or a new one
+            self.assertEquals(MAX_ZOOM + 1, geo_cluster.objects.filter(
+                count=2).count() + geo_cluster.objects.filter(
+                    representative=999).count())
+            x, y = cell_for(51.5, -0.12, MAX_ZOOM)
+            cell = lambda: geo_cluster.objects.get(zoom=MAX_ZOOM, cell_x=x,
+                    cell_y=y)
+            # All of them exist
+            self.assertEquals(1, self.count_queries(add_point, geo, 1000,
+                51.5, -0.12))
+            self.assertEquals(2, cell().count)
+            self.assertTrue(self.count_queries(remove_point, geo, 1000, 51.5,
+                -0.12) <= 5)
+            self.assertEquals(1, cell().count)
+            # A row read from the database knows where it was
+            g = geo.objects.get(pk=g.pk)
+            self.assertEquals(0, self.count_queries(remember_old_position,
+                geo, g))
+            self.assertEquals((51.5072, -0.1275), g._cluster_position)
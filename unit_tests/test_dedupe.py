@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+"""
+Duplicate contact detection tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hCard, hCardComplete, hCalendar, email,\
+        tel
+from microformats.dedupe import soundex, phone_digits, ContactRecord,\
+        similarity, find_duplicates, merge_hcards
+
+class DedupeTestCase(TestCase):
+        """
+        Testing duplicate detection and merging
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def make_hcard(self, given, family, email_work='', tel_work='',
+                locality=''):
+            hc = hCard()
+            hc.given_name = given
+            hc.family_name = family
+            hc.email_work = email_work
+            hc.tel_work = tel_work
+            hc.locality = locality
+            hc.save()
+            return hc
+
+        def test_normalisation(self):
+            """
+            Make sure the blocking key helpers normalise values sensibly
+            """
+            self.assertEquals('R163', soundex('Robert'))
+            self.assertEquals('R163', soundex('Rupert'))
+            self.assertEquals('T522', soundex('Tymczak'))
+            self.assertEquals('', soundex(''))
+            self.assertEquals(phone_digits('+44(0)1234 567876'),
+                    phone_digits('01234 567876'))
+            self.assertEquals('', phone_digits(''))
+
+        def test_similarity(self):
+            """
+            Make sure the weighted score rewards shared evidence
+            """
+            a = ContactRecord(1, 'Joe', 'Blogs', ['Joe@Acme.com'], [],
+                    'Milwaukee')
+            b = ContactRecord(2, 'Joe', 'Blogs', ['joe@acme.com '], [],
+                    'milwaukee')
+            c = ContactRecord(3, 'Fred', 'Smith', [], ['01234 567876'], '')
+            self.assertEquals(0.7, round(similarity(a, b), 2))
+            self.assertTrue(similarity(a, c) < 0.6)
+            self.assertTrue(u'e:joe@acme.com' in a.blocking_keys())
+
+        def test_find_duplicates(self):
+            """
+            Make sure we only cluster contacts that really look alike
+            """
+            h1 = self.make_hcard('Joe', 'Blogs', 'joe@acme.com',
+                    '+44(0)1234 567876', 'London')
+            h2 = self.make_hcard('Joseph', 'Blogs', 'JOE@acme.com',
+                    '01234 567876')
+            h3 = self.make_hcard('Jo', 'Blogs', ' JOE@ACME.COM', locality='London')
+            self.make_hcard('Fred', 'Smith', 'fred@acme.com')
+            expected = [[h1.pk, h2.pk, h3.pk]]
+            self.assertEquals(expected, find_duplicates(hCard.objects.all()))
+            # Chunking mustn't change the answer
+            self.assertEquals(expected, find_duplicates(hCard.objects.all(),
+                chunk_size=1))
+            # The complete hCard model works too
+            hc1 = hCardComplete(given_name='Joe', family_name='Blogs')
+            hc1.save()
+            hc2 = hCardComplete(given_name='Joe', family_name='Bloggs')
+            hc2.save()
+            for hc in (hc1, hc2):
+                email(hcard=hc, value='joe@acme.com').save()
+                tel(hcard=hc, value='01234 567876').save()
+            self.assertEquals([[hc1.pk, hc2.pk]],
+                    find_duplicates(hCardComplete.objects.all()))
+
+        def test_merge_hcards(self):
+            """
+            Make sure merging re-points the hCalendar relationships
+            """
+            h1 = self.make_hcard('Joe', 'Blogs')
+            h2 = self.make_hcard('Joe', 'Blogs', 'joe@acme.com')
+            h3 = self.make_hcard('Joe', 'Blogs')
+            event = hCalendar(summary='Meeting',
+                    dtstart=datetime.datetime(2009, 4, 11, 13, 30))
+            event.save()
+            event.attendees.add(h1, h2, h3)
+            event.organizers.add(h3)
+            merge_hcards(h1, [h2, h3])
+            self.assertEquals([h1.pk], [h.pk for h in event.attendees.all()])
+            self.assertEquals([h1.pk], [h.pk for h in event.organizers.all()])
+            self.assertEquals('joe@acme.com',
+                    hCard.objects.get(pk=h1.pk).email_work)
+            self.assertEquals(1, hCard.objects.count())
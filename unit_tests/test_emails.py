@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+"""
+Email address index tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hCard, hCardComplete, email, hListing,\
+        email_address
+from microformats.emails import lookup_emails, lookup_email,\
+        rebuild_email_index
+
+class EmailIndexTestCase(TestCase):
+        """
+        Testing the email address index
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def test_lookup_emails(self):
+            """
+            Make sure owners are found regardless of case and the index is
+            maintained by the signals
+            """
+            hc = hCard(given_name='Joe', email_work='Joe.Blogs@Acme.com',
+                    email_home='joe@home-isp.com')
+            hc.save()
+            hcc = hCardComplete(given_name='Joe')
+            hcc.save()
+            e1 = email(hcard=hcc, value='JOE.BLOGS@ACME.COM')
+            e1.save()
+            # A second row for the same contact only reports them once
+            e2 = email(hcard=hcc, value='joe.blogs@acme.com ')
+            e2.save()
+            listing = hListing(listing_action='sell', description='Pony',
+                    lister_fn='John Doe', item_fn='Django',
+                    lister_email='john.doe@isp.net')
+            listing.save()
+            result = lookup_emails(['joe.blogs@acme.com', 'JOHN.DOE@isp.net',
+                'nobody@example.com'])
+            self.assertEquals([hcc, hc], result['joe.blogs@acme.com'])
+            self.assertEquals([listing], result['john.doe@isp.net'])
+            self.assertFalse('nobody@example.com' in result)
+            # Changes and deletions are reflected in the index
+            hc.email_work = ''
+            hc.save()
+            e1.delete()
+            e2.delete()
+            self.assertEquals([], lookup_email('joe.blogs@acme.com'))
+            self.assertEquals([hc], lookup_email('Joe@Home-ISP.com'))
+            # Rebuilding the index
+            email_address.objects.all().delete()
+            self.assertEquals(2, rebuild_email_index(chunk_size=1))
+            self.assertEquals([hc], lookup_email('joe@home-isp.com'))
+            self.assertEquals([listing], lookup_email('john.doe@isp.net'))
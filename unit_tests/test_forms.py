@@ -11,9 +11,13 @@ import datetime
 # django
 from django.test.client import Client
 from django.test import TestCase
+from django.conf import settings
+from django.db import connection
 
 # project
 from microformats.forms import GeoForm, hCardForm, AdrForm, EmailForm, TelForm
+from microformats.models import tel_type, hCardComplete
+from microformats.vocabulary import tel_types
 
 class FormTestCase(TestCase):
         """
@@ -146,3 +150,45 @@ class FormTestCase(TestCase):
             p = f.as_p()
             self.assertEquals(True, p.find('type="checkbox" name="types"')>-1)
 
+        def test_vocabulary_queries(self):
+            """
+            Makes sure rendering lots of contact forms doesn't query the
+            vocabulary tables and that admin edits are picked up
+            """
+            # Prime the caches
+            AdrForm().as_p()
+            EmailForm().as_p()
+            TelForm().as_p()
+            old_debug = settings.DEBUG
+            settings.DEBUG = True
+            try:
+                start = len(connection.queries)
+                for i in range(50):
+                    AdrForm(prefix='adr%d' % i).as_p()
+                    EmailForm(prefix='email%d' % i).as_p()
+                    TelForm(prefix='tel%d' % i).as_p()
+                self.assertEquals(start, len(connection.queries))
+            finally:
+                settings.DEBUG = old_debug
+            # Saving a type throws away the cached copy
+            t = tel_type(name='x-sat')
+            t.save()
+            self.assertEquals(t.pk, tel_types.get_by_name('x-sat').pk)
+            # Validation works from memory too
+            hc = hCardComplete(given_name='Joe')
+            hc.save()
+            work = tel_types.get_by_name('work').pk
+            f = TelForm({'types': [str(work)], 'value': '01234 567876'})
+            self.assertEquals(True, f.is_valid())
+            self.assertEquals([work], [x.pk for x in f.cleaned_data['types']])
+            tel_instance = f.save(commit=False)
+            tel_instance.hcard = hc
+            tel_instance.save()
+            f.save_m2m()
+            self.assertEquals([work], [x.pk for x in tel_instance.types.all()])
+            f = TelForm({'types': ['9999'], 'value': '01234 567876'})
+            self.assertEquals(False, f.is_valid())
+            # M2M assignment helpers
+            tel_types.assign(tel_instance.types, ['home', 'cell'])
+            self.assertEquals(['cell', 'home'],
+                    sorted(x.name for x in tel_instance.types.all()))
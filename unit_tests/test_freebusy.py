@@ -0,0 +1,104 @@
+# -*- coding: UTF-8 -*-
+"""
+Free/busy tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hCard, hCalendar
+from microformats.freebusy import merge_intervals, find_conflicts,\
+        busy_periods, free_periods, double_booked, freebusy_ical
+
+D = datetime.datetime
+
+class FreeBusyTestCase(TestCase):
+        """
+        Testing the sweep-line free/busy engine
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            self.joe = hCard(given_name='Joe', family_name='Blogs')
+            self.joe.save()
+            self.fred = hCard(given_name='Fred', family_name='Smith')
+            self.fred.save()
+            self.lonely = hCard(given_name='Billy', family_name='Nomates')
+            self.lonely.save()
+            self.meeting = hCalendar(summary='Meeting',
+                    dtstart=D(2009, 4, 11, 9), dtend=D(2009, 4, 11, 11))
+            self.meeting.save()
+            self.meeting.attendees.add(self.joe, self.fred)
+            self.meeting.organizers.add(self.joe)
+            # Overlaps the meeting but only for Joe
+            self.lunch = hCalendar(summary='Lunch', dtstart=D(2009, 4, 11, 10),
+                    dtend=D(2009, 4, 11, 13))
+            self.lunch.save()
+            self.lunch.contacts.add(self.joe)
+            # 14:00 in Paris is 13:00 UTC so it follows straight on from lunch
+            self.talk = hCalendar(summary='Talk', dtstart=D(2009, 4, 11, 14),
+                    tz='+01:00')
+            self.talk.save()
+            self.talk.attendees.add(self.joe)
+            # Outside the window
+            old = hCalendar(summary='Old', dtstart=D(2008, 1, 1, 9))
+            old.save()
+            old.attendees.add(self.fred)
+            self.start = D(2009, 4, 11)
+            self.end = D(2009, 4, 12)
+
+        def test_intervals(self):
+            """
+            Make sure the sweep-line helpers merge and find overlaps
+            """
+            self.assertEquals([(1, 5), (7, 9)], merge_intervals([(3, 5),
+                (1, 2), (2, 3), (7, 9), (8, 8)]))
+            self.assertEquals([('a', 'b', 2, 3), ('a', 'c', 4, 5)],
+                    find_conflicts([(1, 5, 'a'), (2, 3, 'b'), (4, 6, 'c'),
+                        (6, 7, 'd')]))
+
+        def test_busy_periods(self):
+            """
+            Make sure busy and free time is worked out for many people at once
+            """
+            result = busy_periods([self.joe, self.fred.pk, self.lonely],
+                    self.start, self.end)
+            self.assertEquals([(D(2009, 4, 11, 9), D(2009, 4, 11, 14))],
+                    result[self.joe.pk])
+            self.assertEquals([(D(2009, 4, 11, 9), D(2009, 4, 11, 11))],
+                    result[self.fred.pk])
+            self.assertEquals([], result[self.lonely.pk])
+            free = free_periods([self.fred], self.start, self.end)
+            self.assertEquals([(self.start, D(2009, 4, 11, 9)),
+                (D(2009, 4, 11, 11), self.end)], free[self.fred.pk])
+
+        def test_double_booked(self):
+            """
+            Make sure only Joe is double booked (once - being both an attendee
+            and organizer of the meeting doesn't count)
+            """
+            result = double_booked(self.start, self.end)
+            self.assertEquals([self.joe.pk], result.keys())
+            self.assertEquals([(self.meeting.pk, self.lunch.pk,
+                D(2009, 4, 11, 10), D(2009, 4, 11, 11))], result[self.joe.pk])
+            self.assertEquals({}, double_booked(self.start, self.end,
+                [self.fred]))
+
+        def test_freebusy_ical(self):
+            """
+            Make sure the VFREEBUSY object lists the busy periods in UTC
+            """
+            ical = freebusy_ical(self.joe, self.start, self.end)
+            self.assertTrue(ical.startswith('BEGIN:VCALENDAR\r\n'))
+            self.assertTrue('DTSTART:20090411T000000Z\r\n' in ical)
+            self.assertTrue('FREEBUSY;FBTYPE=BUSY:20090411T090000Z/'\
+                    '20090411T140000Z\r\n' in ical)
+            self.assertFalse('FREEBUSY' in freebusy_ical(self.lonely,
+                self.start, self.end))
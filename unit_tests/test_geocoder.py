@@ -0,0 +1,99 @@
+# -*- coding: UTF-8 -*-
+"""
+Offline geocoder tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import codecs
+import os
+import tempfile
+
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hCard, hListing
+from microformats.clusters import clusters
+from microformats.geocoder import Gazetteer, build_index,\
+        fill_missing_coordinates, normalise_locality
+
+GAZETTEER = u'''GB\tCS23 6YT\tTownsville\tEngland\tENG\t\t\t\t\t51.5\t-0.5\t6
+GB\tCS23 7AA\tTownsville\tEngland\tENG\t\t\t\t\t51.7\t-0.7\t6
+FR\t42000\tSaint-Étienne\tRhône-Alpes\tB9\t\t\t\t\t45.43\t4.39\t5
+US\t53209\tMilwaukee\tWisconsin\tWI\t\t\t\t\t43.11\t-87.95\t4
+GB\tbroken row
+'''
+
+class GeocoderTestCase(TestCase):
+        """
+        Testing the offline gazetteer geocoder
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            self.dir = tempfile.mkdtemp()
+            self.tsv = os.path.join(self.dir, 'gazetteer.txt')
+            self.index = os.path.join(self.dir, 'gazetteer.idx')
+            f = codecs.open(self.tsv, 'w', 'utf-8')
+            f.write(GAZETTEER)
+            f.close()
+            self.assertEquals(7, build_index(self.tsv, self.index))
+            self.gazetteer = Gazetteer(self.index)
+
+        def tearDown(self):
+            self.gazetteer.close()
+            os.remove(self.tsv)
+            os.remove(self.index)
+            os.rmdir(self.dir)
+
+        def test_lookup(self):
+            """
+            Make sure postal codes are preferred and localities are averaged
+            """
+            self.assertEquals(u'saint-etienne',
+                    normalise_locality(u' Saint-Étienne '))
+            self.assertEquals((51.5, -0.5),
+                    self.gazetteer.lookup('GB', 'cs236yt', 'Townsville'))
+            lat, lng = self.gazetteer.lookup('GB', '', 'TOWNSVILLE')
+            self.assertAlmostEquals(51.6, lat)
+            self.assertAlmostEquals(-0.6, lng)
+            self.assertEquals((45.43, 4.39),
+                    self.gazetteer.lookup('FR', None, u'saint-etienne'))
+            self.assertEquals(None, self.gazetteer.lookup('GB', 'ZZ1 1ZZ',
+                'Nowhere'))
+            self.assertEquals(None, self.gazetteer.lookup('', '53209', ''))
+
+        def test_fill_missing_coordinates(self):
+            """
+            Make sure only rows without coordinates are geocoded
+            """
+            hc1 = hCard(given_name='Joe', country_name='US',
+                    postal_code='53209', locality='Milwaukee')
+            hc1.save()
+            hc2 = hCard(given_name='Fred', country_name='GB',
+                    locality='Townsville', latitude=1.0, longitude=2.0)
+            hc2.save()
+            hc3 = hCard(given_name='Jim', country_name='GB',
+                    locality='Nowhere')
+            hc3.save()
+            listing = hListing(listing_action='sell', description='Pony',
+                    lister_fn='John Doe', item_fn='Django',
+                    country_name='GB', postal_code='CS23 6YT')
+            listing.save()
+            result = fill_missing_coordinates(self.gazetteer, chunk_size=1)
+            self.assertEquals(1, result['hCard'])
+            self.assertEquals(1, result['hListing'])
+            hc1 = hCard.objects.get(pk=hc1.pk)
+            self.assertEquals((43.11, -87.95), (hc1.latitude, hc1.longitude))
+            hc2 = hCard.objects.get(pk=hc2.pk)
+            self.assertEquals((1.0, 2.0), (hc2.latitude, hc2.longitude))
+            self.assertEquals(None, hCard.objects.get(pk=hc3.pk).latitude)
+            listing = hListing.objects.get(pk=listing.pk)
+            self.assertEquals(51.5, listing.latitude)
+            # The geocoded rows are clustered like saved ones
+            for name, count in (('hcard', 2), ('hlisting', 1)):
+                self.assertEquals(count, sum([c['count'] for c in clusters(
+                    -90, -180, 90, 180, 0, [name])]))
@@ -0,0 +1,76 @@
+# -*- coding: UTF-8 -*-
+"""
+GeoJSON export tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+from StringIO import StringIO
+
+# django
+from django.test import TestCase
+from django.utils import simplejson
+
+# project
+from microformats.models import hCard, hCalendar, geo
+from microformats.geojson import export, features
+
+class GeoJSONTestCase(TestCase):
+        """
+        Testing the streaming GeoJSON export
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            self.hc = hCard(given_name='Joe', family_name='Blogs',
+                    locality='London', country_name='GB', latitude=51.5072,
+                    longitude=-0.1275)
+            self.hc.save()
+            self.event = hCalendar(summary='Important Meeting',
+                    dtstart=datetime.datetime(2009, 4, 11, 13, 30),
+                    locality='Auckland', latitude=-36.8406,
+                    longitude=174.74)
+            self.event.save()
+            self.g = geo(latitude=48.8567, longitude=2.3508)
+            self.g.save()
+            hCard(given_name='Nowhere').save()
+
+        def test_export(self):
+            """
+            Make sure the output is a valid FeatureCollection of the located
+            rows with their adr() text and key fields
+            """
+            out = StringIO()
+            self.assertEquals(3, export(out, chunk_size=1))
+            data = simplejson.loads(out.getvalue())
+            self.assertEquals('FeatureCollection', data['type'])
+            self.assertEquals(['hcard.%d' % self.hc.pk,
+                'hcalendar.%d' % self.event.pk, 'geo.%d' % self.g.pk],
+                [f['id'] for f in data['features']])
+            card = data['features'][0]
+            self.assertEquals([-0.1275, 51.5072],
+                    card['geometry']['coordinates'])
+            self.assertEquals('London, United Kingdom',
+                    card['properties']['adr'])
+            self.assertEquals('Blogs', card['properties']['family_name'])
+            self.assertEquals('2009-04-11 13:30:00',
+                    data['features'][1]['properties']['dtstart'])
+            self.assertFalse('adr' in data['features'][2]['properties'])
+
+        def test_filters(self):
+            """
+            Make sure the bbox and model filters work (including boxes that
+            cross the 180th meridian)
+            """
+            self.assertEquals(['hcard', 'geo'], [f['properties']['type'] for f
+                in features(bbox=(40, -10, 60, 10))])
+            self.assertEquals(['geo'], [f['properties']['type'] for f
+                in features(models=[geo], bbox=(40, -10, 60, 10))])
+            self.assertEquals(['hcalendar'], [f['properties']['type'] for f
+                in features(bbox=(-50, 170, -30, -170))])
+            out = StringIO()
+            self.assertEquals(0, export(out, bbox=(0, 0, 1, 1)))
+            self.assertEquals([], simplejson.loads(out.getvalue())['features'])
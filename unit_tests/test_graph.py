@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+"""
+XFN graph tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# django
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+# project
+from microformats.models import xfn, xfn_values, xfn_edge
+import microformats.graph as graph
+
+class GraphTestCase(TestCase):
+        """
+        Testing the XFN graph index and queries
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def link(self, user, url, *values):
+            x = xfn(source=user, target=url, url=url)
+            x.save()
+            for value in values:
+                x.relationships.add(xfn_values.objects.get(value=value))
+            return x
+
+        def setUp(self):
+            self.alice = User.objects.create_user('alice', 'a@example.com',
+                    'password')
+            self.bob = User.objects.create_user('bob', 'b@example.com',
+                    'password')
+            self.carol = User.objects.create_user('carol', 'c@example.com',
+                    'password')
+            self.link(self.alice, 'http://alice.example.com', 'me')
+            self.link(self.bob, 'http://bob.example.com/', 'me')
+            self.link(self.bob, 'http://twitter.com/bob', 'me')
+            self.link(self.carol, 'http://carol.example.com', 'me')
+            self.link(self.alice, 'http://bob.example.com', 'friend', 'met')
+            self.link(self.alice, 'http://Twitter.com/bob/', 'contact')
+            self.dave = self.link(self.alice, 'http://dave.example.com',
+                    'friend')
+            self.link(self.bob, 'http://alice.example.com/', 'friend')
+            self.link(self.bob, 'http://carol.example.com', 'colleague')
+            self.link(self.bob, 'http://erin.example.com', 'kin')
+            self.link(self.carol, 'http://frank.example.com', 'friend')
+            self.link(self.carol, 'http://alice.example.com', 'met')
+
+        def test_normalise_url(self):
+            """
+            Make sure different spellings of the same URL are one node
+            """
+            self.assertEquals(u'http://example.com/jeff',
+                    graph.normalise_url(u' HTTP://Example.com:80/jeff/#me'))
+            self.assertEquals(u'http://example.com',
+                    graph.normalise_url(u'example.com'))
+            self.assertEquals(u'https://example.com:8443/?a=1',
+                    graph.normalise_url(u'https://example.com:8443/?a=1'))
+            self.assertEquals(u'', graph.normalise_url(None))
+
+        def test_index(self):
+            """
+            Make sure the edges follow the xfn rows
+            """
+            self.assertEquals(12, xfn_edge.objects.count())
+            self.dave.url = 'http://dave.example.org/'
+            self.dave.save()
+            self.assertEquals(u'http://dave.example.org',
+                    xfn_edge.objects.get(link=self.dave).url_key)
+            self.dave.delete()
+            self.assertEquals(11, xfn_edge.objects.count())
+            xfn_edge.objects.all().delete()
+            self.assertEquals(11, graph.rebuild_xfn_graph(chunk_size=5))
+            self.assertEquals(11, xfn_edge.objects.count())
+
+        def check(self, source):
+            """
+            The queries both the SQL functions and the snapshot answer
+            """
+            self.assertEquals([u'http://bob.example.com',
+                u'http://dave.example.com', u'http://twitter.com/bob'],
+                source.contacts(self.alice))
+            self.assertEquals([self.bob.pk],
+                    source.owners('HTTP://BOB.example.com/'))
+            self.assertEquals([], source.owners('http://dave.example.com'))
+            self.assertEquals((3, 2), source.degree(self.alice))
+            self.assertEquals((3, 1), source.degree(self.bob))
+            self.assertEquals([u'http://alice.example.com'],
+                    source.mutual_contacts(self.bob, self.carol))
+            self.assertEquals([(u'http://carol.example.com', 2),
+                (u'http://erin.example.com', 2)],
+                source.friends_of_friends(self.alice))
+            self.assertEquals([(u'http://carol.example.com', 2)],
+                source.friends_of_friends(self.alice, 1))
+            self.assertEquals({u'http://bob.example.com': 1,
+                u'http://dave.example.com': 1, u'http://twitter.com/bob': 1,
+                u'http://carol.example.com': 2,
+                u'http://erin.example.com': 2}, source.bfs(self.alice))
+            self.assertEquals(u'http://frank.example.com' in
+                    source.bfs(self.alice, 3), True)
+            self.assertEquals({u'http://bob.example.com': 1,
+                u'http://dave.example.com': 1, u'http://twitter.com/bob': 1,
+                u'http://carol.example.com': 2}, source.bfs(self.alice, 3,
+                    max_nodes=4))
+
+        def test_sql(self):
+            """
+            Make sure the set based SQL queries walk the graph
+            """
+            self.check(graph)
+
+        def test_snapshot(self):
+            """
+            Make sure the in-memory snapshot gives the same answers
+            """
+            snapshot = graph.GraphSnapshot.load()
+            self.assertEquals(12, len(snapshot))
+            self.check(snapshot)
+            self.assertEquals([], snapshot.contacts(-1))
+            self.assertEquals(True, graph.get_graph_snapshot() is
+                    graph.get_graph_snapshot())
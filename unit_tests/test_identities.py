@@ -0,0 +1,126 @@
+# -*- coding: UTF-8 -*-
+"""
+rel="me" identity tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# django
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+# project
+from microformats.models import xfn, xfn_values, url_identity, hCard
+from microformats.forms import XfnForm
+from microformats.identities import identity_for, identities_for,\
+        same_identity, identity_urls, user_identity, collapse, hcards_for,\
+        resolve_identities, rebuild_identities
+
+class IdentityTestCase(TestCase):
+        """
+        Testing the rel="me" identity resolution
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def form(self, user, url, *values):
+            return XfnForm({'source': user.pk, 'target': url, 'url': url,
+                'relationships': [xfn_values.objects.get(value=value).pk for
+                    value in values]})
+
+        def link(self, user, url, *values):
+            return self.form(user, url, *values).save()
+
+        def setUp(self):
+            self.bob = User.objects.create_user('bob', 'b@example.com',
+                    'password')
+            self.robert = User.objects.create_user('robert', 'r@example.com',
+                    'password')
+            self.link(self.bob, 'http://bob.example.com/', 'me')
+            self.link(self.bob, 'http://twitter.com/bob', 'me')
+            self.link(self.robert, 'http://robert.example.org', 'me')
+            self.link(self.robert, 'http://erin.example.com', 'friend')
+
+        def test_incremental(self):
+            """
+            Make sure identities are merged as rel="me" links arrive
+            """
+            bob = identity_for('http://BOB.example.com')
+            self.assertEquals(bob, identity_for('http://twitter.com/bob/'))
+            robert = identity_for('http://robert.example.org')
+            self.assertNotEquals(bob, robert)
+            self.assertEquals(None, identity_for('http://erin.example.com'))
+            self.assertEquals(False, same_identity('http://twitter.com/bob',
+                'http://robert.example.org'))
+            # Robert turns out to be bob
+            self.link(self.robert, 'http://twitter.com/bob', 'me')
+            self.assertEquals(True, same_identity('http://twitter.com/bob',
+                'http://robert.example.org/'))
+            self.assertEquals(user_identity(self.bob),
+                    user_identity(self.robert))
+            self.assertEquals([u'http://bob.example.com',
+                u'http://robert.example.org', u'http://twitter.com/bob'],
+                identity_urls(identity_for('http://bob.example.com')))
+            # Bob's identity was the bigger one
+            self.assertEquals(bob, identity_for('http://robert.example.org'))
+            self.assertEquals(1, len(set(url_identity.objects.values_list(
+                'identity', flat=True))))
+
+        def test_admin(self):
+            """
+            Make sure links saved the way the admin saves them (the link,
+            then its relationships) are picked up
+            """
+            form = self.form(self.robert, 'http://twitter.com/bob', 'me')
+            x = form.save(commit=False)
+            x.save()
+            self.assertEquals(False, same_identity('http://twitter.com/bob',
+                'http://robert.example.org'))
+            form.save_m2m()
+            self.assertEquals(True, same_identity('http://twitter.com/bob',
+                'http://robert.example.org'))
+
+        def test_resolve(self):
+            """
+            Make sure rel="me" links saved before their relationships are
+            picked up
+            """
+            x = xfn(source=self.robert, target='Bob',
+                    url='http://bob.example.com')
+            x.save()
+            x.relationships.add(xfn_values.objects.get(value='me'))
+            self.assertEquals(False, same_identity('http://bob.example.com',
+                'http://robert.example.org'))
+            self.assertEquals(1, resolve_identities())
+            self.assertEquals(True, same_identity('http://bob.example.com',
+                'http://robert.example.org'))
+            self.assertEquals(0, resolve_identities())
+
+        def test_rebuild(self):
+            """
+            Make sure identities are split when rel="me" links go
+            """
+            link = self.link(self.robert, 'http://bob.example.com', 'me')
+            self.assertEquals(True, same_identity('http://twitter.com/bob',
+                'http://robert.example.org'))
+            link.delete()
+            self.assertEquals(2, rebuild_identities())
+            self.assertEquals(False, same_identity('http://twitter.com/bob',
+                'http://robert.example.org'))
+            self.assertEquals(3, url_identity.objects.count())
+
+        def test_collapse(self):
+            """
+            Make sure duplicates are collapsed for rendering
+            """
+            urls = ['http://twitter.com/bob', 'http://erin.example.com',
+                    'http://bob.example.com', 'http://erin.example.com/',
+                    'http://robert.example.org']
+            self.assertEquals(['http://twitter.com/bob',
+                'http://erin.example.com', 'http://robert.example.org'],
+                collapse(urls))
+            self.assertEquals(3, len(identities_for(urls)))
+            hc = hCard(given_name='Bob', family_name='Smith',
+                    url='http://twitter.com/bob')
+            hc.save()
+            self.assertEquals([hc], list(hcards_for('http://bob.example.com/')))
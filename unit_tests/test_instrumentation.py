@@ -0,0 +1,115 @@
+# -*- coding: UTF-8 -*-
+"""
+Render instrumentation tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+
+# project
+from microformats.models import hFeed, hEntry
+from microformats.instrumentation import query_shape, instrumented,\
+        RenderCollector, RenderQueryAssertions, RenderQueriesMiddleware
+from microformats.templatetags.microformat_extras import hfeed
+
+class InstrumentationTestCase(TestCase, RenderQueryAssertions):
+        """
+        Testing the recording of the queries made while rendering
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            self.feed = hFeed(category='news')
+            self.feed.save()
+            for day in (1, 2, 3):
+                hEntry(hfeed=self.feed, entry_title='Entry %d' % day,
+                        updated=datetime.datetime(2009, 6, day)).save()
+
+        def test_query_shape(self):
+            """
+            Queries differing only in their values have the same shape
+            """
+            self.assertEquals(query_shape("SELECT a FROM t WHERE id IN (%s, %s)"
+                " AND b = 'x' AND c = 12"), query_shape("SELECT a FROM t "
+                "WHERE id IN (%s, %s, %s) AND b = 'y''s'  AND c = 3"))
+            self.assertNotEquals(query_shape('SELECT a FROM t1'),
+                    query_shape('SELECT a FROM t2'))
+
+        def test_records(self):
+            """
+            Each outermost render is recorded with its queries
+            """
+            collector = RenderCollector()
+            collector.start()
+            try:
+                hfeed(self.feed)
+            finally:
+                collector.stop()
+            self.assertEquals(1, len(collector.renders))
+            record = collector.renders[0]
+            self.assertEquals('hfeed', record.name)
+            self.assertEquals('microformats.hFeed', record.model)
+            self.assertEquals(self.feed.pk, record.pk)
+            self.assertEquals('hfeed.html', record.template_name)
+            # The tags and the entries
+            self.assertEquals(2, record.count)
+            self.assertEquals([], record.n_plus_one())
+            # Nothing is recorded once the collector has stopped
+            hfeed(self.feed)
+            self.assertEquals(1, len(collector.renders))
+
+        def test_assertions(self):
+            """
+            The assertion helpers pass and fail as they should
+            """
+            self.assertRenderQueries(2, hfeed, self.feed)
+            self.assertNoNPlusOne(hfeed, self.feed)
+            # Reading the feed of each entry is a query per entry
+            feeds = instrumented(lambda feed: [entry.hfeed.category for
+                entry in feed.entries.all()], 'feeds')
+            self.assertRaises(AssertionError, self.assertNoNPlusOne, feeds,
+                    self.feed)
+            self.assertRaises(AssertionError, self.assertRenderQueries, 1,
+                    feeds, self.feed)
+
+        def test_middleware(self):
+            """
+            The middleware reports the renders of a request when DEBUG is on
+            """
+            middleware = RenderQueriesMiddleware()
+            debug = settings.DEBUG
+            settings.DEBUG = True
+            try:
+                request = HttpRequest()
+                middleware.process_request(request)
+                hfeed(self.feed)
+                response = middleware.process_response(request,
+                        HttpResponse())
+            finally:
+                settings.DEBUG = debug
+            self.assertEquals('1 renders, 2 queries, 0 N+1',
+                    response['X-Microformat-Queries'])
+            request = HttpRequest()
+            middleware.process_request(request)
+            response = middleware.process_response(request, HttpResponse())
+            self.assertFalse(response.has_header('X-Microformat-Queries'))
+            # A view that raises doesn't leave the collector running
+            settings.DEBUG = True
+            try:
+                request = HttpRequest()
+                middleware.process_request(request)
+                collector = request.microformat_renders
+                middleware.process_exception(request, ValueError())
+                hfeed(self.feed)
+            finally:
+                settings.DEBUG = debug
+            self.assertEquals([], collector.renders)
+            self.assertFalse(hasattr(request, 'microformat_renders'))
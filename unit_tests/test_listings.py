@@ -0,0 +1,102 @@
+# -*- coding: UTF-8 -*-
+"""
+hListing expiry and archive tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+from StringIO import StringIO
+
+# django
+from django.test import TestCase
+from django.utils import simplejson
+
+# project
+from microformats.models import hListing, hlisting_archive
+from microformats import listings
+from microformats.listings import archive_expired, restore
+
+D = datetime.datetime
+
+class ListingTestCase(TestCase):
+        """
+        Testing expired listings
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            self.now = D(2009, 4, 11, 12)
+            self.current = self.make_listing('sell', D(2009, 5, 1))
+            self.forever = self.make_listing('wanted', None)
+            self.old = self.make_listing('sell', D(2009, 4, 1))
+            self.older = self.make_listing('rent', D(2009, 3, 1))
+
+        def make_listing(self, action, expires):
+            listing = hListing(listing_action=action, lister_fn='Joe Blogs',
+                    item_fn='Bicycle', price=u'£50', dtexprired=expires)
+            listing.save()
+            return listing
+
+        def test_active(self):
+            """
+            Make sure the manager knows which listings have expired
+            """
+            self.assertEquals([self.current.pk, self.forever.pk], [l.pk for l
+                in hListing.objects.active(now=self.now).order_by('pk')])
+            self.assertEquals([self.current.pk], [l.pk for l in
+                hListing.objects.active('sell', self.now)])
+            self.assertEquals([self.old.pk, self.older.pk], [l.pk for l in
+                hListing.objects.expired(now=self.now).order_by('pk')])
+
+        def test_archive_table(self):
+            """
+            Make sure expired listings are moved to the archive table in
+            batches and can be restored
+            """
+            self.assertEquals(2, archive_expired(self.now, batch_size=1))
+            self.assertEquals([self.current.pk, self.forever.pk], [l.pk for l
+                in hListing.objects.order_by('pk')])
+            archived = hlisting_archive.objects.get(original_id=self.old.pk)
+            self.assertEquals('sell', archived.listing_action)
+            self.assertEquals(D(2009, 4, 1), archived.dtexprired)
+            listing = restore(archived.data)
+            self.assertEquals(self.old.pk, listing.pk)
+            self.assertEquals(u'£50', hListing.objects.get(
+                pk=self.old.pk).price)
+
+        def test_archive_file(self):
+            """
+            Make sure expired listings can be written to a JSON lines file
+            """
+            out = StringIO()
+            self.assertEquals(1, archive_expired(self.now, out,
+                listing_action='rent'))
+            lines = out.getvalue().splitlines()
+            self.assertEquals(1, len(lines))
+            record = simplejson.loads(lines[0])
+            self.assertEquals(self.older.pk, record['pk'])
+            self.assertEquals('Bicycle', record['fields']['item_fn'])
+            self.assertEquals(0, hlisting_archive.objects.count())
+            self.assertEquals(3, hListing.objects.count())
+            self.assertRaises(ValueError, archive_expired, self.now,
+                    photos='burn')
+
+        def test_failed_batch(self):
+            """
+            Make sure nothing is written to the file for a batch that fails
+            """
+            def broken(listing):
+                if listing.pk == self.old.pk:
+                    raise ValueError('Broken')
+                return listing_record(listing)
+            listing_record = listings.listing_record
+            listings.listing_record = broken
+            out = StringIO()
+            try:
+                self.assertRaises(ValueError, archive_expired, self.now, out)
+            finally:
+                listings.listing_record = listing_record
+            self.assertEquals('', out.getvalue())
@@ -0,0 +1,127 @@
+# -*- coding: UTF-8 -*-
+"""
+Template filter metrics tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test.client import Client
+from django.test import TestCase
+from django.conf import settings
+
+# project
+from microformats.models import hFeed, hEntry
+import microformats.metrics
+from microformats.metrics import BUCKETS, FilterMetrics, filter_metrics,\
+        slow_renders, reset_metrics, prometheus_text
+from microformats.templatetags.microformat_extras import hfeed, rel_tag
+
+class MetricsTestCase(TestCase):
+        """
+        Testing the per filter metrics and the slow render log
+        """
+        # Reference fixtures here
+        fixtures = []
+        urls = 'microformats.urls'
+
+        def setUp(self):
+            reset_metrics()
+            self.feed = hFeed(category='news')
+            self.feed.save()
+            hEntry(hfeed=self.feed, entry_title=u'Caf\xe9',
+                    updated=datetime.datetime(2009, 6, 1)).save()
+
+        def test_filter_metrics(self):
+            """
+            Calls, time and the bytes emitted are counted per filter
+            """
+            result = hfeed(self.feed)
+            hfeed(self.feed)
+            metrics = filter_metrics()['hfeed']
+            self.assertEquals(2, metrics['calls'])
+            self.assertEquals(2 * len(result.encode('utf-8')), metrics['bytes'])
+            self.assertEquals(2, sum([count for bound, count in
+                metrics['buckets']]))
+            self.assertTrue(metrics['seconds'] > 0)
+            self.assertTrue(0 < metrics['p50'] <= metrics['p99'])
+            self.assertEquals(0, filter_metrics()['hcard']['calls'])
+            self.assertEquals(None, filter_metrics()['hcard']['p50'])
+
+        def test_nested(self):
+            """
+            Filters called while another is rendering are only counted as
+            part of the outer one
+            """
+            result = hfeed(self.feed)
+            self.assertTrue(u'rel="tag"' in result)
+            self.assertEquals(1, filter_metrics()['hfeed']['calls'])
+            self.assertEquals(0, filter_metrics()['rel_tag']['calls'])
+            rel_tag(u'news')
+            self.assertEquals(1, filter_metrics()['rel_tag']['calls'])
+
+        def test_percentile(self):
+            """
+            Percentiles are interpolated within their bucket
+            """
+            metrics = FilterMetrics('test')
+            for i in range(10):
+                metrics.observe(BUCKETS[3], 0)
+            self.assertAlmostEquals(BUCKETS[2] + (BUCKETS[3] - BUCKETS[2]) / 2,
+                    metrics.percentile(50))
+            self.assertEquals(BUCKETS[3], metrics.percentile(100))
+            metrics.observe(BUCKETS[-1] * 2, 0)
+            self.assertEquals(BUCKETS[-1], metrics.percentile(100))
+
+        def test_prometheus_text(self):
+            """
+            The histogram buckets are cumulative and end with +Inf
+            """
+            hfeed(self.feed)
+            text = prometheus_text()
+            self.assertTrue('# TYPE microformat_filter_seconds histogram' in
+                    text)
+            self.assertTrue('microformat_filter_seconds_bucket{filter="hfeed",le="+Inf"} 1\n'
+                    in text)
+            self.assertTrue('microformat_filter_seconds_count{filter="hfeed"} 1\n'
+                    in text)
+            self.assertTrue('microformat_filter_bytes_total{filter="hcard"} 0\n'
+                    in text)
+
+        def test_slow_renders(self):
+            """
+            Renders over the threshold are logged with the model, pk and
+            template
+            """
+            hfeed(self.feed)
+            self.assertEquals([], slow_renders())
+            threshold = microformats.metrics.SLOW_MICROFORMAT_RENDER
+            microformats.metrics.SLOW_MICROFORMAT_RENDER = 0.0000001
+            try:
+                hfeed(self.feed)
+            finally:
+                microformats.metrics.SLOW_MICROFORMAT_RENDER = threshold
+            self.assertEquals(1, len(slow_renders()))
+            render = slow_renders()[0]
+            self.assertEquals('microformats.hFeed', render['model'])
+            self.assertEquals(self.feed.pk, render['pk'])
+            self.assertEquals('hfeed.html', render['template_name'])
+
+        def test_view(self):
+            """
+            The metrics are only served when MICROFORMAT_METRICS_VIEW is on
+            """
+            c = Client()
+            response = c.get('/metrics')
+            self.assertEquals(404, response.status_code)
+            settings.MICROFORMAT_METRICS_VIEW = True
+            try:
+                response = c.get('/metrics')
+            finally:
+                settings.MICROFORMAT_METRICS_VIEW = False
+            self.assertEquals(200, response.status_code)
+            self.assertTrue(response['Content-Type'].startswith('text/plain'))
+            self.assertTrue('microformat_filter_seconds' in response.content)
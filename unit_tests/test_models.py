@@ -12,6 +12,7 @@ import datetime
 from django.test.client import Client
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.utils import translation
 
 # project
 from microformats.models import *
@@ -160,6 +161,79 @@ class ModelTestCase(TestCase):
                     ' a summary'
             self.assertEquals(expected, hc.__unicode__())
 
+        def test_participants(self):
+            """
+            Make sure changes to the attendees, contacts and organizers are
+            copied to the participant table (and the other way round for bulk
+            assignment, which skips existing rows)
+            """
+            joe = hCard(given_name='Joe', family_name='Blogs')
+            joe.save()
+            fred = hCard(given_name='Fred', family_name='Smith')
+            fred.save()
+            meeting = hCalendar(summary='Meeting',
+                    dtstart=datetime.datetime(2009, 4, 11, 13, 30))
+            meeting.save()
+            party = hCalendar(summary='Party',
+                    dtstart=datetime.datetime(2009, 4, 11, 20, 00))
+            party.save()
+            meeting.attendees.add(joe, fred)
+            meeting.organizers.add(joe)
+            self.assertEquals([joe.pk, fred.pk], [h.pk for h in
+                meeting.attendees.order_by('pk')])
+            self.assertEquals([joe.pk], [h.pk for h in
+                meeting.organizers.all()])
+            self.assertEquals(0, meeting.contacts.count())
+            self.assertEquals([meeting.pk], [e.pk for e in
+                joe.organizers.all()])
+            # The fields still work in ORM lookups
+            self.assertEquals([meeting.pk], [e.pk for e in
+                hCalendar.objects.filter(attendees__given_name='Fred')])
+            self.assertEquals([joe.pk], [h.pk for h in
+                hCard.objects.filter(organizers__summary='Meeting')])
+            # ...as do the same lookups through the participant table
+            self.assertEquals([meeting.pk], [e.pk for e in
+                hCalendar.objects.filter(participants__role='attendee',
+                    participants__hcard__given_name='Fred')])
+            self.assertEquals([joe.pk], [h.pk for h in
+                hCard.objects.filter(participations__role='organizer',
+                    participations__event__summary='Meeting')])
+            # Bulk assignment only inserts the missing rows
+            self.assertEquals(4, participant.objects.assign([meeting, party],
+                [joe, fred.pk], 'contact'))
+            self.assertEquals(0, participant.objects.assign([meeting, party],
+                [joe, fred], 'contact'))
+            self.assertEquals([joe.pk, fred.pk], [h.pk for h in
+                party.contacts.order_by('pk')])
+            self.assertEquals([meeting.pk, party.pk], [e.pk for e in
+                fred.contacts.order_by('pk')])
+            self.assertEquals([meeting.pk, party.pk], [e.pk for e in
+                participant.objects.events_for(joe).order_by('pk')])
+            self.assertEquals([party.pk], [e.pk for e in
+                participant.objects.events_for(fred).filter(
+                    summary='Party')])
+            meeting.attendees.remove(fred)
+            self.assertEquals([joe.pk], [h.pk for h in
+                meeting.attendees.all()])
+            self.assertEquals([joe.pk], [p.hcard_id for p in
+                meeting.participants.filter(role='attendee')])
+            party.contacts = [fred]
+            self.assertEquals([fred.pk], [h.pk for h in
+                party.contacts.all()])
+            self.assertEquals([fred.pk], [p.hcard_id for p in
+                party.participants.filter(role='contact')])
+            joe.organizers.clear()
+            self.assertEquals(0, meeting.organizers.count())
+            self.assertEquals(0, joe.participations.filter(
+                role='organizer').count())
+            participant.objects.unassign([meeting], [joe])
+            self.assertEquals([fred.pk], [h.pk for h in
+                meeting.contacts.all()])
+            self.assertEquals(0, meeting.attendees.count())
+            self.assertEquals(1, meeting.participants.count())
+            self.assertEquals(u'Fred Smith (Contact)',
+                    unicode(meeting.participants.get()))
+
         def test_xfn(self):
             """
             Make sure the string representation of the XFN looks correct
@@ -200,3 +274,26 @@ class ModelTestCase(TestCase):
             f.save()
             self.assertEqual(u'Some, tags', f.__unicode__())
 
+        def test_choice_indexes(self):
+            """
+            Make sure country and timezone names come from the precomputed
+            per-language indexes and match Django's own display methods
+            """
+            hc = hCard()
+            hc.locality = 'London'
+            hc.country_name = 'GB'
+            hc.tz = '+01:00'
+            self.assertEquals(hc.get_country_name_display(),
+                    country_name_display('GB'))
+            self.assertEquals(hc.get_tz_display(), timezone_display('+01:00'))
+            self.assertEquals(u'London, United Kingdom', hc.adr())
+            # Unknown values are passed through
+            self.assertEquals('XX', country_name_display('XX'))
+            self.assertEquals('+13:00', timezone_display('+13:00'))
+            # Each language gets its own index
+            translation.activate('fr')
+            try:
+                self.assertEquals(hc.get_country_name_display(),
+                        country_name_display('GB'))
+            finally:
+                translation.deactivate()
@@ -0,0 +1,70 @@
+# -*- coding: UTF-8 -*-
+"""
+Telephone number normalisation and lookup tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hCard, hCardComplete, tel, hListing,\
+        phone_number
+from microformats.phones import normalise_phone, find_by_phone,\
+        backfill_phone_index
+
+class PhoneTestCase(TestCase):
+        """
+        Testing telephone number normalisation and reverse lookups
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def test_normalise_phone(self):
+            """
+            Make sure different ways of writing a number give the same key
+            """
+            self.assertEquals('+441234567876',
+                    normalise_phone('+44(0)1234 567876'))
+            self.assertEquals('+441234567876',
+                    normalise_phone('0044 1234 567876'))
+            self.assertEquals('+441234567876',
+                    normalise_phone('+44 1234-567876 ext. 123'))
+            self.assertEquals('01234567876', normalise_phone('01234 567876'))
+            self.assertEquals('+441234567876',
+                    normalise_phone('01234 567876', country_code='44'))
+            self.assertEquals('', normalise_phone('n/a'))
+            self.assertEquals('', normalise_phone(None))
+
+        def test_find_by_phone(self):
+            """
+            Make sure the index is maintained on save/delete and can be
+            searched across models
+            """
+            hc = hCard(given_name='Joe', tel_work='+44(0)1234 567876',
+                    tel_home='01543 234345')
+            hc.save()
+            hcc = hCardComplete(given_name='Joe')
+            hcc.save()
+            t = tel(hcard=hcc, value='+44 1234 567876')
+            t.save()
+            listing = hListing(listing_action='sell', description='Pony',
+                    lister_fn='John Doe', item_fn='Django',
+                    lister_tel='0044 1234 567876')
+            listing.save()
+            self.assertEquals([hc, listing, t],
+                    find_by_phone('+44 (0) 1234 567876'))
+            self.assertEquals([t], find_by_phone('+441234567876', [tel]))
+            self.assertEquals([hc], find_by_phone('01543 234345'))
+            # Changing a number updates the index
+            hc.tel_home = ''
+            hc.save()
+            self.assertEquals([], find_by_phone('01543 234345'))
+            # Deleting removes it
+            listing.delete()
+            self.assertEquals([hc, t], find_by_phone('+441234567876'))
+            # Backfilling rebuilds anything that's missing
+            phone_number.objects.all().delete()
+            self.assertEquals(2, backfill_phone_index([hCard, tel], 1))
+            self.assertEquals([hc, t], find_by_phone('+441234567876'))
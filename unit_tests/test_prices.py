@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+"""
+Price parsing tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+from decimal import Decimal
+
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hListing
+from microformats.prices import parse_price, price_between, order_by_price,\
+        backfill_prices
+
+class PriceTestCase(TestCase):
+        """
+        Testing the parsed hListing prices
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def make_listing(self, price):
+            listing = hListing(listing_action='sell', lister_fn='Joe Blogs',
+                    item_fn='Bicycle', price=price)
+            listing.save()
+            return listing
+
+        def test_parse_price(self):
+            """
+            Make sure we get the amount and currency out of the free text
+            """
+            for text, expected in (
+                    (u'£1,250 ono', (Decimal('1250.00'), 'GBP')),
+                    (u'EUR 99.50', (Decimal('99.50'), 'EUR')),
+                    (u'$1.5k', (Decimal('1500.00'), 'USD')),
+                    (u'1.234,56 €', (Decimal('1234.56'), 'EUR')),
+                    (u'US$ 20', (Decimal('20.00'), 'USD')),
+                    (u'100 quid', (Decimal('100.00'), 'GBP')),
+                    (u'£100 - £150', (Decimal('100.00'), 'GBP')),
+                    (u'Free to a good home', (Decimal('0.00'), '')),
+                    (u'12.5', (Decimal('12.50'), '')),
+                    (u'No offers', (None, '')),
+                    # The number next to the currency, not the first one
+                    (u'2 bed flat, £850 pcm', (Decimal('850.00'), 'GBP')),
+                    (u'3 for €10', (Decimal('10.00'), 'EUR')),
+                    (u'850 GBP pcm', (Decimal('850.00'), 'GBP')),
+                    (u'Was £20 now £15', (Decimal('15.00'), 'GBP')),
+                    (u'', (None, '')),
+                    ):
+                self.assertEquals(expected, parse_price(text))
+
+        def test_range(self):
+            """
+            Make sure the parsed price is stored on save and used for range
+            searches and sorting
+            """
+            cheap = self.make_listing(u'£50')
+            middle = self.make_listing(u'£250 ono')
+            dear = self.make_listing(u'£499.99')
+            euros = self.make_listing(u'€300')
+            unknown = self.make_listing(u'Offers')
+            self.assertEquals(Decimal('250.00'), hListing.objects.get(
+                pk=middle.pk).price_amount)
+            self.assertEquals('GBP', middle.price_currency)
+            self.assertEquals([middle.pk, dear.pk], [l.pk for l in
+                price_between(100, 500, 'gbp')])
+            self.assertEquals([middle.pk, euros.pk, dear.pk], [l.pk for l in
+                price_between(low=100)])
+            self.assertFalse('price_is_null' in str(price_between(100, 500,
+                'gbp').query))
+            self.assertEquals([dear.pk, euros.pk, middle.pk, cheap.pk,
+                unknown.pk], [l.pk for l in order_by_price(
+                    hListing.objects.all(), descending=True)])
+
+        def test_backfill(self):
+            """
+            Make sure existing rows can be parsed in bulk
+            """
+            listing = self.make_listing(u'$20')
+            hListing.objects.update(price_amount=None, price_currency='')
+            self.assertEquals(1, backfill_prices(chunk_size=1))
+            listing = hListing.objects.get(pk=listing.pk)
+            self.assertEquals((Decimal('20.00'), 'USD'),
+                    (listing.price_amount, listing.price_currency))
@@ -0,0 +1,134 @@
+# -*- coding: UTF-8 -*-
+"""
+Template field projection tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+from django.template import Template
+
+# project
+from microformats.models import hFeed, hEntry, hCard
+from microformats.projection import template_paths, loop_names,\
+        projection, template_projection, narrow, clear_cache
+from microformats.templatetags.microformat_extras import hfeed, river
+
+class ProjectionTestCase(TestCase):
+        """
+        Testing the narrowing of querysets to the fields a template uses
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            clear_cache()
+            self.feed = hFeed(category='news')
+            self.feed.save()
+            self.entry = hEntry(hfeed=self.feed, entry_title='A title',
+                    entry_content='A very long piece of content',
+                    updated=datetime.datetime(2009, 6, 1))
+            self.entry.save()
+
+        def test_template_paths(self):
+            """
+            The lookups made on the variable are found in tags, filter
+            arguments and loops, and nothing else is
+            """
+            template = Template('{% if instance.bookmark %}'
+                    '{{instance.entry_title|default:instance.author}}'
+                    '{% endif %}{% for x in instance.tags.all %}{{x}}'
+                    '{% endfor %}{{other.entry_content}}')
+            self.assertEquals(set([('bookmark',), ('entry_title',),
+                ('author',), ('tags', 'all')]), template_paths(template))
+            # Using the variable whole can't be seen through
+            self.assertEquals(None, template_paths(Template(
+                '{{instance.entry_title}}{{instance}}')))
+            self.assertEquals(None, template_paths(Template(
+                '{{instance|upper}}')))
+            # Other variables can be asked about
+            self.assertEquals(set([('entry_content',)]),
+                    template_paths(template, 'other'))
+
+        def test_included_templates(self):
+            """
+            Included templates are searched too (and filters that declare the
+            fields they read are understood)
+            """
+            includes = {'adr_microformat_template': 'adr.html'}
+            paths = template_paths('hcard.html', includes=includes)
+            self.assertTrue(('given_name',) in paths)
+            self.assertTrue(('street_address',) in paths)
+            self.assertTrue(('country_name',) in paths)
+            # We don't know what template the variable holds
+            self.assertEquals(None, template_paths('hcard.html'))
+
+        def test_projection(self):
+            """
+            Lookups are turned into fields to load and foreign keys to follow
+            """
+            fields, related = projection(hEntry, set([('entry_title',),
+                ('updated', 'isoformat'), ('hfeed', 'category'), ('pk',),
+                ('tags', 'all')]))
+            self.assertEquals(set(['entry_title', 'updated', 'hfeed']), fields)
+            self.assertEquals(set(['hfeed']), related)
+            # The key alone doesn't need a join
+            fields, related = projection(hEntry, set([('hfeed_id',),
+                ('hfeed', 'id')]))
+            self.assertEquals(set(['hfeed']), fields)
+            self.assertEquals(set(), related)
+            # Choice display methods read their field
+            fields, related = projection(hCard, set([('get_tz_display',)]))
+            self.assertEquals(set(['tz']), fields)
+            # Methods and properties could read anything
+            self.assertEquals(None, projection(hEntry, set([('save',)])))
+            self.assertEquals(None, projection(hEntry, None))
+
+        def test_narrow(self):
+            """
+            The content isn't read unless the template shows it
+            """
+            self.assertEquals(set(['bookmark', 'entry_title', 'author',
+                'updated', 'entry_summary', 'entry_content']),
+                template_projection(hEntry, 'hentry.html')[0])
+            qs = hEntry.objects.all()
+            self.assertEquals(qs, narrow(qs, 'geo.html'))
+            result = narrow(qs, 'hentry.html')
+            self.assertEquals([self.entry.pk], [e.pk for e in result])
+            self.assertEquals('A title', result[0].entry_title)
+            # The template doesn't show when the entry was published
+            self.assertTrue('published' not in result[0].__dict__)
+            # A template that never mentions the variable tells us nothing
+            self.assertEquals(qs, narrow(qs, 'hentry.html', 'e'))
+
+        def test_loops(self):
+            """
+            The items of a loop are followed whatever the loop calls them
+            """
+            self.assertEquals(set(['e']), loop_names(Template(
+                '{% for e in entries %}{{e.entry_title}}{% endfor %}'),
+                'entries'))
+            # Other uses of the sequence can't be seen through
+            self.assertEquals(None, loop_names(Template('{{entries.count}}'
+                '{% for e in entries %}{% endfor %}'), 'entries'))
+            self.assertEquals(None, loop_names(Template(
+                '{% for e in entries|slice:":2" %}{% endfor %}'), 'entries'))
+            fields, related = template_projection(hEntry, 'hfeed.html',
+                    sequence='entries')
+            self.assertTrue('entry_title' in fields)
+            self.assertTrue('published' not in fields)
+
+        def test_list_renderers(self):
+            """
+            Narrowed entries render just as before
+            """
+            result = hfeed(self.feed)
+            self.assertTrue('A title' in result)
+            self.assertTrue('A very long piece of content' in result)
+            result = river(hEntry.objects.filter(hfeed=self.feed))
+            self.assertTrue('A title' in result)
+            self.assertTrue('A very long piece of content' in result)
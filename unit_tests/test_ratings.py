@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+"""
+Review aggregate tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hReview, review_aggregate
+from microformats.ratings import normalise_item, aggregate_for,\
+        rebuild_aggregates
+from microformats.templatetags.microformat_extras import hreview_aggregate
+
+class RatingTestCase(TestCase):
+        """
+        Testing the materialised hReview aggregates
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def review(self, fn, rating, type='product'):
+            review = hReview(fn=fn, rating=rating, type=type)
+            review.save()
+            return review
+
+        def summary(self, fn, type='product'):
+            row = aggregate_for(fn, type)
+            return (row.count, row.rating_sum, row.rating_min, row.rating_max,
+                    [n for r, n in row.histogram()])
+
+        def test_normalise_item(self):
+            """
+            Make sure different spellings of the same item are grouped
+            """
+            self.assertEquals(u'acme super widget',
+                    normalise_item(u'  ACME  Super-Widget! '))
+            self.assertEquals(u'', normalise_item(None))
+
+        def test_incremental(self):
+            """
+            Make sure the aggregate follows saves and deletes
+            """
+            r1 = self.review(u'Acme Widget', 4)
+            r2 = self.review(u'acme widget.', 2)
+            r3 = self.review(u'Acme Widget', 5)
+            # Same name, different type
+            self.review(u'Acme Widget', 1, 'business')
+            self.assertEquals((3, 11, 2, 5, [0, 1, 0, 1, 1]),
+                    self.summary(u'Acme Widget'))
+            self.assertEquals(3.7, aggregate_for(u'ACME WIDGET',
+                'product').average())
+            self.assertEquals(u'Acme Widget', aggregate_for(u'Acme Widget',
+                'product').fn)
+            r3.rating = 3
+            r3.save()
+            self.assertEquals((3, 9, 2, 4, [0, 1, 1, 1, 0]),
+                    self.summary(u'Acme Widget'))
+            r2.delete()
+            self.assertEquals((2, 7, 3, 4, [0, 0, 1, 1, 0]),
+                    self.summary(u'Acme Widget'))
+            # Moving a review to another item
+            r1.fn = u'Acme Gadget'
+            r1.save()
+            self.assertEquals((1, 3, 3, 3, [0, 0, 1, 0, 0]),
+                    self.summary(u'Acme Widget'))
+            self.assertEquals((1, 4, 4, 4, [0, 0, 0, 1, 0]),
+                    self.summary(u'Acme Gadget'))
+            r3.delete()
+            self.assertEquals(None, aggregate_for(u'Acme Widget', 'product'))
+
+        def test_rebuild(self):
+            """
+            Make sure the aggregates can be recomputed from scratch
+            """
+            self.review(u'Acme Widget', 4)
+            self.review(u'Acme Widget', 2)
+            self.review(u'Acme Gadget', 5)
+            expected = self.summary(u'Acme Widget')
+            review_aggregate.objects.all().delete()
+            self.assertEquals(2, rebuild_aggregates(chunk_size=1))
+            self.assertEquals(expected, self.summary(u'Acme Widget'))
+            self.assertEquals((1, 5, 5, 5, [0, 0, 0, 0, 1]),
+                    self.summary(u'Acme Gadget'))
+
+        def test_hreview_aggregate(self):
+            """
+            Make sure the hReview-aggregate markup is rendered
+            """
+            review = self.review(u'Acme Widget', 4)
+            self.review(u'Acme Widget', 5)
+            expected = u'\n<div class="hreview-aggregate">\n    <span class="item"><span class="fn">Acme Widget</span></span>\n    <span class="rating"><span class="average">4.5</span> out of <span class="best">5</span></span>\n    based on <span class="count">2</span> reviews\n</div>\n'
+            self.assertEquals(expected, hreview_aggregate(review))
+            self.assertEquals(expected, hreview_aggregate(u'acme widget',
+                'product'))
+            self.assertEquals(u'', hreview_aggregate(u'Nothing', 'product'))
@@ -0,0 +1,138 @@
+# -*- coding: UTF-8 -*-
+"""
+Recurring event tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hCard, hCalendar, occurrence
+from microformats.recurrence import occurrences, rebuild_occurrences,\
+        extend_horizon, FOREVER
+from microformats.freebusy import busy_periods
+from microformats.ical import vcalendar, vevent
+from microformats.templatetags.microformat_extras import hcal
+
+D = datetime.datetime
+
+class RecurrenceTestCase(TestCase):
+        """
+        Testing the materialised occurrences of recurring events
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            self.weekly = hCalendar(summary='Team meeting',
+                    dtstart=D(2009, 4, 6, 9), dtend=D(2009, 4, 6, 10),
+                    rrule_freq='WEEKLY', rrule_count=4,
+                    exdates='2009-04-13')
+            self.weekly.save()
+
+        def test_occurrences(self):
+            """
+            Make sure occurrences are written when the event is saved
+            (skipping the exceptions) and rewritten when it's edited
+            """
+            self.assertEquals([D(2009, 4, 6, 9), D(2009, 4, 20, 9),
+                D(2009, 4, 27, 9)], [o.start for o in
+                    self.weekly.occurrences.all()])
+            self.assertEquals(FOREVER, hCalendar.objects.get(
+                pk=self.weekly.pk).materialised_until)
+            self.assertEquals([D(2009, 4, 20, 9)], [o.start for o in
+                occurrences(D(2009, 4, 14), D(2009, 4, 21))])
+            self.weekly.rrule_interval = 2
+            self.weekly.exdates = ''
+            self.weekly.save()
+            self.assertEquals([D(2009, 4, 6, 9), D(2009, 4, 20, 9),
+                D(2009, 5, 4, 9), D(2009, 5, 18, 9)], [o.start for o in
+                    self.weekly.occurrences.all()])
+            # Events that don't repeat get a single occurrence
+            single = hCalendar(summary='Party', dtstart=D(2009, 4, 20, 8))
+            single.save()
+            self.assertEquals([single.pk, self.weekly.pk], [o.event.pk for o
+                in occurrences(D(2009, 4, 20), D(2009, 4, 21))])
+
+        def test_monthly(self):
+            """
+            Make sure months without the day of the month are skipped
+            """
+            event = hCalendar(summary='Pay day', dtstart=D(2009, 1, 31),
+                    all_day_event=True, rrule_freq='MONTHLY',
+                    rrule_until=D(2009, 6, 30))
+            event.save()
+            self.assertEquals([D(2009, 1, 31), D(2009, 3, 31), D(2009, 5, 31)],
+                    [o.start for o in event.occurrences.all()])
+
+        def test_horizon(self):
+            """
+            Make sure events that repeat forever are only materialised up to
+            the horizon, that queries further ahead don't add occurrences and
+            that extend_horizon() does
+            """
+            today = datetime.datetime.now().replace(hour=9, minute=0,
+                    second=0, microsecond=0)
+            event = hCalendar(summary='Stand up', dtstart=today,
+                    rrule_freq='WEEKLY')
+            event.save()
+            card = hCard(given_name='Joe', family_name='Blogs')
+            card.save()
+            event.attendees.add(card)
+            count = occurrence.objects.filter(event=event).count()
+            self.assertTrue(50 < count < 56)
+            later = today + datetime.timedelta(weeks=100)
+            window = (later, later + datetime.timedelta(days=1), [event])
+            self.assertEquals([], list(occurrences(*window)))
+            self.assertEquals([], busy_periods([card], *window[:2])[card.pk])
+            self.assertEquals(count, occurrence.objects.filter(
+                event=event).count())
+            # Already materialised up to the horizon from now
+            self.assertEquals(0, extend_horizon())
+            self.assertTrue(extend_horizon(window[1]) > 40)
+            self.assertEquals([later], [o.start for o in
+                occurrences(*window)])
+            self.assertTrue(occurrence.objects.filter(event=event).count() >
+                    100)
+            rebuild_occurrences(event)
+            self.assertEquals(count, occurrence.objects.filter(
+                event=event).count())
+
+        def test_freebusy(self):
+            """
+            Make sure the free/busy engine sees every occurrence
+            """
+            card = hCard(given_name='Joe', family_name='Blogs')
+            card.save()
+            self.weekly.attendees.add(card)
+            self.assertEquals([(D(2009, 4, 20, 9), D(2009, 4, 20, 10)),
+                (D(2009, 4, 27, 9), D(2009, 4, 27, 10))], busy_periods([card],
+                    D(2009, 4, 10), D(2009, 5, 1))[card.pk])
+
+        def test_output(self):
+            """
+            Make sure the recurrence rule is in the hCalendar and iCalendar
+            output
+            """
+            self.assertEquals(u'FREQ=WEEKLY;COUNT=4', self.weekly.rrule())
+            result = hcal(self.weekly, autoescape=True)
+            self.assertTrue(u'<abbr class="rrule" title="FREQ=WEEKLY;COUNT=4">'\
+                    u'Weekly, 4 times</abbr>, except <abbr class="exdate"'\
+                    u' title="2009-04-13">2009-04-13</abbr>' in result)
+            ical = vcalendar([vevent(self.weekly)])
+            self.assertTrue('BEGIN:VEVENT\r\n' in ical)
+            self.assertTrue('DTSTART:20090406T090000\r\n' in ical)
+            self.assertTrue('RRULE:FREQ=WEEKLY;COUNT=4\r\n' in ical)
+            self.assertTrue('EXDATE:20090413T090000\r\n' in ical)
+            self.weekly.tz = '+01:00'
+            self.weekly.rrule_count = None
+            self.weekly.rrule_until = D(2009, 5, 31, 9)
+            ical = vcalendar([vevent(self.weekly)])
+            self.assertTrue('DTSTART:20090406T080000Z\r\n' in ical)
+            self.assertTrue('RRULE:FREQ=WEEKLY;UNTIL=20090531T080000Z\r\n' in
+                    ical)
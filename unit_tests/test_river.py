@@ -0,0 +1,127 @@
+# -*- coding: UTF-8 -*-
+"""
+River of entries tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+
+# project
+from microformats.instrumentation import QueryRecorder
+from microformats.models import hFeed, hEntry, hNews
+from microformats.river import river, make_cursor, parse_cursor, MERGE_FEEDS
+from microformats.templatetags.microformat_extras import river as render
+
+class RiverTestCase(TestCase):
+        """
+        Testing the merged river of entries across feeds
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def entry(self, feed, title, day, bookmark=''):
+            entry = hEntry(hfeed=feed, entry_title=title, bookmark=bookmark,
+                    updated=datetime.datetime(2009, 6, day))
+            entry.save()
+            return entry
+
+        def setUp(self):
+            self.one = hFeed(category='one')
+            self.one.save()
+            self.two = hFeed(category='two')
+            self.two.save()
+            self.other = hFeed(category='other')
+            self.other.save()
+            self.entry(self.one, 'a', 1)
+            self.entry(self.two, 'b', 2)
+            self.entry(self.one, 'c', 3, 'http://example.com/c')
+            self.entry(self.two, 'd', 4)
+            self.entry(self.other, 'x', 5)
+            # The same post in both feeds: only the newest is shown
+            self.entry(self.one, 'e', 6, 'http://example.com/e')
+            self.entry(self.two, 'e2', 7, 'http://example.com/e')
+            # ...even when the older one is on a later page
+            self.entry(self.two, 'c2', 8, 'http://example.com/c')
+            news = hNews(hfeed=self.one, entry_title='f', source_org='Org',
+                    updated=datetime.datetime(2009, 6, 9))
+            news.save()
+
+        def titles(self, entries):
+            return [e.entry_title for e in entries]
+
+        def test_cursor(self):
+            """
+            Make sure cursors survive the round trip
+            """
+            updated = datetime.datetime(2009, 6, 1, 12, 30, 15, 250)
+            self.assertEquals((updated, 42), parse_cursor(make_cursor(updated,
+                42)))
+            self.assertRaises(ValueError, parse_cursor, 'rubbish')
+
+        def test_river(self):
+            """
+            Make sure the newest entries come first, page by page
+            """
+            for feeds_per_query in (1, 2):
+                entries, cursor = river([self.one, self.two.pk], 3,
+                        feeds_per_query=feeds_per_query)
+                self.assertEquals(['f', 'c2', 'e2'], self.titles(entries))
+                self.assertEquals(True, isinstance(entries[0], hNews))
+                entries, cursor = river([self.one, self.two], 3, cursor,
+                        feeds_per_query)
+                # c and e were on the first page
+                self.assertEquals(['d', 'b', 'a'], self.titles(entries))
+                entries, cursor = river([self.one, self.two], 3, cursor,
+                        feeds_per_query)
+                self.assertEquals([], entries)
+                self.assertEquals(None, cursor)
+            entries, cursor = river([self.one, self.two], 10)
+            self.assertEquals(['f', 'c2', 'e2', 'd', 'b', 'a'],
+                    self.titles(entries))
+            self.assertEquals(None, cursor)
+            self.assertEquals(([], None), river([]))
+
+        def test_many_feeds(self):
+            """
+            Make sure rivers of more than MERGE_FEEDS feeds are read a group
+            at a time and come out as they would with a query per feed
+            """
+            feeds = [self.one]
+            for i in xrange(MERGE_FEEDS + 1):
+                feed = hFeed(category='feed %d' % i)
+                feed.save()
+                hEntry(hfeed=feed, entry_title='many %d' % i,
+                        updated=datetime.datetime(2009, 5, 1) +
+                        datetime.timedelta(hours=i)).save()
+                feeds.append(feed)
+            recorder = QueryRecorder()
+            recorder.start()
+            try:
+                entries, cursor = river(feeds, 10)
+            finally:
+                recorder.stop()
+            # One query for the group and two to fetch the entries
+            self.assertEquals(3, recorder.count)
+            expected = ['f', 'e', 'c', 'a'] + ['many %d' % i for i in
+                    xrange(MERGE_FEEDS, MERGE_FEEDS - 6, -1)]
+            self.assertEquals(expected, self.titles(entries))
+            self.assertEquals((entries, cursor), river(feeds, 10,
+                feeds_per_query=1))
+            self.assertEquals(self.titles(river(feeds, 10, cursor)[0]),
+                    self.titles(river(feeds, 10, cursor, 1)[0]))
+
+        def test_render(self):
+            """
+            Make sure a page of the river renders as an hFeed
+            """
+            entries, cursor = river([self.one], 2)
+            result = render(entries)
+            self.assertEquals(True, result.strip().startswith(
+                u'<div class="hfeed">'))
+            self.assertEquals(1, result.count(u'class="hnews hentry'))
+            self.assertEquals(2, result.count(u'hentry'))
@@ -0,0 +1,101 @@
+# -*- coding: UTF-8 -*-
+"""
+Coordinate index tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# django
+from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+
+# project
+from microformats.models import hCard, hListing, geo
+from microformats import spatial
+
+class SpatialTestCase(TestCase):
+        """
+        Testing the coordinate queries (with the in-memory index if NumPy is
+        installed and the pure-Python fallback otherwise)
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            self.london = hCard(given_name='London', latitude=51.5072,
+                    longitude=-0.1275)
+            self.london.save()
+            self.brighton = hListing(listing_action='sell', description='Pony',
+                    lister_fn='John Doe', item_fn='Django', latitude=50.8225,
+                    longitude=-0.1372)
+            self.brighton.save()
+            self.paris = geo(latitude=48.8567, longitude=2.3508)
+            self.paris.save()
+            nowhere = hCard(given_name='Nowhere')
+            nowhere.save()
+
+        def check_queries(self, radius, nearest):
+            found = radius(51.5072, -0.1275, 100)
+            self.assertEquals([('hcard', self.london.pk), ('hlisting',
+                self.brighton.pk)], [(name, pk) for distance, name, pk in
+                    found])
+            self.assertTrue(75 < found[1][0] < 77)
+            self.assertEquals([('geo', self.paris.pk)], [(name, pk) for d,
+                name, pk in nearest(48.0, 2.0, 1)])
+            self.assertEquals([('hlisting', self.brighton.pk)], [(name, pk)
+                for d, name, pk in nearest(51.5, 0.0, 1, [hListing])])
+            self.assertEquals([('geo', self.paris.pk)], [(name, pk) for d,
+                name, pk in nearest(51.5, 0.0, 1, ['geo'])])
+
+        def test_database_queries(self):
+            """
+            Make sure the pure-Python queries find the right rows (including
+            across the 180th meridian)
+            """
+            self.check_queries(spatial.database_radius,
+                    spatial.database_nearest)
+            self.assertTrue(343 < spatial.distance_km(51.5072, -0.1275,
+                48.8567, 2.3508) < 345)
+            fiji = geo(latitude=-17.7, longitude=179.9)
+            fiji.save()
+            self.assertEquals([fiji.pk], [pk for d, name, pk in
+                spatial.database_radius(-17.7, -179.9, 50)])
+
+        def test_shortcuts(self):
+            """
+            Make sure within_radius and nearest work with or without NumPy
+            """
+            try:
+                self.check_queries(spatial.within_radius, spatial.nearest)
+            finally:
+                spatial._index = None
+
+        def test_index(self):
+            """
+            Make sure the in-memory index answers the same queries and that
+            the signals keep it up to date
+            """
+            if spatial.numpy is None:
+                self.assertRaises(ImproperlyConfigured,
+                        spatial.CoordinateIndex)
+                return
+            index = spatial.CoordinateIndex(refresh_interval=0)
+            index.load()
+            self.assertEquals(3, len(index))
+            self.check_queries(index.radius, index.nearest)
+            # Incremental updates via the signals
+            spatial._index = index
+            try:
+                self.london.latitude = 48.85
+                self.london.longitude = 2.35
+                self.london.save()
+                self.brighton.delete()
+                self.assertEquals([], index.radius(51.5072, -0.1275, 100))
+                self.assertEquals(['geo', 'hcard'], sorted(name for d, name, pk
+                    in index.radius(48.8567, 2.3508, 10)))
+                index.fold()
+                self.assertEquals(2, len(index))
+                self.assertEquals(['geo', 'hcard'], sorted(name for d, name, pk
+                    in index.radius(48.8567, 2.3508, 10)))
+            finally:
+                spatial._index = None
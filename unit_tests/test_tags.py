@@ -0,0 +1,103 @@
+# -*- coding: UTF-8 -*-
+"""
+hFeed tag tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hFeed, feed_tag
+from microformats.tags import backfill_tags
+from microformats.utils import split_tags
+from microformats.templatetags.microformat_extras import hfeed, rel_tag
+
+class TagTestCase(TestCase):
+        """
+        Testing the normalised hFeed categories
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def feed(self, category):
+            feed = hFeed(category=category)
+            feed.save()
+            return feed
+
+        def tags(self, feed):
+            return list(feed.tags.values_list('name', 'label'))
+
+        def test_split_tags(self):
+            """
+            Make sure the category text is split and normalised
+            """
+            self.assertEquals([(u'python', u'Python'),
+                (u'django tips', u'Django tips')],
+                split_tags(u' Python, ,Django  tips,python,'))
+            self.assertEquals([], split_tags(None))
+
+        def test_index(self):
+            """
+            Make sure the tags follow the category text
+            """
+            feed = self.feed(u'Python, Django')
+            self.assertEquals([(u'python', u'Python'), (u'django', u'Django')],
+                    self.tags(feed))
+            feed.category = u'django, Microformats'
+            feed.save()
+            self.assertEquals([(u'django', u'django'),
+                (u'microformats', u'Microformats')], self.tags(feed))
+            feed.delete()
+            self.assertEquals(0, feed_tag.objects.count())
+
+        def test_queries(self):
+            """
+            Make sure feeds can be found by tag
+            """
+            python = self.feed(u'Python, Django')
+            pythonic = self.feed(u'Pythonic')
+            django = self.feed(u'django, microformats')
+            self.assertEquals([python.pk], [f.pk for f in
+                hFeed.objects.tagged_any(u'PYTHON')])
+            self.assertEquals([python.pk, django.pk], sorted([f.pk for f in
+                hFeed.objects.tagged_any(u'python', u'django')]))
+            self.assertEquals([python.pk], [f.pk for f in
+                hFeed.objects.tagged_all(u'python', u'Django')])
+            self.assertEquals([], list(hFeed.objects.tagged_all(u'python',
+                u'microformats')))
+            self.assertEquals([], list(hFeed.objects.tagged_any(u' ')))
+            self.assertEquals([(u'django', 2), (u'microformats', 1),
+                (u'python', 1), (u'pythonic', 1)],
+                hFeed.objects.tag_counts())
+            self.assertEquals([(u'django', 2)], hFeed.objects.tag_counts(2))
+
+        def test_backfill(self):
+            """
+            Make sure the tags can be rebuilt from the category text
+            """
+            feed = self.feed(u'Python, Django')
+            feed_tag.objects.all().delete()
+            self.assertEquals(1, backfill_tags(chunk_size=1))
+            self.assertEquals([(u'python', u'Python'), (u'django', u'Django')],
+                    self.tags(feed))
+
+        def test_rel_tag(self):
+            """
+            Make sure the tags are rendered as rel-tag links
+            """
+            feed = self.feed(u'Python, Django <tips>')
+            self.assertEquals(u'<a href="/tag/django%20%3Ctips%3E" rel="tag">'\
+                    u'Django &lt;tips&gt;</a>', rel_tag(feed.tags.all()[1],
+                        autoescape=True))
+            self.assertEquals(u'<a href="/tag/python" rel="tag">Python</a>',
+                    rel_tag(u'Python'))
+            # The tag must stay a single path segment
+            self.assertEquals(u'<a href="/tag/ci%2Fcd" rel="tag">CI/CD</a>',
+                    rel_tag(u'CI/CD'))
+            result = hfeed(feed)
+            self.assertEquals(True, u'<p class="tags">Tags: <a href="/tag/'\
+                    u'python" rel="tag">Python</a>, <a href="/tag/django%20'\
+                    u'%3Ctips%3E" rel="tag">Django &lt;tips&gt;</a></p>' in
+                    result)
@@ -409,7 +409,7 @@ class TemplateTagsTestCase(TestCase):
             rev3.save()
             # Test for a review concerning something represented by an hCard
             result = hreview(rev1, autoescape=True) 
-            expected = u'\n<div class="hreview">\n    <strong class="summary">Acme&#39;s new services rock!</strong>\n    <abbr class="type" title="business"> Business</abbr> Review\n    <br/>\n    \n    <abbr title="" class="dtreviewed">Fri 10 Apr 2009</abbr>\n    \n    by\n    <span class="reviewer vcard"><span class="fn">John Smith</span></span>\n    \n        \n    <div class="item vcard">\n        \n        <a class="url fn org" href="http://acme.com">\n        \n        Acme Corp\n        \n        </a>\n        \n        <div class="tel">+44(0)1234 567456</div>\n        \n        \n<div class="adr">\n    <div class="street-address">5445 N. 27th Street</div>\n    \n    <span class="locality">Milwaukee</span>&nbsp;\n    <span class="region">WI</span>&nbsp;\n    <span class="postal-code">53209</span>&nbsp;\n    <span class="country-name">United States</span>\n</div>\n\n        \n    </div>\n        \n    \n    \n    \n    \n    \n    <abbr class="rating" title="4">\u2605\u2605\u2605\u2605\u2606</abbr>\n    \n    \n    \n    <blockquote class="description">\n        Lorem ipsum dolor sit amet, consectetuer adipiscing elit, sed diam nonummy nibh euismod tincidunt ut laoreet dolore magna aliquam erat volutpat. Ut wisi enim ad minim veniam, quis nostrud exerci tation ullamcorper suscipit lobortis nisl ut aliquip ex ea commodo consequat.\n    </blockquote>\n    \n</div>\n'
+            expected = u'\n<div class="hreview">\n    <strong class="summary">Acme&#39;s new services rock!</strong>\n    <abbr class="type" title="business"> Business</abbr> Review\n    <br/>\n    \n    <abbr title="2009-04-10T00:00:00" class="dtreviewed">Fri 10 Apr 2009</abbr>\n    \n    by\n    <span class="reviewer vcard"><span class="fn">John Smith</span></span>\n    \n        \n    <div class="item vcard">\n        \n        <a class="url fn org" href="http://acme.com">\n        \n        Acme Corp\n        \n        </a>\n        \n        <div class="tel">+44(0)1234 567456</div>\n        \n        \n<div class="adr">\n    <div class="street-address">5445 N. 27th Street</div>\n    \n    <span class="locality">Milwaukee</span>&nbsp;\n    <span class="region">WI</span>&nbsp;\n    <span class="postal-code">53209</span>&nbsp;\n    <span class="country-name">United States</span>\n</div>\n\n        \n    </div>\n        \n    \n    \n    \n    \n    \n    <abbr class="rating" title="4">\u2605\u2605\u2605\u2605\u2606</abbr>\n    \n    \n    \n    <blockquote class="description">\n        Lorem ipsum dolor sit amet, consectetuer adipiscing elit, sed diam nonummy nibh euismod tincidunt ut laoreet dolore magna aliquam erat volutpat. Ut wisi enim ad minim veniam, quis nostrud exerci tation ullamcorper suscipit lobortis nisl ut aliquip ex ea commodo consequat.\n    </blockquote>\n    \n</div>\n'
             self.assertEquals(expected, result)
             # Test for a review concerning something represented by an hCalendar
             result = hreview(rev2, autoescape=True) 
@@ -0,0 +1,113 @@
+# -*- coding: UTF-8 -*-
+"""
+UTC date/time tests for Microformats 
+
+Author: Nicholas H.Tollervey
+
+"""
+# python
+import datetime
+
+# django
+from django.test import TestCase
+
+# project
+from microformats.models import hCalendar, hReview
+from microformats.timezones import to_utc, backfill_utc, events_between,\
+        reviews_between
+from microformats.templatetags.microformat_extras import fragment, hcal
+
+D = datetime.datetime
+
+class TimezoneTestCase(TestCase):
+        """
+        Testing the UTC shadow columns
+        """
+        # Reference fixtures here
+        fixtures = []
+
+        def setUp(self):
+            # 09:00 in London, Auckland and New York
+            self.london = hCalendar(summary='London',
+                    dtstart=D(2009, 4, 11, 9), dtend=D(2009, 4, 11, 10))
+            self.london.save()
+            self.auckland = hCalendar(summary='Auckland',
+                    dtstart=D(2009, 4, 11, 9), tz='+12:00')
+            self.auckland.save()
+            self.new_york = hCalendar(summary='New York',
+                    dtstart=D(2009, 4, 11, 9), dtend=D(2009, 4, 11, 10),
+                    tz='-05:00')
+            self.new_york.save()
+
+        def test_save(self):
+            """
+            Make sure the shadow columns are filled in when a row is saved
+            """
+            self.assertEquals(D(2009, 4, 10, 21), hCalendar.objects.get(
+                pk=self.auckland.pk).dtstart_utc)
+            self.assertEquals(None, self.auckland.dtend_utc)
+            self.assertEquals(D(2009, 4, 11, 15), self.new_york.dtend_utc)
+            review = hReview(fn='Acme', dtreviewed=D(2009, 4, 11, 12),
+                    tz='+05:30')
+            review.save()
+            self.assertEquals(D(2009, 4, 11, 6, 30), review.dtreviewed_utc)
+            self.assertEquals(D(2009, 4, 11, 6, 30), to_utc(D(2009, 4, 11, 12),
+                '+05:30'))
+
+        def test_utc(self):
+            """
+            Make sure rows in UTC ("Z") can be saved
+            """
+            event = hCalendar(summary='Greenwich', dtstart=D(2009, 4, 11, 9),
+                    dtend=D(2009, 4, 11, 10), tz='Z')
+            event.save()
+            self.assertEquals(D(2009, 4, 11, 9), event.dtstart_utc)
+            self.assertEquals(D(2009, 4, 11, 10), event.dtend_utc)
+            review = hReview(fn='Acme', dtreviewed=D(2009, 4, 11, 12), tz='Z')
+            review.save()
+            self.assertEquals(D(2009, 4, 11, 12), review.dtreviewed_utc)
+            self.assertEquals(D(2009, 4, 11, 12), to_utc(D(2009, 4, 11, 12),
+                'rubbish'))
+
+        def test_range_queries(self):
+            """
+            Make sure range queries compare the same moments in time
+            """
+            self.assertEquals(['Auckland', 'London', 'New York'], [e.summary
+                for e in events_between(D(2009, 4, 10), D(2009, 4, 12))])
+            self.assertEquals(['London'], [e.summary for e in
+                events_between(D(2009, 4, 11, 8), D(2009, 4, 11, 12))])
+            # The same window expressed in New York time
+            self.assertEquals(['New York'], [e.summary for e in
+                events_between(D(2009, 4, 11, 9, 30), D(2009, 4, 11, 12),
+                    '-05:00')])
+            review = hReview(fn='Acme', dtreviewed=D(2009, 4, 11, 1),
+                    tz='+02:00')
+            review.save()
+            self.assertEquals([review.pk], [r.pk for r in reviews_between(
+                D(2009, 4, 10, 23), D(2009, 4, 11))])
+
+        def test_backfill(self):
+            """
+            Make sure existing rows can be brought up to date
+            """
+            hCalendar.objects.update(dtstart_utc=None, dtend_utc=None)
+            result = backfill_utc([hCalendar], chunk_size=2)
+            self.assertEquals({'hCalendar': 3}, result)
+            self.assertEquals(D(2009, 4, 11, 14), hCalendar.objects.get(
+                pk=self.new_york.pk).dtstart_utc)
+
+        def test_titles(self):
+            """
+            Make sure the ISO titles carry the timezone offset
+            """
+            self.assertTrue(u'title="2009-04-11T09:00:00-05:00" class="dtstart"'
+                    in hcal(self.new_york, autoescape=True))
+            self.assertTrue(u'title="2009-04-11T09:00:00" class="dtstart"'
+                    in hcal(self.london, autoescape=True))
+            self.assertEquals(u'<abbr class="dtstart"'\
+                    u' title="2009-04-11T09:00:00+12:00">11 Apr</abbr>',
+                    fragment(self.auckland.dtstart, 'dtstart +12:00 %d %b'))
+            self.assertEquals(u'<abbr class="dtstart"'\
+                    u' title="2009-04-11T09:00:00Z">11 Apr</abbr>',
+                    fragment(self.auckland.dtstart, 'dtstart Z %d %b'))
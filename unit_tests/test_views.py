@@ -13,6 +13,9 @@ from django.test.client import Client
 from django.test import TestCase
 
 # project
+from django.utils import simplejson
+from microformats.models import geo, geo_cluster, geo_cluster_zoom, hCard,\
+        hCalendar
 
 class ViewTestCase(TestCase):
         """
@@ -20,7 +23,120 @@ class ViewTestCase(TestCase):
         """
         # Reference fixtures here
         fixtures = []
+        urls = 'microformats.urls'
 
-        def test_example(self):
-            # Your test goes here
-            pass
+        def test_geo_clusters(self):
+            """
+            Make sure the clusters are returned as cacheable GeoJSON
+            """
+            g = geo(latitude=51.5072, longitude=-0.1275)
+            g.save()
+            c = Client()
+            response = c.get('/clusters/', {'bbox': '-1,50,1,52', 'zoom': '8'})
+            self.assertEquals(200, response.status_code)
+            self.assertTrue('max-age' in response['Cache-Control'])
+            self.assertTrue(response.has_header('Last-Modified'))
+            data = simplejson.loads(response.content)
+            self.assertEquals('FeatureCollection', data['type'])
+            self.assertEquals(1, len(data['features']))
+            feature = data['features'][0]
+            self.assertEquals(1, feature['properties']['count'])
+            self.assertEquals(g.pk, feature['properties']['pk'])
+            self.assertAlmostEquals(-0.1275,
+                    feature['geometry']['coordinates'][0])
+            # Bad requests
+            response = c.get('/clusters/', {'bbox': 'rubbish', 'zoom': '8'})
+            self.assertEquals(400, response.status_code)
+            response = c.get('/clusters/', {'bbox': '-1,50,1,52',
+                'type': 'nothing'})
+            self.assertEquals(400, response.status_code)
+
+
+        def test_geo_clusters_deleted(self):
+            """
+            Make sure removing the last point of a cell isn't answered with a
+            304 Not Modified
+            """
+            g = geo(latitude=51.5072, longitude=-0.1275)
+            g.save()
+            # Make the clusters an hour old so the deletion is later
+            hour_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+            geo_cluster.objects.update(updated=hour_ago)
+            geo_cluster_zoom.objects.update(changed=hour_ago)
+            c = Client()
+            query = {'bbox': '-1,50,1,52', 'zoom': '8'}
+            response = c.get('/clusters/', query)
+            modified = response['Last-Modified']
+            response = c.get('/clusters/', query,
+                    HTTP_IF_MODIFIED_SINCE=modified)
+            self.assertEquals(304, response.status_code)
+            g.delete()
+            response = c.get('/clusters/', query,
+                    HTTP_IF_MODIFIED_SINCE=modified)
+            self.assertEquals(200, response.status_code)
+            self.assertEquals([], simplejson.loads(response.content)[
+                'features'])
+
+        def test_geojson_export(self):
+            """
+            Make sure the export view streams a filtered FeatureCollection
+            """
+            geo(latitude=51.5072, longitude=-0.1275).save()
+            geo(latitude=-36.8406, longitude=174.74).save()
+            c = Client()
+            response = c.get('/export.geojson', {'bbox': '-1,50,1,52'})
+            self.assertEquals(200, response.status_code)
+            data = simplejson.loads(response.content)
+            self.assertEquals(1, len(data['features']))
+            response = c.get('/export.geojson', {'type': 'geo'})
+            self.assertEquals(2, len(simplejson.loads(
+                response.content)['features']))
+            response = c.get('/export.geojson', {'type': 'nothing'})
+            self.assertEquals(400, response.status_code)
+
+        def test_hcard_freebusy(self):
+            """
+            Make sure the free/busy view returns an iCalendar object
+            """
+            card = hCard(given_name='Joe', family_name='Blogs')
+            card.save()
+            event = hCalendar(summary='Meeting',
+                    dtstart=datetime.datetime(2009, 4, 11, 9),
+                    dtend=datetime.datetime(2009, 4, 11, 11))
+            event.save()
+            event.attendees.add(card)
+            c = Client()
+            response = c.get('/freebusy/%d.ics' % card.pk, {
+                'start': '2009-04-11', 'end': '2009-04-12'})
+            self.assertEquals(200, response.status_code)
+            self.assertTrue(response['Content-Type'].startswith(
+                'text/calendar'))
+            self.assertTrue('FREEBUSY;FBTYPE=BUSY:20090411T090000Z/'\
+                    '20090411T110000Z' in response.content)
+            response = c.get('/freebusy/%d.ics' % card.pk, {
+                'start': '2009-04-12', 'end': '2009-04-11'})
+            self.assertEquals(400, response.status_code)
+            # Longer than MAX_FREEBUSY_PERIOD
+            response = c.get('/freebusy/%d.ics' % card.pk, {
+                'start': '2009-04-11', 'end': '2109-04-11'})
+            self.assertEquals(400, response.status_code)
+            response = c.get('/freebusy/%d.ics' % (card.pk + 1))
+            self.assertEquals(404, response.status_code)
+
+        def test_hcalendar_ics(self):
+            """
+            Make sure an event can be downloaded as iCalendar
+            """
+            event = hCalendar(summary='Meeting; with, punctuation',
+                    dtstart=datetime.datetime(2009, 4, 11, 9),
+                    rrule_freq='DAILY', rrule_count=3)
+            event.save()
+            c = Client()
+            response = c.get('/events/%d.ics' % event.pk)
+            self.assertEquals(200, response.status_code)
+            self.assertTrue(response['Content-Type'].startswith(
+                'text/calendar'))
+            self.assertTrue('SUMMARY:Meeting\\; with\\, punctuation\r\n' in
+                    response.content)
+            self.assertTrue('RRULE:FREQ=DAILY;COUNT=3\r\n' in
+                    response.content)
@@ -0,0 +1,21 @@
+# -*- coding: UTF-8 -*-
+"""
+URLs for Microformats. Include them in your project's urls.py:
+
+    (r'^microformats/', include('microformats.urls')),
+
+Author: Nicholas H.Tollervey
+
+"""
+from django.conf.urls.defaults import *
+
+urlpatterns = patterns('microformats.views',
+    url(r'^clusters/$', 'geo_clusters', name='microformats_geo_clusters'),
+    url(r'^export\.geojson$', 'geojson_export',
+        name='microformats_geojson_export'),
+    url(r'^freebusy/(?P<hcard_id>\d+)\.ics$', 'hcard_freebusy',
+        name='microformats_hcard_freebusy'),
+    url(r'^events/(?P<event_id>\d+)\.ics$', 'hcalendar_ics',
+        name='microformats_hcalendar_ics'),
+    url(r'^metrics$', 'filter_metrics', name='microformats_filter_metrics'),
+)
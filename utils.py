@@ -0,0 +1,217 @@
+# -*- coding: UTF-8 -*-
+"""
+Small helpers shared by the various microformat subsystems.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import datetime
+import re
+import time
+
+# The default number of rows pulled from the database in one go
+CHUNK_SIZE = 1000
+
+def chunked_queryset(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yields lists of (at most) chunk_size instances from the queryset.
+
+    Rather than using OFFSET (which gets slower the further into the table you
+    go) we walk the primary key index: each chunk asks for the rows with a pk
+    greater than the last one we saw. This means memory use is bounded by
+    chunk_size no matter how big the table is.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        if last_pk is None:
+            chunk = list(queryset[:chunk_size])
+        else:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        yield chunk
+        last_pk = chunk[-1].pk
+        if len(chunk) < chunk_size:
+            break
+
+def chunked_pks(queryset, chunk_size=CHUNK_SIZE):
+    """
+    As chunked_queryset but only yields lists of primary keys. Useful for
+    splitting work between processes without pickling model instances.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        if last_pk is None:
+            chunk = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        else:
+            chunk = list(queryset.filter(pk__gt=last_pk).values_list('pk',
+                flat=True)[:chunk_size])
+        if not chunk:
+            break
+        yield chunk
+        last_pk = chunk[-1]
+        if len(chunk) < chunk_size:
+            break
+
+def model_name(model):
+    """
+    Returns the lower cased name of a model, as stored in the model column of
+    the index tables (e.g. "hcard")
+    """
+    return model._meta.object_name.lower()
+
+def normalise_email(value):
+    """
+    Returns the stripped, lower cased address (or an empty string).
+    """
+    return value and value.strip().lower() or u''
+
+def index_fields(index, value_field, instance, model, fields, normalise):
+    """
+    Brings the rows of an index table (with model, object_id, field and
+    value_field columns) for the instance up to date with the normalised
+    values of its fields. Only rows that have actually changed are written.
+    """
+    name = model_name(model)
+    wanted = {}
+    for field in fields:
+        value = normalise(getattr(instance, field))
+        if value:
+            wanted[field] = value
+    existing = dict((row.field, row) for row in index.objects.filter(
+        model=name, object_id=instance.pk))
+    for field, row in existing.iteritems():
+        if field not in wanted:
+            row.delete()
+        elif getattr(row, value_field) != wanted[field]:
+            setattr(row, value_field, wanted[field])
+            row.save()
+    for field, value in wanted.iteritems():
+        if field not in existing:
+            row = index(model=name, object_id=instance.pk, field=field)
+            setattr(row, value_field, value)
+            row.save()
+
+def parse_bbox(value):
+    """
+    Turns "west,south,east,north" into a (south, west, north, east) tuple of
+    floats. Raises ValueError if the value isn't a valid bounding box.
+    """
+    west, south, east, north = [float(x) for x in value.split(',')]
+    if not (-90.0 <= south <= north <= 90.0 and -180.0 <= west <= 180.0 and
+            -180.0 <= east <= 180.0):
+        raise ValueError('Invalid bounding box')
+    return south, west, north, east
+
+# How long a period parse_period defaults to
+DEFAULT_PERIOD = datetime.timedelta(days=28)
+
+def parse_datetime(value):
+    """
+    Turns "YYYY-MM-DD" or "YYYY-MM-DDTHH:MM[:SS]" into a datetime. Raises
+    ValueError if the value can't be parsed.
+    """
+    for format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.datetime(*time.strptime(value, format)[:6])
+        except ValueError:
+            pass
+    raise ValueError('Invalid date/time: %s' % value)
+
+def parse_period(start=None, end=None, default=DEFAULT_PERIOD, longest=None):
+    """
+    Turns optional start and end strings into a (start, end) tuple of
+    datetimes. start defaults to now (UTC) and end to default after start.
+    Raises ValueError if either can't be parsed, end isn't after start or
+    the period is longer than longest (if given).
+    """
+    start = start and parse_datetime(start) or\
+            datetime.datetime.utcnow().replace(microsecond=0)
+    end = end and parse_datetime(end) or start + default
+    if end <= start:
+        raise ValueError('The end must be after the start')
+    if longest and end - start > longest:
+        raise ValueError('The period is too long')
+    return start, end
+
+# An offset from UTC such as "+01:00" or "-03:30"
+OFFSET = re.compile(r'^([+-])(\d\d):(\d\d)$')
+
+def tz_offset(tz):
+    """
+    Turns one of the TIMEZONE values (e.g. "-03:30") into a timedelta. "Z"
+    (UTC), an empty value and anything that isn't an offset give no offset.
+    """
+    match = OFFSET.match(tz or '')
+    if match is None:
+        return datetime.timedelta(0)
+    sign, hours, minutes = match.groups()
+    offset = datetime.timedelta(hours=int(hours), minutes=int(minutes))
+    return sign == '-' and -offset or offset
+
+def isoformat(value, tz=None):
+    """
+    Returns the ISO 8601 representation of a date/time, qualified with the
+    TIMEZONE offset (e.g. "2009-04-11T13:30:00+01:00") if one is given.
+    Aware date/times carry their own offset.
+    """
+    result = value.isoformat()
+    if tz and isinstance(value, datetime.datetime) and value.tzinfo is None:
+        result += tz
+    return result
+
+def normalise_tag(value):
+    """
+    Returns the form a tag is stored and matched in: lower cased with the
+    spacing collapsed (e.g. " Django  Tips" becomes "django tips").
+    """
+    return u' '.join((value or u'').lower().split())
+
+def split_tags(text, max_length=255):
+    """
+    Turns a comma-separated list of keywords or phrases into a list of
+    (name, label) tuples in order, leaving out empty and duplicate (by name)
+    tags. The label is the tag as it was typed.
+    """
+    result = []
+    seen = set()
+    for label in (text or u'').split(u','):
+        label = u' '.join(label.split())[:max_length]
+        name = normalise_tag(label)
+        if name and name not in seen:
+            seen.add(name)
+            result.append((name, label))
+    return result
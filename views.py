@@ -1 +1,178 @@
-# Create your views here.
+# -*- coding: UTF-8 -*-
+"""
+Views for Microformats.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
+from django.shortcuts import get_object_or_404
+from django.utils import simplejson
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_GET, last_modified
+
+from microformats import clusters, freebusy, geojson, ical, metrics
+from microformats.models import hCard, hCalendar
+from microformats.utils import parse_bbox, parse_period
+
+# How long (in seconds) clients and proxies may cache map clusters
+# (over-ridden in settings.py)
+CLUSTER_CACHE_SECONDS = 60
+
+# Whether the template filter metrics can be read over HTTP (over-ridden in
+# settings.py)
+MICROFORMAT_METRICS_VIEW = False
+
+def _zoom(request):
+    return max(0, min(int(request.GET.get('zoom', 0)), clusters.MAX_ZOOM))
+
+def _clusters_last_modified(request):
+    try:
+        return clusters.last_modified(_zoom(request))
+    except ValueError:
+        return None
+
+def geo_clusters(request):
+    """
+    Returns the marker clusters inside a bounding box as a GeoJSON
+    FeatureCollection.
+
+    GET parameters:
+
+    bbox - west,south,east,north in degrees decimal
+    zoom - the map zoom level (0 - clusters.MAX_ZOOM)
+    type - (optional, may be repeated) the lower case name of a model to
+           include, e.g. hlisting
+
+    Each feature is a Point at the centroid of a cluster with count, model
+    and pk (of a representative row) properties.
+    """
+    try:
+        south, west, north, east = parse_bbox(request.GET.get('bbox',
+            '-180,-90,180,90'))
+        zoom = _zoom(request)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid bbox or zoom')
+    types = request.GET.getlist('type')
+    if [t for t in types if t.lower() not in clusters.MODELS]:
+        return HttpResponseBadRequest('Unknown type')
+    features = [{
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [c['longitude'], c['latitude']],
+            },
+        'properties': {
+            'count': c['count'],
+            'model': c['model'],
+            'pk': c['pk'],
+            },
+        } for c in clusters.clusters(south, west, north, east, zoom, types)]
+    return HttpResponse(simplejson.dumps({
+        'type': 'FeatureCollection',
+        'features': features,
+        }), mimetype='application/json')
+geo_clusters = require_GET(last_modified(_clusters_last_modified)(
+    cache_control(public=True, max_age=getattr(settings,
+        'CLUSTER_CACHE_SECONDS', CLUSTER_CACHE_SECONDS))(geo_clusters)))
+
+def geojson_export(request):
+    """
+    Streams the located rows as a GeoJSON FeatureCollection.
+
+    GET parameters:
+
+    bbox - (optional) west,south,east,north in degrees decimal
+    type - (optional, may be repeated) the lower case name of a model to
+           include, e.g. hcard
+    """
+    bbox = None
+    if 'bbox' in request.GET:
+        try:
+            bbox = parse_bbox(request.GET['bbox'])
+        except ValueError:
+            return HttpResponseBadRequest('Invalid bbox')
+    models = []
+    for name in request.GET.getlist('type'):
+        if name.lower() not in geojson.MODELS:
+            return HttpResponseBadRequest('Unknown type')
+        models.append(geojson.MODELS[name.lower()])
+    # The response is built from a generator so it is sent as it is produced
+    return HttpResponse(geojson.feature_collection(geojson.features(models,
+        bbox)), mimetype='application/json')
+geojson_export = require_GET(geojson_export)
+
+def hcard_freebusy(request, hcard_id):
+    """
+    Returns an iCalendar VFREEBUSY object for the hCard.
+
+    GET parameters:
+
+    start - (optional) the start of the period in UTC as YYYY-MM-DD or
+            YYYY-MM-DDTHH:MM:SS (defaults to now)
+    end   - (optional) the end of the period (defaults to four weeks after
+            start). The period can't be longer than
+            settings.MAX_FREEBUSY_PERIOD (a year by default)
+    """
+    card = get_object_or_404(hCard, pk=hcard_id)
+    try:
+        start, end = parse_period(request.GET.get('start'),
+                request.GET.get('end'), longest=freebusy.max_period())
+    except ValueError:
+        return HttpResponseBadRequest('Invalid start or end')
+    return HttpResponse(freebusy.freebusy_ical(card, start, end),
+            mimetype='text/calendar; charset=utf-8')
+hcard_freebusy = require_GET(hcard_freebusy)
+
+def hcalendar_ics(request, event_id):
+    """
+    Returns the hCalendar event (with its recurrence rule) as an iCalendar
+    VEVENT.
+    """
+    event = get_object_or_404(hCalendar, pk=event_id)
+    return HttpResponse(ical.vcalendar([ical.vevent(event)]),
+            mimetype='text/calendar; charset=utf-8')
+hcalendar_ics = require_GET(hcalendar_ics)
+
+def filter_metrics(request):
+    """
+    Returns the template filter metrics in the Prometheus text format. Only
+    answers when MICROFORMAT_METRICS_VIEW is True.
+    """
+    if not getattr(settings, 'MICROFORMAT_METRICS_VIEW',
+            MICROFORMAT_METRICS_VIEW):
+        raise Http404
+    return HttpResponse(metrics.prometheus_text(),
+            mimetype='text/plain; version=0.0.4; charset=utf-8')
+filter_metrics = require_GET(filter_metrics)
@@ -0,0 +1,224 @@
+# -*- coding: UTF-8 -*-
+"""
+An in-memory registry for the small, static vocabulary tables (adr_type,
+tel_type, email_type and xfn_values) that are loaded by the fixtures.
+
+Each table is read from the database once per process and then served from
+memory. The cached copy is thrown away whenever a row is saved or deleted
+(e.g. via the admin) and re-read the next time it is needed.
+
+Copyright (c) 2009 Nicholas H.Tollervey (http://ntoll.org/contact)
+
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in
+the documentation and/or other materials provided with the
+distribution.
+* Neither the name of ntoll.org nor the names of its
+contributors may be used to endorse or promote products
+derived from this software without specific prior written
+permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+from django import forms
+from django.db.models.signals import post_save, post_delete
+from django.utils.encoding import force_unicode
+
+from microformats.models import adr_type, tel_type, email_type, xfn_values
+
+class Vocabulary(object):
+    """
+    Serves the rows of a vocabulary model from memory.
+
+    field is the name of the model field holding the machine readable name of
+    the value (e.g. "work" or "friend").
+    """
+    def __init__(self, model, field='name'):
+        self.model = model
+        self.field = field
+        self._cache = None
+
+    def _load(self):
+        """
+        Returns the cached (items, by_id, by_name) tuple, reading the table if
+        needed. The whole tuple is replaced in one go so concurrent readers
+        never see a half-built cache.
+        """
+        cache = self._cache
+        if cache is None:
+            items = list(self.model.objects.all())
+            by_id = dict((x.pk, x) for x in items)
+            by_name = dict((getattr(x, self.field), x) for x in items)
+            cache = self._cache = (items, by_id, by_name)
+        return cache
+
+    def invalidate(self):
+        """
+        Forget the cached rows. They'll be re-read on next use.
+        """
+        self._cache = None
+
+    def all(self):
+        """
+        Returns a list of all the instances in the vocabulary.
+        """
+        return list(self._load()[0])
+
+    def choices(self):
+        """
+        Returns a list of (pk, label) tuples suitable for form choices.
+        """
+        return [(x.pk, force_unicode(x)) for x in self._load()[0]]
+
+    def get(self, pk):
+        """
+        Returns the instance with the referenced primary key (or None).
+        """
+        try:
+            return self._load()[1].get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_name(self, name):
+        """
+        Returns the instance with the referenced name (or None).
+        """
+        return self._load()[2].get(name)
+
+    def id_to_name(self):
+        """
+        Returns a dict mapping primary keys to names.
+        """
+        return dict((k, getattr(v, self.field)) for k, v in
+                self._load()[1].iteritems())
+
+    def name_to_id(self):
+        """
+        Returns a dict mapping names to primary keys.
+        """
+        return dict((k, v.pk) for k, v in self._load()[2].iteritems())
+
+    def instances(self, names):
+        """
+        Returns the instances for a list of names. Raises KeyError for a name
+        that isn't in the vocabulary.
+        """
+        by_name = self._load()[2]
+        return [by_name[name] for name in names]
+
+    def assign(self, manager, names):
+        """
+        Sets the many-to-many relationship represented by manager (e.g.
+        tel_instance.types) to the values referenced by names without looking
+        up the vocabulary table.
+        """
+        manager.clear()
+        objs = self.instances(names)
+        if objs:
+            manager.add(*objs)
+
+    def add(self, manager, names):
+        """
+        Adds the values referenced by names to the many-to-many relationship
+        represented by manager.
+        """
+        objs = self.instances(names)
+        if objs:
+            manager.add(*objs)
+
+adr_types = Vocabulary(adr_type)
+tel_types = Vocabulary(tel_type)
+email_types = Vocabulary(email_type)
+xfn_relationships = Vocabulary(xfn_values, field='value')
+
+REGISTRY = {
+        adr_type: adr_types,
+        tel_type: tel_types,
+        email_type: email_types,
+        xfn_values: xfn_relationships,
+        }
+
+def invalidate_vocabulary(sender, **kwargs):
+    """
+    Signal handler that throws away the cache for the sender's vocabulary.
+    """
+    REGISTRY[sender].invalidate()
+
+for model in REGISTRY:
+    post_save.connect(invalidate_vocabulary, sender=model)
+    post_delete.connect(invalidate_vocabulary, sender=model)
+
+#############
+# Form field
+#############
+
+class VocabularyChoiceIterator(object):
+    """
+    Lazily yields the choices of a vocabulary so a widget always renders the
+    current values without touching the database.
+    """
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+
+    def __iter__(self):
+        return iter(self.vocabulary.choices())
+
+    def __len__(self):
+        return len(self.vocabulary.choices())
+
+    def __deepcopy__(self, memo):
+        # Form fields are deep-copied for every form instance. There's no
+        # need to copy the (shared) vocabulary.
+        return self
+
+class VocabularyMultipleChoiceField(forms.MultipleChoiceField):
+    """
+    A drop-in replacement for a ModelMultipleChoiceField over one of the
+    vocabulary tables. Both rendering and validation are done from memory and
+    the cleaned value is a list of model instances.
+    """
+    def __init__(self, vocabulary, *args, **kwargs):
+        self.vocabulary = vocabulary
+        super(VocabularyMultipleChoiceField, self).__init__(*args, **kwargs)
+        self._choices = self.widget.choices = VocabularyChoiceIterator(
+                vocabulary)
+
+    def _get_queryset(self):
+        return self.vocabulary.model.objects.all()
+    queryset = property(_get_queryset)
+
+    def clean(self, value):
+        if self.required and not value:
+            raise forms.ValidationError(self.error_messages['required'])
+        elif not self.required and not value:
+            return []
+        if not isinstance(value, (list, tuple)):
+            raise forms.ValidationError(self.error_messages['invalid_list'])
+        result = []
+        for val in value:
+            obj = self.vocabulary.get(val)
+            if obj is None:
+                raise forms.ValidationError(
+                        self.error_messages['invalid_choice'] % {'value': val})
+            result.append(obj)
+        return result